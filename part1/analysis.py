@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+import os
+import sys
+import glob
+import argparse
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')   # Plots go to files; no display on the Mininet VM
+import matplotlib.pyplot as plt
+
+from results import T90, Z90
+
+# Everything here works on whole columns: loading, grouping and the statistics
+# are NumPy operations over all trials (or trace samples) at once, so the cost
+# stays flat in Python however many trials a sweep collects.
+
+MISSING = ('', 'None', 'nan')
+T90_TABLE = np.array(T90[1:])
+
+# Part 2 topology: client 1's path is 5 + 10 + 5 ms one way; client 2 has its
+# own access delay plus the bottleneck (10 ms) and server link (5 ms)
+SHARED_ONE_WAY_MS = 15
+
+# Part 2 experiments: x column, axis label, and line or bar chart
+P2_EXPERIMENTS = {
+    'fixed_bandwidth': ('bw', 'Link capacity (Mbps)', 'line'),
+    'varying_loss': ('loss', 'Loss rate (%)', 'line'),
+    'asymmetric_flows': ('rtt2_ms', 'Client 2 RTT (ms)', 'line'),
+    'background_udp': ('udp_off_mean', 'Mean UDP OFF period (s)', 'bar'),
+    'striped_flows': ('streams', 'Client 1 parallel flows', 'bar'),
+    'ecn_marking': ('aqm', 'Bottleneck queue', 'bar'),
+}
+P2_METRICS = (('link_util', 'Link utilization'), ('jfi', 'JFI'))
+
+# Part 1 experiments: the swept column and its label
+P1_EXPERIMENTS = {
+    'loss': ('loss', 'Loss rate (%)'),
+    'jitter': ('jitter', 'Jitter (ms)'),
+}
+
+def load_csv(path):
+    """Columns of a result (or trace) CSV: name -> array, float where the
+    column is numeric (None becomes NaN), str otherwise"""
+    with open(path) as f:
+        names = [name.strip() for name in f.readline().split(',')]
+    cells = np.loadtxt(path, delimiter=',', skiprows=1, dtype=str, ndmin=2)
+    if cells.size == 0:
+        return {name: np.empty(0) for name in names}
+    table = {}
+    for j, name in enumerate(names):
+        column = np.char.strip(cells[:, j])
+        try:
+            table[name] = np.where(np.isin(column, MISSING), 'nan', column).astype(float)
+        except ValueError:
+            table[name] = column
+    return table
+
+def t90(df):
+    """Two-sided 90% Student t critical value for each degrees-of-freedom entry"""
+    df = np.asarray(df)
+    index = np.clip(df, 1, len(T90_TABLE)).astype(int) - 1
+    return np.where(df > len(T90_TABLE), Z90, T90_TABLE[index])
+
+def group_stats(keys, values):
+    """Mean, 90% CI half-width and sample count of values per distinct key
+    (NaNs left out); returns (keys, mean, half-width, n) sorted by key.
+    Half-widths need two samples and are NaN below that."""
+    groups, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    ok = ~np.isnan(values)
+    n = np.bincount(inverse, weights=ok, minlength=len(groups))
+    total = np.bincount(inverse, weights=np.where(ok, values, 0.0), minlength=len(groups))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / n
+        dev = np.where(ok, values - mean[inverse], 0.0)
+        var = np.bincount(inverse, weights=dev ** 2, minlength=len(groups)) / (n - 1)
+        half = np.where(n > 1, t90(n - 1) * np.sqrt(var) / np.sqrt(n), np.nan)
+    return groups, mean, half, n.astype(int)
+
+def jain_fairness(allocations):
+    """JFI of each row of a (trials, flows) array"""
+    allocations = np.asarray(allocations, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return allocations.sum(axis=1) ** 2 / (allocations.shape[1] * (allocations ** 2).sum(axis=1))
+
+def p2_metrics(table):
+    """Per-trial link utilization and JFI from the observed throughputs, plus
+    client 2's RTT"""
+    thr = np.column_stack([table['thr1_mbps'], table['thr2_mbps']])
+    table['link_util'] = thr.sum(axis=1) / table['bw']
+    table['jfi'] = jain_fairness(thr)
+    table['rtt2_ms'] = 2 * (table['delay_c2_ms'] + SHARED_ONE_WAY_MS)
+    return table
+
+# --- Switch statistics ---
+
+def switch_utilization(stats, dpid, port, bw):
+    """Utilization timeseries of one switch port from the controller's
+    statistics (see switch.py) as load_csv reads them; returns (sample times,
+    utilization of bw Mbps)"""
+    key = stats['key']
+    # Without flow rows (MAC keys) the key column loads as numbers
+    mask = (stats['kind'] == 'port') & (stats['dpid'] == dpid) & \
+           (key == (port if np.issubdtype(key.dtype, np.number) else str(port)))
+    t, tx = stats['time'][mask], stats['bytes'][mask]
+    order = np.argsort(t)
+    t, tx = t[order], tx[order]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return t[1:], np.diff(tx) * 8 / (np.diff(t) * bw * 1e6)
+
+# --- Reports ---
+
+def summary_lines(x_name, groups, stats):
+    """CSV-style summary: x, n, then mean and CI half-width per metric"""
+    header = [x_name, 'n'] + [f"{name}{suffix}" for name, _ in stats for suffix in ('', '_ci90')]
+    lines = [','.join(header)]
+    n = stats[0][1][3]
+    for i, x in enumerate(groups):
+        cells = [f"{x:g}" if isinstance(x, (float, np.floating)) else str(x), str(n[i])]
+        for _, (_, mean, half, _) in stats:
+            cells += [f"{mean[i]:.4g}", f"{half[i]:.2g}"]
+        lines.append(','.join(cells))
+    return lines
+
+def plot(path, x, x_label, series, kind='line', title=None):
+    """series: [(label, mean, half-width)], all on one y-axis, with 90% CIs"""
+    fig, ax = plt.subplots(figsize=(6, 4))
+    numeric = np.issubdtype(np.asarray(x).dtype, np.number)
+    if kind == 'bar' or not numeric:
+        positions = np.arange(len(x))
+        width = 0.8 / len(series)
+        for k, (label, mean, half) in enumerate(series):
+            ax.bar(positions + (k - (len(series) - 1) / 2) * width, mean, width,
+                   yerr=np.nan_to_num(half), capsize=4, label=label)
+        ax.set_xticks(positions)
+        ax.set_xticklabels([f"{v:g}" if numeric else str(v) for v in x])
+    else:
+        for label, mean, half in series:
+            ax.errorbar(x, mean, yerr=np.nan_to_num(half), marker='o', capsize=4, label=label)
+    ax.set_xlabel(x_label, fontsize=11)
+    if len(series) == 1:
+        ax.set_ylabel(series[0][0], fontsize=11)
+    else:
+        ax.legend(fontsize=10)
+    if title:
+        ax.set_title(title, fontsize=12)
+    ax.grid(alpha=0.3)
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+
+def plot_timeseries(path, series, y_label, title=None):
+    """series: [(label, times, values)], one line each"""
+    fig, ax = plt.subplots(figsize=(8, 4))
+    for label, t, values in series:
+        ax.plot(t, values, label=label, linewidth=1)
+    ax.set_xlabel('Time (s)', fontsize=11)
+    ax.set_ylabel(y_label, fontsize=11)
+    if len(series) > 1:
+        ax.legend(fontsize=9)
+    if title:
+        ax.set_title(title, fontsize=12)
+    ax.grid(alpha=0.3)
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+
+def analyze_p1(path, out_dir):
+    expname = os.path.basename(path)[len('reliability_'):-len('.csv')]
+    if expname not in P1_EXPERIMENTS:
+        return []
+    x_name, x_label = P1_EXPERIMENTS[expname]
+    table = load_csv(path)
+    stats = [('ttc', group_stats(table[x_name], table['ttc']))]
+    groups, mean, half, _ = stats[0][1]
+    plot(os.path.join(out_dir, f"p1_{expname}.png"), groups, x_label,
+         [('Download time (s)', mean, half)], title=f"Part 1: {expname}")
+    return [f"# {expname} experiment ({os.path.basename(path)})"] + summary_lines(x_name, groups, stats)
+
+def analyze_p2(path, out_dir):
+    expname = os.path.basename(path)[len('p2_fairness_'):-len('.csv')]
+    if expname not in P2_EXPERIMENTS:
+        return []
+    x_name, x_label, kind = P2_EXPERIMENTS[expname]
+    table = p2_metrics(load_csv(path))
+    stats = [(name, group_stats(table[x_name], table[name])) for name, _ in P2_METRICS]
+    groups = stats[0][1][0]
+    plot(os.path.join(out_dir, f"p2_{expname}.png"), groups, x_label,
+         [(label, s[1], s[2]) for (_, label), (_, s) in zip(P2_METRICS, stats)],
+         kind=kind, title=f"Part 2: {expname.replace('_', ' ')}")
+    return [f"### {expname} ({os.path.basename(path)})"] + summary_lines(x_name, groups, stats)
+
+def analyze_switch_stats(path, out_dir, bw):
+    """Utilization of every switch port the controller sampled (p2_exp.py keeps
+    the last trial's timeseries), plotted over time and summarized"""
+    stats = load_csv(path)
+    ports = stats['kind'] == 'port'
+    if not ports.any():
+        return []
+    series, lines = [], ['dpid,port,samples,mean_util,peak_util']
+    for dpid, port in sorted(set(zip(stats['dpid'][ports], stats['key'][ports]))):
+        t, util = switch_utilization(stats, dpid, port, bw)
+        if util.size == 0:
+            continue
+        name = port if isinstance(port, str) else f"{port:g}"
+        series.append((f"dpid {dpid:g} port {name}", t - stats['time'].min(), util))
+        lines.append(f"{dpid:g},{name},{util.size},{np.nanmean(util):.4g},{np.nanmax(util):.4g}")
+    if not series:
+        return []
+    plot_timeseries(os.path.join(out_dir, 'switch_utilization.png'), series,
+                    f'Utilization of {bw:g} Mbps', title='Switch port utilization')
+    return [f"### switch ports ({os.path.basename(path)})"] + lines
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Summaries with 90% CIs and plots from experiment CSVs")
+    parser.add_argument('files', nargs='*',
+                        help="reliability_*.csv / p2_fairness_*.csv (default: all in part1/ and part2/)")
+    parser.add_argument('--out', default='plots', help="directory for the plots")
+    parser.add_argument('--switch-stats', metavar='CSV',
+                        help="also plot port utilization from the controller's statistics (see switch.py)")
+    parser.add_argument('--bw', type=float, default=100.0,
+                        help="link capacity (Mbps) the switch port utilization is relative to")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(here, 'reliability_*.csv')) +
+                                 glob.glob(os.path.join(here, os.pardir, 'part2', 'p2_fairness_*.csv')))
+    if not files and not args.switch_stats:
+        print("No result files found")
+        sys.exit(1)
+    os.makedirs(args.out, exist_ok=True)
+
+    for path in files:
+        name = os.path.basename(path)
+        if name.startswith('reliability_'):
+            lines = analyze_p1(path, args.out)
+        elif name.startswith('p2_fairness_'):
+            lines = analyze_p2(path, args.out)
+        else:
+            lines = []
+        if lines:
+            print('\n'.join(lines) + '\n')
+        else:
+            print(f"Skipping {path}: not a known experiment\n")
+    if args.switch_stats:
+        lines = analyze_switch_stats(args.switch_stats, args.out, args.bw)
+        print('\n'.join(lines) + '\n' if lines else f"No port samples in {args.switch_stats}\n")
+    print(f"Plots written to {args.out}/")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+import socket
+import struct
+
+# Linux UDP offload socket options (include/uapi/linux/udp.h)
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)
+UDP_GRO = getattr(socket, 'UDP_GRO', 104)
+
+MAX_GSO_SEGMENTS = 64     # UDP_MAX_SEGMENTS in the kernel
+MAX_UDP_PAYLOAD = 65507   # One GSO super-datagram must fit in a single UDP datagram
+GRO_BUFFER_SIZE = 65535
+
+# ECN (RFC 3168): the low two bits of the IP TOS byte
+IP_RECVTOS = getattr(socket, 'IP_RECVTOS', 13)
+ECN_MASK = 0x03
+ECN_ECT0 = 0x02   # ECN-capable transport
+ECN_CE = 0x03     # Congestion experienced, set by an ECN-marking router
+TOS_CMSG_SPACE = socket.CMSG_SPACE(4)
+
+# Receive buffer: SO_RCVBUFFORCE (root) is not capped at net.core.rmem_max.
+# SO_MEMINFO reports the socket's memory use, receive queue first (Linux 4.6+).
+SO_RCVBUFFORCE = getattr(socket, 'SO_RCVBUFFORCE', 33)
+SO_MEMINFO = getattr(socket, 'SO_MEMINFO', 55)
+SK_MEMINFO_VARS = 9
+
+class PacketIO:
+    """Per-packet I/O: one sendto/recvfrom syscall per datagram"""
+    def __init__(self, sock):
+        self.sock = sock
+
+        # Statistics: datagrams moved vs syscalls spent moving them
+        self.packets_sent = 0
+        self.send_calls = 0
+        self.packets_received = 0
+        self.recv_calls = 0
+
+        # TOS byte of the last datagram received, once enable_recv_tos() succeeds
+        self.recv_tos = False
+        self.tos = 0
+
+    def enable_recv_tos(self):
+        """Have the kernel report each datagram's TOS byte (and so its ECN bits)"""
+        try:
+            self.sock.setsockopt(socket.IPPROTO_IP, IP_RECVTOS, 1)
+            self.recv_tos = True
+        except OSError:
+            self.recv_tos = False
+        return self.recv_tos
+
+    def unread(self):
+        """Kernel memory (bytes) the datagrams queued but not yet read take up;
+        0 if the kernel does not say"""
+        try:
+            meminfo = self.sock.getsockopt(socket.SOL_SOCKET, SO_MEMINFO, 4 * SK_MEMINFO_VARS)
+        except OSError:
+            return 0
+        return struct.unpack_from('I', meminfo)[0]
+
+    def read_tos(self, ancdata):
+        for level, ctype, cdata in ancdata:
+            if level == socket.IPPROTO_IP and ctype == socket.IP_TOS and cdata:
+                self.tos = cdata[0]
+
+    def send(self, packet, addr):
+        """Send a single datagram"""
+        self.sock.sendto(packet, addr)
+        self.packets_sent += 1
+        self.send_calls += 1
+
+    def send_run(self, packets, addr):
+        """Send a run of datagrams in order"""
+        for packet in packets:
+            self.send(packet, addr)
+
+    def recv(self, bufsize):
+        """Receive datagrams; returns (list of packets, sender address)"""
+        if self.recv_tos:
+            packet, ancdata, _, addr = self.sock.recvmsg(bufsize, TOS_CMSG_SPACE)
+            self.read_tos(ancdata)
+        else:
+            packet, addr = self.sock.recvfrom(bufsize)
+        self.packets_received += 1
+        self.recv_calls += 1
+        return [packet], addr
+
+    def recv_into(self, buffers):
+        """Scatter one datagram into the given buffers; returns (bytes read, sender address)"""
+        nbytes, ancdata, _, addr = self.sock.recvmsg_into(buffers, TOS_CMSG_SPACE if self.recv_tos else 0)
+        if self.recv_tos:
+            self.read_tos(ancdata)
+        self.packets_received += 1
+        self.recv_calls += 1
+        return nbytes, addr
+
+    def stats(self):
+        return (f"sent {self.packets_sent} packets in {self.send_calls} syscalls, "
+                f"received {self.packets_received} packets in {self.recv_calls} syscalls")
+
+class BatchIO(PacketIO):
+    """Batched I/O using Linux UDP GSO (UDP_SEGMENT) and GRO (UDP_GRO).
+
+    send_run() hands the kernel up to 64 equal-sized consecutive datagrams in
+    one sendmsg and lets it segment them; recv() reads a GRO-coalesced buffer
+    and splits it at the segment size the kernel reports in a control message.
+    Either half falls back to per-packet I/O when the kernel refuses it.
+    """
+    def __init__(self, sock):
+        super().__init__(sock)
+
+        # GSO is available if the kernel knows the option (Linux >= 4.18)
+        try:
+            sock.getsockopt(SOL_UDP, UDP_SEGMENT)
+            self.gso = True
+        except OSError:
+            self.gso = False
+
+        # GRO must be switched on per socket (Linux >= 5.0)
+        try:
+            sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+            self.gro = True
+        except OSError:
+            self.gro = False
+
+    def send_run(self, packets, addr):
+        """Send a run of datagrams, coalescing equal-sized neighbours into GSO batches"""
+        i = 0
+        while i < len(packets):
+            seg_size = len(packets[i])
+            j = i + 1
+            total = seg_size
+            # All segments but the last must be seg_size; the last may be shorter
+            while j < len(packets) and j - i < MAX_GSO_SEGMENTS and \
+                  len(packets[j]) <= seg_size and total + len(packets[j]) <= MAX_UDP_PAYLOAD:
+                total += len(packets[j])
+                j += 1
+                if len(packets[j - 1]) < seg_size:
+                    break
+
+            if self.gso and j - i > 1:
+                try:
+                    self.sock.sendmsg([b''.join(packets[i:j])],
+                                      [(SOL_UDP, UDP_SEGMENT, struct.pack('=H', seg_size))],
+                                      0, addr)
+                    self.packets_sent += j - i
+                    self.send_calls += 1
+                    i = j
+                    continue
+                except OSError as e:
+                    # e.g. EIO when the device cannot checksum-offload; stay per-packet from now on
+                    print(f"UDP GSO send failed ({e}), falling back to per-packet sends")
+                    self.gso = False
+
+            for packet in packets[i:j]:
+                self.send(packet, addr)
+            i = j
+
+    def recv(self, bufsize):
+        """Receive one (possibly GRO-coalesced) buffer and split it into datagrams"""
+        if not self.gro:
+            return super().recv(bufsize)
+
+        data, ancdata, _, addr = self.sock.recvmsg(GRO_BUFFER_SIZE, socket.CMSG_SPACE(4) + TOS_CMSG_SPACE)
+        self.recv_calls += 1
+        # GRO only coalesces datagrams with the same TOS, so one byte covers them all
+        if self.recv_tos:
+            self.read_tos(ancdata)
+
+        seg_size = 0
+        for level, ctype, cdata in ancdata:
+            if level == SOL_UDP and ctype == UDP_GRO:
+                seg_size = struct.unpack('=i', cdata[:4])[0]
+
+        if seg_size <= 0 or seg_size >= len(data):
+            self.packets_received += 1
+            return [data], addr
+
+        packets = [data[k:k + seg_size] for k in range(0, len(data), seg_size)]
+        self.packets_received += len(packets)
+        return packets, addr
+
+def make_io(sock, batched=False):
+    """Pick the I/O backend for a socket"""
+    return BatchIO(sock) if batched else PacketIO(sock)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import zlib
+import heapq
+import random
+import struct
+import atexit
+import argparse
+import threading
+from array import array
+
+# Synthetic network impairments: a fate (lost, or delivered after some delay)
+# for each datagram entering a link direction, drawn from the netem model
+# (loss, delay, jitter) and kept per direction in the order the datagrams
+# arrive. Replaying a trace gives the Nth datagram of a later run the Nth
+# fate, so two versions of the protocol can be compared on the same draws
+# instead of on fresh random ones.
+#
+# Directions are named after what crosses them: 'data' (server to client) and
+# 'ack' (client to server). The simulator records the draws of its emulated
+# links (see simulator.py), and make_trace draws a trace without a run.
+#
+# This is synthetic replay only. Nothing captures the fates a real netem qdisc
+# gave a run's datagrams. On Mininet, p1_exp.py replays traces through
+# ImpairedIO: p1_server.py on everything it sends (striped flows included),
+# and p1_client.py on its ACKs, for a single flow only. The Part 2 server and
+# striped (multi-flow) clients do not replay traces.
+
+TRACE_MAGIC = b'IMPT'
+TRACE_VERSION = 1
+# File header: magic, version, number of directions. Each direction follows as
+# its name, model (loss %, delay and jitter in seconds), seed, packet count and
+# the length of its fates: zlib-compressed little-endian uint32 microseconds
+TRACE_HEADER = struct.Struct('<4sHH')
+DIRECTION_HEADER = struct.Struct('<16sdddqII')
+DROPPED = 0xFFFFFFFF   # Fate of a lost datagram
+
+# Recordings are padded with further draws to at least this many fates per
+# direction, so a later version that sends more than the recorded run still
+# replays recorded fates (a 5 MB transfer is about 4,500 segments)
+TRACE_PACKETS = 32768
+
+DRAIN_TIMEOUT = 5.0   # Seconds ImpairedIO waits at exit for datagrams still delayed
+
+class Impairment:
+    """Fate of each datagram entering one direction of a link, as netem
+    decides it: lost with probability loss (%), otherwise held for delay plus
+    uniform jitter (seconds, never below zero), to the microsecond. Fates are
+    drawn from rng, and appended to fates when recording; with replay=True
+    they are read back from fates in order, wrapping around if the run
+    outlasts the recording."""
+    def __init__(self, loss=0.0, delay=0.0, jitter=0.0, rng=None, seed=0, fates=None, replay=False):
+        if replay and not fates:
+            raise ValueError("nothing to replay: the trace direction is empty")
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.rng = rng or random.Random(seed)
+        self.seed = seed
+        self.fates = fates   # array('I') of microseconds or DROPPED; None: not recorded
+        self.replay = replay
+        self.next = 0
+        self.lock = threading.Lock()   # Striped flows share one impairment
+
+        # Statistics
+        self.packets = 0
+        self.lost = 0
+        self.wrapped = 0   # Times a replay ran out of recorded fates and started over
+
+    def draw(self):
+        if self.loss and self.rng.random() < self.loss / 100:
+            return DROPPED
+        delay = self.delay
+        if self.jitter:
+            delay = max(0.0, delay + self.rng.uniform(-self.jitter, self.jitter))
+        return min(round(delay * 1e6), DROPPED - 1)
+
+    def fate(self):
+        """Delay in seconds for the next datagram, or None if it is lost"""
+        with self.lock:
+            us = self.next_fate()
+        if us == DROPPED:
+            return None
+        return us / 1e6
+
+    def next_fate(self):
+        if self.replay:
+            if self.next == len(self.fates):
+                self.next = 0
+                self.wrapped += 1
+            us = self.fates[self.next]
+            self.next += 1
+        else:
+            us = self.draw()
+            if self.fates is not None:
+                self.fates.append(us)
+        self.packets += 1
+        if us == DROPPED:
+            self.lost += 1
+        return us
+
+    def extend(self, count):
+        """Record further draws until there are at least count fates"""
+        while len(self.fates) < count:
+            self.fates.append(self.draw())
+
+    def stats(self):
+        source = f"replayed ({self.wrapped} wraparounds)" if self.replay else "drawn"
+        return f"{self.packets} datagrams, {self.lost} lost, {source}"
+
+class ImpairmentTrace:
+    """The impairments of a run's link directions, by name, saved to and
+    loaded from a compact binary file (see TRACE_HEADER)"""
+    def __init__(self):
+        self.directions = {}   # name -> Impairment
+
+    @classmethod
+    def load(cls, path):
+        trace = cls()
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, count = TRACE_HEADER.unpack_from(data)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            raise ValueError(f"{path} is not an impairment trace (version {TRACE_VERSION})")
+        offset = TRACE_HEADER.size
+        for _ in range(count):
+            name, loss, delay, jitter, seed, packets, length = DIRECTION_HEADER.unpack_from(data, offset)
+            offset += DIRECTION_HEADER.size
+            fates = array('I', zlib.decompress(data[offset:offset + length]))
+            offset += length
+            if sys.byteorder == 'big':
+                fates.byteswap()
+            if len(fates) != packets:
+                raise ValueError(f"{path}: direction {name!r} is truncated")
+            trace.directions[name.rstrip(b'\x00').decode()] = Impairment(loss, delay, jitter, seed=seed,
+                                                                          fates=fates, replay=True)
+        return trace
+
+    def impairment(self, name, loss=0.0, delay=0.0, jitter=0.0, rng=None, seed=0):
+        """The direction's impairment: replayed if the trace holds it,
+        otherwise a new recording of the given model"""
+        if name not in self.directions:
+            self.directions[name] = Impairment(loss, delay, jitter, rng, seed, fates=array('I'))
+        return self.directions[name]
+
+    def replayer(self, name):
+        """Replay of a direction the trace holds"""
+        if name not in self.directions or not self.directions[name].replay:
+            raise ValueError(f"the trace has no recorded '{name}' direction")
+        return self.directions[name]
+
+    @property
+    def recording(self):
+        return any(not impairment.replay for impairment in self.directions.values())
+
+    def save(self, path, min_packets=TRACE_PACKETS):
+        """Write the trace; recorded directions are first padded to min_packets"""
+        parts = [TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, len(self.directions))]
+        for name, impairment in self.directions.items():
+            if not impairment.replay:
+                impairment.extend(min_packets)
+            fates = array('I', impairment.fates)
+            if sys.byteorder == 'big':
+                fates.byteswap()
+            data = zlib.compress(fates.tobytes(), 9)
+            parts.append(DIRECTION_HEADER.pack(name.encode(), impairment.loss, impairment.delay,
+                                               impairment.jitter, impairment.seed, len(fates), len(data)))
+            parts.append(data)
+        # Write then rename, so an interrupted save never leaves half a trace to replay
+        with open(path + '.tmp', 'wb') as f:
+            f.write(b''.join(parts))
+        os.replace(path + '.tmp', path)
+
+def trace_path(directory, index, **params):
+    """Where the trace of one trial lives: named after its parameters and
+    index, the simulator's seed or p1_exp.py's iteration, so both tools
+    replay each other's traces"""
+    name = '_'.join(f"{key}{value:g}" for key, value in params.items())
+    return os.path.join(directory, f"{name}_{index}.imp")
+
+def make_trace(path, loss=0.0, delay=0.0, jitter=0.0, seed=0, packets=TRACE_PACKETS):
+    """Synthesize a trace of Part 1's impaired link (the same netem parameters
+    on both directions) by drawing each direction's fates from the model,
+    without running a transfer. The fates do not depend on what the protocol
+    sends, so this matches what the simulator records; it is not a capture of
+    what netem did on a real link."""
+    trace = ImpairmentTrace()
+    for k, name in enumerate(('data', 'ack')):
+        trace.impairment(name, loss, delay, jitter, random.Random(seed * 2 + k), seed)
+    trace.save(path, packets)
+    return trace
+
+class ImpairedIO:
+    """Socket I/O backend wrapper that applies an impairment to what it sends:
+    lost datagrams are never sent, delayed ones wait on a delay line that a
+    background thread empties as they come due. Receiving is untouched, and
+    everything else is the wrapped backend's."""
+    def __init__(self, io, impairment):
+        self.io = io
+        self.impairment = impairment
+        self.line = []   # Heap of (due, order, packet, addr)
+        self.order = 0
+        self.pending = 0   # Delayed datagrams not sent yet, the one being sent included
+        self.cond = threading.Condition()
+        self.send_lock = threading.Lock()   # The wrapped backend is not thread-safe
+        threading.Thread(target=self.release, daemon=True).start()
+        # Datagrams still on the delay line at exit were on the wire: let them arrive
+        atexit.register(self.drain)
+
+    def __getattr__(self, name):
+        return getattr(self.io, name)
+
+    def send(self, packet, addr):
+        self.send_run([packet], addr)
+
+    def send_run(self, packets, addr):
+        now_run = []
+        with self.cond:
+            now = time.monotonic()
+            for packet in packets:
+                delay = self.impairment.fate()
+                if delay is None:
+                    continue
+                if delay <= 0:
+                    now_run.append(packet)
+                    continue
+                # Senders may reuse their buffers once the call returns
+                self.order += 1
+                self.pending += 1
+                heapq.heappush(self.line, (now + delay, self.order, bytes(packet), addr))
+            self.cond.notify()
+        if now_run:
+            with self.send_lock:
+                self.io.send_run(now_run, addr)
+
+    def release(self):
+        while True:
+            with self.cond:
+                while not self.line or self.line[0][0] > time.monotonic():
+                    self.cond.wait(self.line[0][0] - time.monotonic() if self.line else None)
+                _, _, packet, addr = heapq.heappop(self.line)
+            try:
+                with self.send_lock:
+                    self.io.send(packet, addr)
+            except OSError:
+                pass   # Lost like any datagram the socket refuses, e.g. once it is closed
+            with self.cond:
+                self.pending -= 1
+                self.cond.notify_all()
+
+    def drain(self, timeout=DRAIN_TIMEOUT):
+        with self.cond:
+            self.cond.wait_for(lambda: self.pending == 0, timeout)
+
+    def stats(self):
+        return f"{self.io.stats()}; impairment: {self.impairment.stats()}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Make or inspect network impairment traces")
+    parser.add_argument('command', choices=('make', 'show'),
+                        help="make: synthesize a trace from Part 1's link model; show: summarize a trace")
+    parser.add_argument('path')
+    parser.add_argument('--loss', type=float, default=0.0, help="loss rate in %% (default 0)")
+    parser.add_argument('--delay', type=float, default=0.0, help="delay in ms (default 0)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="jitter in ms (default 0)")
+    parser.add_argument('--packets', type=int, default=TRACE_PACKETS,
+                        help=f"fates per direction (default {TRACE_PACKETS})")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'make':
+        make_trace(args.path, args.loss, args.delay / 1000, args.jitter / 1000, args.seed, args.packets)
+    trace = ImpairmentTrace.load(args.path)
+    print(f"{args.path}: {os.path.getsize(args.path)} bytes")
+    for name, impairment in trace.directions.items():
+        fates = impairment.fates
+        delays = [us for us in fates if us != DROPPED]
+        lost = len(fates) - len(delays)
+        print(f"{name}: {len(fates)} datagrams, {lost} lost ({lost * 100 / len(fates):.2f}%), "
+              f"delay {min(delays, default=0) / 1e3:.3f}-{max(delays, default=0) / 1e3:.3f} ms, "
+              f"mean {sum(delays) / max(len(delays), 1) / 1e3:.3f} ms; model loss {impairment.loss:g}%, "
+              f"delay {impairment.delay * 1e3:g} ms, jitter {impairment.jitter * 1e3:g} ms, seed {impairment.seed}")
+
+if __name__ == '__main__':
+    main()
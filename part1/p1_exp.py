@@ -11,6 +11,23 @@ import time, re, os
 import sys
 import hashlib
 
+from results import ResultStore
+from impairment import make_trace, trace_path
+from topology import write_switch_topology, reshape_network
+
+# Completed trials (see results.py); the CSVs are exported from it
+RESULTS_FILE = os.environ.get('RESULTS_FILE', 'p1_results.jsonl')
+RESULT_COLUMNS = ['iteration', 'loss', 'delay', 'jitter', 'md5_hash', 'ttc']
+# Each grid point is sampled until the confidence interval of its TTC converges
+RESULT_METRICS = ('ttc',)
+
+# Synthetic impairment replay (see impairment.py): with a directory set, netem
+# on the h1 link stays clean and the server and the single-flow client replay
+# the trial's trace instead. The trace is drawn from the netem model on first
+# use, not captured from netem, so every code version sees the same drawn
+# losses and delays at each grid point and iteration
+IMPAIRMENT_TRACES = os.environ.get('IMPAIRMENT_TRACES')
+
 class CustomTopo(Topo):
     def build(self, loss, delay, jitter):
         # Add two hosts
@@ -41,7 +58,19 @@ def compute_md5(file_path):
         return None
 
 
-def run(expname):
+def read_md5(file_path):
+    # The client streams the digest while receiving and leaves it in <file>.md5;
+    # only re-hash the file when that sidecar is missing (incomplete transfer)
+    try:
+        with open(file_path + '.md5') as f:
+            digest = f.read().strip()
+        print(digest)
+        return digest
+    except FileNotFoundError:
+        return compute_md5(file_path)
+
+
+def run(expname, export_only=False):
     # Set the log level to info to see detailed output
     setLogLevel('info')
     
@@ -49,18 +78,13 @@ def run(expname):
     controller_ip = '127.0.0.1' 
     controller_port = 6653     
     
-    # Output file
+    # Output file, exported from the result store
     output_file = f'reliability_{expname}.csv'
-    f_out = open(output_file, 'w')
-    f_out.write("iteration,loss,delay,jitter,md5_hash,ttc\n")
 
 
     SERVER_IP = "10.0.0.1"
     SERVER_PORT = 6555
-    # [FIX]: Use a large window to send more data at a time
-    SWS = 400 * 1180
             
-    NUM_ITERATIONS = 5 
     OUTFILE = 'received_data.txt'
     delay_list, loss_list, jitter_list = [], [], []
 
@@ -74,60 +98,99 @@ def run(expname):
         jitter_list = [20, 40, 60, 80, 100]
     else:
         print("Unknown experiment name. Use 'loss' or 'jitter'.")
-        f_out.close()
         return
 
-    print("Loss list:", loss_list, "Delay list:", delay_list, "Jitter list:", jitter_list)
-    
-    for LOSS in loss_list:
-        for DELAY in delay_list:
-            for JITTER in jitter_list:
-                for i in range(0, NUM_ITERATIONS):
-                    print(f"\n--- Running topology with {LOSS}% packet loss, base delay {DELAY}ms and jitter {JITTER}ms (iter {i+1}/{NUM_ITERATIONS})")
-
-                    # Create the custom topology with the specified loss, delay and jitter
-                    topo = CustomTopo(loss=LOSS, delay=DELAY, jitter=JITTER)
+    if IMPAIRMENT_TRACES:
+        os.makedirs(IMPAIRMENT_TRACES, exist_ok=True)
+        print(f"Replaying synthetic impairment traces from {IMPAIRMENT_TRACES}/ instead of netem")
 
-                    # Initialize the network with the custom topology and TCLink for link configuration
-                    net = Mininet(topo=topo, link=TCLink, controller=None)
-                    # Add the remote controller to the network
-                    remote_controller = RemoteController('c0', ip=controller_ip, port=controller_port)
-                    net.addController(remote_controller)
+    # Trials already in the store are skipped, so an interrupted sweep resumes
+    store = ResultStore(RESULTS_FILE, expname)
+    print(f"{len(store.rows)} completed trials of {expname} in {RESULTS_FILE} (revision {store.revision})")
+    if export_only:
+        loss_list = []
 
-                    # Start the network
-                    net.start()
-
-                    # Get references to h1 and h2
-                    h1 = net.get('h1')
-                    h2 = net.get('h2')
+    print("Loss list:", loss_list, "Delay list:", delay_list, "Jitter list:", jitter_list)
 
-                    start_time = time.time()
+    # One network for the whole sweep; each trial only reshapes the h1 link
+    net = None
+    
+    try:
+        for LOSS in loss_list:
+            for DELAY in delay_list:
+                for JITTER in jitter_list:
+                    trial_params = dict(loss=LOSS, delay=DELAY, jitter=JITTER)
+                    if IMPAIRMENT_TRACES:
+                        # Kept apart from the trials netem impaired
+                        trial_params['impairment'] = 'trace'
+                    for i in store.iterations(trial_params, RESULT_METRICS):
+                        if store.done(trial_params, i):
+                            print(f"\n--- Skipping completed trial: {trial_params} (iter {i+1})")
+                            continue
+                        print(f"\n--- Running topology with {LOSS}% packet loss, base delay {DELAY}ms and jitter {JITTER}ms (iter {i+1})")
+
+                        impair = ''
+                        if IMPAIRMENT_TRACES:
+                            trace = trace_path(IMPAIRMENT_TRACES, i, loss=LOSS, delay=DELAY, jitter=JITTER)
+                            if not os.path.exists(trace):
+                                make_trace(trace, LOSS, DELAY / 1000, JITTER / 1000, seed=i)
+                            impair = f" --impair {trace}"
+                            # The trace carries the whole impairment
+                            topo = CustomTopo(loss=0, delay=0, jitter=0)
+                        else:
+                            # Create the custom topology with the specified loss, delay and jitter
+                            topo = CustomTopo(loss=LOSS, delay=DELAY, jitter=JITTER)
+
+                        if net is None:
+                            # Initialize the network with the custom topology and TCLink for link configuration
+                            net = Mininet(topo=topo, link=TCLink, controller=None)
+                            write_switch_topology(net)
+                            # Add the remote controller to the network
+                            remote_controller = RemoteController('c0', ip=controller_ip, port=controller_port)
+                            net.addController(remote_controller)
+
+                            # Start the network
+                            net.start()
+                        else:
+                            reshape_network(net, topo)
+
+                        # Get references to h1 and h2
+                        h1 = net.get('h1')
+                        h2 = net.get('h2')
+
+                        # Clear out the previous trial: a server it left behind still
+                        # holds the port, and a failed run must not reuse its output
+                        h1.cmd("pkill -f p1_server.py || true")
+                        for path in (OUTFILE, OUTFILE + '.md5'):
+                            if os.path.exists(path):
+                                os.remove(path)
+
+                        start_time = time.time()
                     
-                    h1.cmd(f"python3 p1_server.py {SERVER_IP} {SERVER_PORT} {SWS} &")
-                    # Give server a moment to start up
-                    time.sleep(0.5) 
-                    result = h2.cmd(f"python3 p1_client.py {SERVER_IP} {SERVER_PORT}")
+                        h1.cmd(f"python3 p1_server.py {SERVER_IP} {SERVER_PORT}{impair} &")
+                        # Give server a moment to start up
+                        time.sleep(0.5) 
+                        result = h2.cmd(f"python3 p1_client.py {SERVER_IP} {SERVER_PORT}{impair}")
                     
-                    end_time = time.time()
-                    ttc = end_time - start_time
-
-                    md5_hash = compute_md5(OUTFILE)
-                    # write the result to a file
-                    f_out.write(f"{i},{LOSS},{DELAY},{JITTER},{md5_hash},{ttc}\n")
-
-                    # Stop the network
-                    net.stop()
-
-                    # Small pause before next iteration
-                    time.sleep(1)
-
-    f_out.close()
+                        end_time = time.time()
+                        ttc = end_time - start_time
+
+                        md5_hash = read_md5(OUTFILE)
+                        # record the trial once it is complete
+                        store.add(trial_params, i, dict(zip(RESULT_COLUMNS, [i, LOSS, DELAY, JITTER, md5_hash, ttc])))
+    finally:
+        if net is not None:
+            net.stop()
+        # Export whatever completed, also after an interruption
+        rows = store.export_csv(output_file, RESULT_COLUMNS)
+        print(f"{rows} trials written to {output_file}")
     print("\n--- Completed all tests ---")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python experiment.py <expname>")
+    if len(sys.argv) not in (2, 3) or sys.argv[2:] not in ([], ['--export']):
+        print("Usage: python experiment.py <expname> [--export]")
+        print("Trials already in the result store are skipped; --export only rewrites the CSV from it")
     else:
         expname = sys.argv[1].lower()
-        run(expname)
\ No newline at end of file
+        run(expname, export_only=len(sys.argv) == 3)
\ No newline at end of file
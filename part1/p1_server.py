@@ -4,39 +4,157 @@ import sys
 import time
 import struct
 import os
+import threading
+import argparse
+import hashlib
+import zlib
+import traceback
+from collections import deque
+
+from batch_io import make_io
+from impairment import ImpairedIO, ImpairmentTrace
+from scoreboard import Scoreboard
 
 # Constants
 MSS = 1180  # Maximum segment size for data
 HEADER_SIZE = 20
 MAX_PACKET_SIZE = 1200
 INITIAL_RTO = 1.0  # Initial retransmission timeout in seconds
+MAX_RTO = 3.0      # Ceiling for timeout backoff (same as estimate_rto's clamp)
 ALPHA = 0.125
 BETA = 0.25
 K = 4
 
+# Header flags (first reserved byte of a data packet)
+FLAG_META = 0x01   # Payload is transfer metadata: file size, chunk counts, MD5 digest
+FLAG_FIN = 0x02    # Last segment (the "EOF" packet); the client ACKs past it once it has everything
+FLAG_CLOSE = 0x04  # Sent once the FIN is ACKed, so the client can exit without waiting
+
+# TIME_WAIT-style linger after CLOSE, in seconds (2 * SRTT, clamped)
+MIN_LINGER = 0.02
+MAX_LINGER = 0.5
+
+# A repeated request means none of our first packets reached the client: resend
+# the head of the first window at once rather than waiting out INITIAL_RTO
+INITIAL_BURST = 4
+POLL_TIMEOUT = 0.01  # Longest the send loop blocks waiting for ACKs
+STRIPE_WAIT = 10.0  # How long to wait for the remaining stripe requests
+
+# Threaded mode: a receiver thread blocks on the socket and stamps ACKs as they
+# arrive, while the send loop waits on an event instead of the socket
+ACK_THREAD_POLL = 0.1           # How often the receiver thread checks for shutdown
+THREAD_SWITCH_INTERVAL = 0.0005 # GIL hand-off interval, so the receiver is not held off 5 ms
+
+# Window autotuning (when no SWS is given): start at INITIAL_SWS and, once per
+# round (a segment's send to its cum-ACK, at least the min RTT), move toward twice
+# the bytes delivered in the last round (the measured BDP, with headroom): up at
+# once, down by half the gap, within [INITIAL_SWS, MAX_SWS]. The client's
+# advertised window (segments) always caps what is in flight.
+INITIAL_SWS = 64 * MSS
+MAX_SWS = 8192 * MSS
+
+# RACK-TLP loss detection (RFC 8985)
+MIN_REO_WND_DIV = 4  # Base reordering window is min RTT / 4
+MIN_PTO = 0.01       # Tail loss probe fires after max(2 * SRTT, MIN_PTO) without progress
+REO_WND_PERSIST = 16 # Loss recoveries without a spurious one before the reordering window narrows again
+MIN_REO_RTT = 0.04   # Floor of the RTT D-SACK widening works with, as jitter can make samples ~0
+
+# Data header: seq (4) | flags (1) | pad (3) | CRC32 of seq, flags and payload (4) | reserved (8)
+DATA_HEADER = struct.Struct('!IB3xI')
+
+# ACK: cum_ack (4) | 3 SACK blocks (offset from cum_ack, length) (12) | rwnd (2) | flags (1) | CE count (1)
+MAX_SACK_BLOCKS = 3
+ACK_DSACK = 0x01  # Block 0 is a D-SACK: a duplicate the client received; its offset is signed
+ACK_ECN = 0x02    # The client reads ECN bits: the last byte counts CE-marked segments (mod 256)
+
 class ReliableUDPServer:
-    def __init__(self, server_ip, server_port, sws):
+    def __init__(self, server_ip, server_port, sws=None, file_cache=None, batch_io=False, threaded=False, io=None):
         self.server_ip = server_ip
         self.server_port = server_port
-        self.sws = sws  # Sender window size in bytes
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind((self.server_ip, self.server_port))
+        # Sender window size in bytes: fixed if given, otherwise autotuned
+        self.sws_arg = sws
+        self.autotune = sws is None
+        self.sws = INITIAL_SWS if self.autotune else sws
+        self.rwnd = None  # Client's advertised window in segments (None: not advertised)
+        
+        # Socket I/O backend: per-packet, or GSO/GRO batches when requested. A
+        # given backend stands in for the socket (the simulator's, see simulator.py)
+        self.batch_io = batch_io
+        if io is None:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.bind((self.server_ip, self.server_port))
+            self.io = make_io(self.sock, batch_io)
+        else:
+            self.sock = None
+            self.io = io
+        self.impairment = None  # Replayed on what is sent, by every flow (see impair)
+        
+        # Threaded mode: ACKs (packet, arrival time) queued by the receiver thread;
+        # deque appends and pops are atomic, the event wakes the send loop
+        self.threaded = threaded
+        self.ack_queue = None
+        self.ack_ready = threading.Event()
+        self.max_ack_backlog = 0
+        
+        # filename -> (file contents, MD5 digest), shared by every flow of a striped transfer
+        self.file_cache = file_cache if file_cache is not None else {}
         
         # State variables
         self.base_seq = 0  # Oldest unacknowledged sequence number
         self.next_seq = 0  # Next sequence number to send
-        self.window = {}   # Dictionary: seq_num -> (data, send_time)
+        self.total_packets = 0  # Segments in the current transfer, EOF included
+        self.close_seq = None   # Sequence the FIN-ACK carries; CLOSE answers it
+        self.close_packet = None
         
         # RTO estimation
         self.estimated_rtt = None
         self.dev_rtt = None
         self.rto = INITIAL_RTO
         
-        # Statistics
-        self.duplicate_ack_count = {}
+        # The window: each segment's packet, send time, resend path and SACK state,
+        # with the unacknowledged, unSACKed ones in transmission order for RACK.
+        # Deliveries of resent segments are ambiguous (Karn).
+        self.scoreboard = Scoreboard()
+        
+        # RACK-TLP: the send time / RTT of the most recently sent segment known delivered
+        self.min_rtt = None
+        self.rack_xmit_ts = None
+        self.rack_end_seq = -1
+        self.rack_rtt = None
+        self.reo_extent = 0.0          # Largest reordering delay observed so far
+        self.reordered = False         # An original was SACKed after a later-sent segment
+        self.reo_wnd_mult = 1          # Grown when D-SACK shows a RACK retransmission was spurious
+        self.reo_wnd_grown = 0.0       # ... at most once per round trip
+        self.reo_wnd_persist = REO_WND_PERSIST  # ... and reset after this many clean recoveries
+        self.recovery_end = None       # next_seq when RACK last found losses; recovered once ACKed
+        self.tlp_pending = False       # One probe per tail episode
+        self.last_progress = 0.0       # Last new send or delivery; the PTO runs from here
+        
+        # F-RTO (RFC 5682): after a timeout only the base is resent, and the next
+        # two ACKs decide whether the timeout was spurious and can be undone
+        self.frto = 0                  # 0: idle, 1: waiting for first ACK, 2: for second
+        self.frto_recover = 0          # next_seq when the timeout fired
+        self.frto_seq = None           # The base segment resent by the timeout
+        self.undo_rto = None           # RTO before backoff, restored on undo
+        
+        # Autotuning: segments delivered (cum-ACKed or SACKed), sampled once per round
+        self.delivered = 0
+        self.round_start = None
+        self.round_seq = 0
+        self.round_delivered = 0
         
-        # [FIX] Track which packets are known to be received (from SACK)
-        self.sacked_packets = set()
+        # Statistics: segments sent on each path, and D-SACKed duplicates by the
+        # path that sent the extra copy ('new': the network duplicated an original)
+        self.send_counts = {'new': 0, 'rack': 0, 'tlp': 0, 'rto': 0, 'request': 0}
+        self.dsack_counts = dict.fromkeys(self.send_counts, 0)
+        self.spurious_timeouts = 0
+        
+        # ECN: the client's running count of CE-marked segments, as last echoed
+        self.ce_echo = None
+        self.ce_marked = 0
+        
+        # Set by the listening socket when a striped flow's client repeats its request
+        self.repeated_request = threading.Event()
         
     def estimate_rto(self, sample_rtt):
         """Update RTO using exponential weighted moving average"""
@@ -51,180 +169,704 @@ class ReliableUDPServer:
         # [FIX] Clamp RTO to wider range for jitter tolerance
         self.rto = max(0.3, min(self.rto, 3.0))  # Was 0.2-2.0, now 0.3-3.0
     
-    def create_packet(self, seq_num, data):
-        """Create a packet with sequence number and data"""
-        # Header: 4 bytes seq_num + 16 bytes reserved (all zeros)
-        header = struct.pack('!I', seq_num) + b'\x00' * 16
+    def create_packet(self, seq_num, data, flags=0):
+        """Create a packet with sequence number, flags, payload CRC32 and data"""
+        crc = zlib.crc32(data, zlib.crc32(struct.pack('!IB', seq_num, flags)))
+        header = DATA_HEADER.pack(seq_num, flags, crc) + b'\x00' * 8
         return header + data
     
     def parse_ack(self, packet):
-        """Parse ACK packet to extract cumulative ACK and SACK blocks"""
+        """Parse ACK packet to extract cumulative ACK, SACK blocks, D-SACK (start_seq, length),
+        advertised window and CE count (None if the client does not read ECN)"""
         if len(packet) < 4:
-            return None, []
+            return None, [], None, None, None
         
         cum_ack = struct.unpack('!I', packet[:4])[0]
         
-        # Parse SACK blocks from reserved area (bytes 4-20)
+        # Parse SACK blocks from reserved area (bytes 4-16), flags from byte 18
         sack_blocks = []
-        if len(packet) >= 20:
-            reserved = packet[4:20]
+        dsack = None
+        rwnd = None
+        ce_count = None
+        if len(packet) >= HEADER_SIZE:
+            rwnd = struct.unpack('!H', packet[16:18])[0] or None  # 0: not advertised
+            flags = packet[18]
+            if flags & ACK_ECN:
+                ce_count = packet[19]
             # Each SACK block is 4 bytes: 2 bytes start, 2 bytes length
-            for i in range(0, 16, 4):
-                if i + 4 <= len(reserved):
-                    start_offset = struct.unpack('!H', reserved[i:i+2])[0]
-                    length = struct.unpack('!H', reserved[i+2:i+4])[0]
-                    if start_offset > 0 or length > 0:  # Valid SACK block
-                        sack_blocks.append((start_offset, length))
-        
-        return cum_ack, sack_blocks
-    
-    def send_file(self, client_addr, filename):
-        """Send file to client using sliding window with SACK"""
-        if not os.path.exists(filename):
+            for i in range(4, 4 + 4 * MAX_SACK_BLOCKS, 4):
+                if i == 4 and flags & ACK_DSACK:
+                    start_offset, length = struct.unpack('!hH', packet[i:i+4])
+                    dsack = (cum_ack + start_offset, length)
+                    continue
+                start_offset, length = struct.unpack('!HH', packet[i:i+4])
+                if start_offset > 0 or length > 0:  # Valid SACK block
+                    sack_blocks.append((start_offset, length))
+        
+        return cum_ack, sack_blocks, dsack, rwnd, ce_count
+    
+    def is_request(self, packet):
+        """Requests are b'\\x01' (+ stripe info), always shorter than an ACK"""
+        return 0 < len(packet) < HEADER_SIZE and packet[0] == 0x01
+    
+    def parse_request(self, packet):
+        """Parse file request: b'\\x01' [+ 2 bytes stripe index + 2 bytes stripe count
+        [+ 2 bytes receive window]]; returns (stripe, num_stripes, rwnd)"""
+        rwnd = None
+        if len(packet) >= 7:
+            rwnd = struct.unpack('!H', packet[5:7])[0] or None
+        if len(packet) >= 5:
+            stripe, num_stripes = struct.unpack('!HH', packet[1:5])
+            if num_stripes > 0 and stripe < num_stripes:
+                return stripe, num_stripes, rwnd
+        return 0, 1, rwnd
+    
+    def load_file(self, filename):
+        """Read file once; later flows reuse the cached copy and digest"""
+        if filename not in self.file_cache:
+            if not os.path.exists(filename):
+                return None, None
+            with open(filename, 'rb') as f:
+                file_data = f.read()
+            self.file_cache[filename] = (file_data, hashlib.md5(file_data).digest())
+        return self.file_cache[filename]
+    
+    def build_chunks(self, filename, stripe=0, num_stripes=1, client_addr=None):
+        """Segments of a transfer: the metadata, the file's (or stripe's) chunks
+        and the EOF marker; None if the file does not exist"""
+        file_data, digest = self.load_file(filename)
+        if file_data is None:
             print(f"File {filename} not found")
-            return
+            return None
         
-        # Read file
-        with open(filename, 'rb') as f:
-            file_data = f.read()
+        # Stripe i covers chunks [n*i/K, n*(i+1)/K) so stripes concatenate back in order
+        total_chunks = (len(file_data) + MSS - 1) // MSS
+        first_chunk = total_chunks * stripe // num_stripes
+        last_chunk = total_chunks * (stripe + 1) // num_stripes
         
-        print(f"Sending file {filename} ({len(file_data)} bytes) to {client_addr}")
+        if num_stripes > 1:
+            print(f"Sending stripe {stripe + 1}/{num_stripes} of {filename} "
+                  f"(chunks {first_chunk}-{last_chunk - 1}) to {client_addr}")
+        else:
+            print(f"Sending file {filename} ({len(file_data)} bytes) to {client_addr}")
         
-        # Split into chunks
-        chunks = []
-        for i in range(0, len(file_data), MSS):
-            chunks.append(file_data[i:i+MSS])
+        # Seq 0 carries the metadata so the client can preallocate its output;
+        # it is sent, ACKed and retransmitted like any other segment
+        meta = struct.pack('!QIII16s', len(file_data), total_chunks, first_chunk,
+                           last_chunk - first_chunk, digest)
         
-        total_data_packets = len(chunks)
+        # Split into chunks (views into the cached file, no copies)
+        view = memoryview(file_data)
+        chunks = [meta]
+        for i in range(first_chunk, last_chunk):
+            chunks.append(view[i * MSS:(i + 1) * MSS])
         
-        # Add EOF marker as separate packet
+        # Add EOF marker as separate packet; it carries the FIN flag
         chunks.append(b'EOF')
+        return chunks
+    
+    def send_file(self, client_addr, filename, stripe=0, num_stripes=1):
+        """Send file (or one contiguous stripe of it) to client using sliding window with SACK"""
+        chunks = self.build_chunks(filename, stripe, num_stripes, client_addr)
+        if chunks is None:
+            return
         
-        total_packets = len(chunks)
-        self.sock.settimeout(0.01)  # Non-blocking with short timeout
-        
-        last_ack_time = time.time()
-        
+        self.sock.settimeout(POLL_TIMEOUT)  # Non-blocking with short timeout
+        self.start_transfer(client_addr, chunks, time.time())
+        try:
+            if self.threaded:
+                receiver = self.start_ack_receiver()
+            try:
+                self.send_loop(client_addr, chunks, self.total_packets)
+            finally:
+                if self.threaded:
+                    self.stop_ack_receiver(receiver)
+            
+            self.report()
+            
+            # The client ACKed past the FIN: finish the close handshake
+            self.close_connection(client_addr, self.total_packets)
+        finally:
+            self.finish_transfer(time.time())
+    
+    def start_transfer(self, client_addr, chunks, now):
+        """A transfer of chunks to client_addr begins now"""
+        self.total_packets = len(chunks)
+        self.last_ack_time = now
+    
+    def finish_transfer(self, now):
+        """Hook: the transfer is over (completed or not)"""
+        pass
+    
+    def report(self):
+        """Print the transfer's statistics"""
+        print(f"File transfer complete. Sent {self.total_packets} packets.")
+        print(f"I/O: {self.io.stats()}")
+        if self.threaded:
+            print(f"ACK receiver thread: largest backlog {self.max_ack_backlog} ACKs")
+        print(f"Final window: {self.send_window()} bytes (own limit {self.sws}, "
+              f"advertised {self.rwnd} segments{', autotuned' if self.autotune else ''})")
+        print("Sends by path: " + ", ".join(f"{path} {n}" for path, n in self.send_counts.items()))
+        duplicates = sum(self.dsack_counts.values())
+        print(f"D-SACKed duplicates: {duplicates} ({duplicates * MSS} bytes wasted; " +
+              ", ".join(f"{path} {n}" for path, n in self.dsack_counts.items() if n) +
+              f"), spurious timeouts undone: {self.spurious_timeouts}")
+        if self.ce_marked:
+            print(f"CE-marked segments echoed: {self.ce_marked}")
+        if self.estimated_rtt is not None:
+            print(f"RTT: smoothed {self.estimated_rtt * 1000:.1f} ms, min {self.min_rtt * 1000:.1f} ms")
+    
+    def send_loop(self, client_addr, chunks, total_packets):
+        """Send, retransmit and process ACKs until everything is acknowledged"""
         while self.base_seq < total_packets:
             current_time = time.time()
+            self.transmit(client_addr, chunks, total_packets, current_time)
             
-            # Send new packets within window
-            while self.next_seq < total_packets and \
-                  (self.next_seq - self.base_seq) * MSS < self.sws:
-                
-                if self.next_seq not in self.window:
-                    packet = self.create_packet(self.next_seq, chunks[self.next_seq])
-                    self.sock.sendto(packet, client_addr)
-                    self.window[self.next_seq] = (packet, current_time)
-                    self.next_seq += 1
+            # Wait for ACKs (several per syscall with GRO, or queued by the receiver thread)
+            try:
+                acks = self.wait_for_acks(self.poll_timeout(current_time))
+            except OSError:
+                acks = []
+            for ack_packet, ack_time in acks:
+                try:
+                    self.process_ack(ack_packet, ack_time, current_time, client_addr, total_packets)
+                except struct.error:
+                    pass  # Malformed ACK: drop it
+                except Exception:
+                    # A bug in ACK processing must not quietly leave recovery to the RTO
+                    print(f"Error processing ACK from {client_addr}:")
+                    traceback.print_exc()
             
-            # Check for timeout on base packet
-            if self.base_seq in self.window:
-                _, send_time = self.window[self.base_seq]
-                if current_time - send_time > self.rto:
-                    # Timeout: retransmit base packet
-                    packet, _ = self.window[self.base_seq]
-                    self.sock.sendto(packet, client_addr)
-                    self.window[self.base_seq] = (packet, current_time)
-                    # [FIX] Also retransmit other packets in window that haven't been SACKed
-                    for seq in range(self.base_seq + 1, min(self.next_seq, total_packets)):
-                        if seq in self.window and seq not in self.sacked_packets:
-                            packet, send_time = self.window[seq]
-                            if current_time - send_time > self.rto:
-                                self.sock.sendto(packet, client_addr)
-                                self.window[seq] = (packet, current_time)
+            self.recover(client_addr, time.time())
+    
+    def transmit(self, client_addr, chunks, total_packets, current_time):
+        """One pass of the send loop's sending half: new segments the window
+        allows, and a retransmission if the base segment has timed out"""
+        if self.repeated_request.is_set():
+            self.repeated_request.clear()
+            self.resend_first_window(client_addr, current_time)
+        
+        # Send new packets within window, as one run so batched I/O can coalesce them
+        new_packets = []
+        while self.next_seq < total_packets and \
+              (self.next_seq - self.base_seq) * MSS < self.send_window() and \
+              self.congestion_allows(current_time):
             
-            # Try to receive ACK
+            if not self.scoreboard.holds(self.next_seq):
+                flags = 0
+                if self.next_seq == 0:
+                    flags = FLAG_META
+                elif self.next_seq == total_packets - 1:
+                    flags = FLAG_FIN
+                packet = self.create_packet(self.next_seq, chunks[self.next_seq], flags)
+                new_packets.append(packet)
+                self.mark_sent(self.next_seq, packet, current_time)
+                self.next_seq += 1
+        if new_packets:
+            self.io.send_run(new_packets, client_addr)
+            self.send_counts['new'] += len(new_packets)
+            self.last_progress = current_time
+        
+        # Check for timeout on base packet
+        if self.scoreboard.holds(self.base_seq):
+            if current_time - self.scoreboard.sent_at(self.base_seq) > self.rto:
+                self.on_timeout(client_addr, current_time, total_packets)
+    
+    def recover(self, client_addr, now):
+        """Time-based loss detection, then a probe if the tail has gone quiet"""
+        self.detect_losses(client_addr, now)
+        self.probe_tail(client_addr, now)
+    
+    def wait_for_acks(self, timeout):
+        """Block up to timeout for ACKs; returns [(packet, arrival time)]"""
+        if self.ack_queue is None:
+            if timeout != self.sock.gettimeout():
+                self.sock.settimeout(timeout)
             try:
-                ack_packet, _ = self.sock.recvfrom(1024)
-                ack_time = time.time()
-                cum_ack, sack_blocks = self.parse_ack(ack_packet)
-                
-                if cum_ack is None:
+                ack_packets, _ = self.io.recv(1024)
+            except socket.timeout:
+                return []
+            ack_time = time.time()
+            return [(ack_packet, ack_time) for ack_packet in ack_packets]
+        
+        # Check the queue before sleeping, so an ACK queued since the last drain
+        # is not left waiting for an event that was already cleared
+        if not self.ack_queue and not self.ack_ready.wait(timeout):
+            return []
+        self.ack_ready.clear()
+        acks = []
+        while self.ack_queue:
+            acks.append(self.ack_queue.popleft())
+        self.max_ack_backlog = max(self.max_ack_backlog, len(acks))
+        return acks
+    
+    def start_ack_receiver(self):
+        """Hand the socket's receive side to its own thread"""
+        sys.setswitchinterval(min(sys.getswitchinterval(), THREAD_SWITCH_INTERVAL))
+        self.ack_queue = deque()
+        self.ack_ready.clear()
+        self.ack_stop = threading.Event()
+        self.sock.settimeout(ACK_THREAD_POLL)
+        receiver = threading.Thread(target=self.receive_acks, daemon=True)
+        receiver.start()
+        return receiver
+    
+    def stop_ack_receiver(self, receiver):
+        self.ack_stop.set()
+        receiver.join()
+        self.ack_queue = None
+    
+    def receive_acks(self):
+        """Receiver thread body: block on the socket, stamp each ACK the moment
+        it is read, and queue it for the send loop (socket calls drop the GIL,
+        so this overlaps with sending)"""
+        while not self.ack_stop.is_set():
+            try:
+                ack_packets, _ = self.io.recv(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            ack_time = time.time()
+            self.ack_queue.extend((ack_packet, ack_time) for ack_packet in ack_packets)
+            self.ack_ready.set()
+    
+    def close_connection(self, client_addr, close_seq):
+        """Send CLOSE, then linger TIME_WAIT-style for 2 * SRTT, answering any
+        retransmitted FIN-ACK (meaning our CLOSE was lost) with another CLOSE"""
+        self.send_close(client_addr, close_seq)
+        
+        linger = self.linger_time()
+        deadline = time.time() + linger
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            self.sock.settimeout(remaining)
+            try:
+                ack_packets, _ = self.io.recv(1024)
+            except socket.timeout:
+                break
+            for ack_packet in ack_packets:
+                if self.on_close_ack(ack_packet, client_addr):
+                    deadline = time.time() + linger
+    
+    def send_close(self, client_addr, close_seq):
+        """Send CLOSE: the client's FIN-ACK acknowledged everything up to close_seq"""
+        self.close_seq = close_seq
+        self.close_packet = self.create_packet(close_seq, b'', FLAG_CLOSE)
+        self.io.send(self.close_packet, client_addr)
+    
+    def on_close_ack(self, ack_packet, client_addr):
+        """An ACK while lingering. The FIN-ACK again means our CLOSE was lost:
+        resend it and return True, so the linger starts over"""
+        if self.parse_ack(ack_packet)[0] != self.close_seq:
+            return False
+        self.io.send(self.close_packet, client_addr)
+        return True
+    
+    def linger_time(self):
+        """How long to stay after CLOSE: 2 * SRTT, clamped"""
+        srtt = self.estimated_rtt if self.estimated_rtt is not None else INITIAL_RTO
+        return max(MIN_LINGER, min(2 * srtt, MAX_LINGER))
+    
+    def resend_first_window(self, client_addr, current_time):
+        """Answer a repeated request idempotently: the transfer is already under
+        way, so just resend the head of the first window (META first)"""
+        if self.base_seq != 0:
+            return  # Client has ACKed data, the request is stale
+        print("Repeated request, resending first window")
+        head = [seq for seq in range(min(self.next_seq, INITIAL_BURST))
+                if self.scoreboard.in_flight(seq)]
+        self.retransmit(head, client_addr, current_time, 'request')
+    
+    def send_window(self):
+        """Bytes allowed in flight: our own limit, clipped by the client's advertised window"""
+        if self.rwnd is None:
+            return self.sws
+        return min(self.sws, self.rwnd * MSS)
+    
+    def congestion_allows(self, now):
+        """Whether a new segment may go out now; Part 1 has no congestion control"""
+        return True
+    
+    def poll_timeout(self, now):
+        """How long the send loop may block waiting for ACKs"""
+        return POLL_TIMEOUT
+    
+    def on_delivered(self, seq, send_time, ack_time):
+        """Called once for every segment delivered (cum-ACKed or SACKed)"""
+        pass
+    
+    def autotune_window(self, now):
+        """Once per round, move the own limit toward twice the bytes delivered in
+        the last one (the BDP the path turns over, with headroom). A round lasts
+        from sending a segment until it is cumulatively ACKed, and never less than
+        the min RTT: the window must also cover the wait on reordered holes. It
+        grows at once and shrinks by half the gap, so one slow round does not
+        collapse it"""
+        if self.round_start is None or self.min_rtt is None:
+            self.round_start = now
+            self.round_seq = self.next_seq
+            self.round_delivered = self.delivered
+            return
+        if self.base_seq <= self.round_seq or now - self.round_start < self.min_rtt:
+            return
+        round_bytes = (self.delivered - self.round_delivered) * MSS
+        self.round_start = now
+        self.round_seq = self.next_seq
+        self.round_delivered = self.delivered
+        if self.autotune:
+            target = max(INITIAL_SWS, min(2 * round_bytes, MAX_SWS))
+            if target >= self.sws:
+                self.sws = target
+            else:
+                self.sws -= (self.sws - target) // 2
+    
+    def mark_sent(self, seq, packet, now):
+        """Record a (re)transmission in the window and in transmission order"""
+        self.scoreboard.sent(seq, packet, now)
+    
+    def retransmit(self, seqs, client_addr, now, path):
+        """Resend the given window segments as one run, counted against path"""
+        packets = []
+        for seq in seqs:
+            packet = self.scoreboard.packet(seq)
+            self.mark_sent(seq, packet, now)
+            self.scoreboard.resent(seq, path)
+            packets.append(packet)
+        if packets:
+            self.io.send_run(packets, client_addr)
+            self.send_counts[path] += len(packets)
+    
+    def rack_update(self, seq, ack_time, sacked=False):
+        """RACK: record that seq was delivered (cumulatively or by SACK).
+        Returns its RTT if it is a valid RTO sample: sent only once (Karn)"""
+        send_time = self.scoreboard.deliver(seq)
+        if send_time is None:
+            return None  # Already accounted for
+        self.delivered += 1
+        self.on_delivered(seq, send_time, ack_time)
+        rtt = ack_time - send_time
+        sample = None
+        if self.scoreboard.resend_path(seq) is not None:
+            # Faster than any RTT seen: this ACKs the original, not the retransmission
+            if self.min_rtt is None or rtt < self.min_rtt:
+                return None
+        else:
+            sample = rtt
+            if self.min_rtt is None or rtt < self.min_rtt:
+                self.min_rtt = rtt
+            # An original SACKed after a later-sent segment: reordering. Remember how
+            # much longer than the RACK deadline it took, so we wait that long next
+            # time. Cumulative jumps don't count: they also follow lost SACK blocks
+            if sacked and self.rack_xmit_ts is not None and (send_time, seq) < (self.rack_xmit_ts, self.rack_end_seq):
+                self.reordered = True
+                self.reo_extent = max(self.reo_extent, rtt - self.rack_rtt)
+        
+        if self.rack_xmit_ts is None or (send_time, seq) > (self.rack_xmit_ts, self.rack_end_seq):
+            self.rack_xmit_ts = send_time
+            self.rack_end_seq = seq
+            self.rack_rtt = rtt
+        return sample
+    
+    def srtt(self):
+        """Smoothed RTT, or the RACK RTT until there is a clean sample"""
+        return self.estimated_rtt if self.estimated_rtt is not None else self.rack_rtt
+    
+    def reo_wnd(self):
+        """Reordering window: min RTT / 4, widened to the reordering seen, capped
+        at SRTT once there is one. Never capped by the RACK RTT: that is one
+        segment's RTT, near zero after a lucky draw.
+        Once D-SACKs show RACK fired on mere reordering, the window is the
+        multiplier times a quarter of the RTT spread (SRTT + 4 * RTTVAR), up to
+        the RTO: min RTT / 4 steps (RFC 8985) go nowhere when jitter lets the
+        odd segment through at almost no delay."""
+        reo_wnd = max(self.min_rtt / MIN_REO_WND_DIV, self.reo_extent)
+        if self.estimated_rtt is not None:
+            reo_wnd = min(reo_wnd, self.estimated_rtt)
+        if self.reo_wnd_mult > 1:
+            spread = self.srtt() + K * (self.dev_rtt or 0.0)
+            step = max(spread, MIN_REO_RTT) / MIN_REO_WND_DIV
+            reo_wnd = max(reo_wnd, min(self.reo_wnd_mult * step, self.rto))
+        return round(reo_wnd, 6)  # Whole microseconds, the resolution of the clocks
+    
+    def detect_losses(self, client_addr, now):
+        """RACK: a segment is lost once a segment sent after it has been delivered
+        and it is still unacknowledged RACK RTT + reordering window after its send"""
+        if self.rack_xmit_ts is None:
+            return
+        deadline = self.rack_rtt + self.reo_wnd()
+        # Within one burst (one send time) sequence order is the order on the
+        # wire, until reordering shows that the network does not keep it
+        rack_segment = (self.rack_xmit_ts, -1 if self.reordered else self.rack_end_seq)
+        lost = []
+        for seq, send_time in self.scoreboard.in_tx_order():
+            # Transmission order: once one segment is too recent, all later ones are
+            if (send_time, seq) >= rack_segment or now - send_time < deadline:
+                break
+            lost.append(seq)
+        if lost and self.recovery_end is None:
+            self.recovery_end = self.next_seq
+        self.retransmit(lost, client_addr, now, 'rack')
+    
+    def end_recovery(self):
+        """Everything outstanding when RACK last found losses is ACKed. After
+        REO_WND_PERSIST such recoveries with no D-SACK to widen the reordering
+        window, the reordering that widened it is taken to be over (RFC 8985)"""
+        self.recovery_end = None
+        if self.reo_wnd_mult > 1:
+            self.reo_wnd_persist -= 1
+            if self.reo_wnd_persist == 0:
+                self.reo_wnd_mult = 1
+                self.reo_wnd_persist = REO_WND_PERSIST
+    
+    def probe_tail(self, client_addr, now):
+        """TLP: after a PTO (2 * SRTT) without progress, resend the last outstanding
+        segment so a tail loss draws SACK feedback instead of waiting for the RTO"""
+        srtt = self.srtt()
+        if self.tlp_pending or not self.scoreboard.outstanding or srtt is None:
+            return
+        if now - self.last_progress < max(2 * srtt, MIN_PTO):
+            return
+        self.retransmit([self.scoreboard.last_sent()], client_addr, now, 'tlp')
+        self.tlp_pending = True
+    
+    def on_timeout(self, client_addr, now, total_packets):
+        """RTO on the base segment. A fresh timeout enters F-RTO and resends only the
+        base; a timeout during F-RTO is genuine and resends everything expired."""
+        if self.frto == 0:
+            if self.undo_rto is None:
+                self.undo_rto = self.rto
+            self.frto = 1
+            self.frto_recover = self.next_seq
+            self.frto_seq = self.base_seq
+            self.rto = min(self.rto * 2, MAX_RTO)
+            self.retransmit([self.base_seq], client_addr, now, 'rto')
+            return
+        
+        self.frto = 0
+        expired = [self.base_seq]
+        # [FIX] Also retransmit other packets in window that haven't been SACKed
+        for seq in range(self.base_seq + 1, min(self.next_seq, total_packets)):
+            if self.scoreboard.in_flight(seq) and now - self.scoreboard.sent_at(seq) > self.rto:
+                expired.append(seq)
+        self.rto = min(self.rto * 2, MAX_RTO)
+        self.retransmit(expired, client_addr, now, 'rto')
+    
+    def frto_ack(self, advanced, client_addr, now):
+        """F-RTO ACK inspection: if the two ACKs after the timeout both advance the
+        window, the originals were only delayed and the timeout was spurious"""
+        if not advanced:
+            # Nothing beyond the retransmission got through: the loss was real,
+            # so everything outstanding from before the timeout is presumed lost
+            self.frto = 0
+            lost = [seq for seq, send_time in self.scoreboard.in_tx_order()
+                    if seq < self.frto_recover and now - send_time > self.undo_rto]
+            self.retransmit(lost, client_addr, now, 'rto')
+        elif self.base_seq >= self.frto_recover:
+            self.frto = 0  # Everything outstanding is ACKed; nothing left to decide
+        elif self.frto == 1:
+            self.frto = 2  # The window opened and new data goes out; wait one more ACK
+        else:
+            self.frto = 0
+            self.undo_timeout()
+    
+    def undo_timeout(self):
+        """Spurious timeout: restore the RTO from before the backoff; nothing
+        more is retransmitted"""
+        if self.frto_seq is None:
+            return  # Already undone
+        self.spurious_timeouts += 1
+        self.frto_seq = None
+        if self.undo_rto is not None:
+            self.rto = self.undo_rto
+            self.undo_rto = None
+    
+    def on_dsack(self, start_seq, length, ack_time):
+        """The client received [start_seq, start_seq + length) twice: count the
+        waste against whichever path sent the extra copy, and learn from it"""
+        for seq in range(start_seq, start_seq + length):
+            path = self.scoreboard.resend_path(seq) or 'new'
+            self.dsack_counts[path] += 1
+            if path == 'rto' and seq == self.frto_seq:
+                # The timeout's own retransmission was redundant (Eifel, RFC 3708)
+                self.frto = 0
+                self.undo_timeout()
+            elif path == 'rack' and ack_time - self.reo_wnd_grown > max(self.srtt(), MIN_REO_RTT):
+                # RACK fired on mere reordering: widen the reordering window (RFC 8985)
+                self.reo_wnd_mult += 1
+                self.reo_wnd_grown = ack_time
+                self.reo_wnd_persist = REO_WND_PERSIST
+    
+    def process_ack(self, ack_packet, ack_time, current_time, client_addr, total_packets):
+        """Process one ACK: advance the window and record SACKed segments for RACK"""
+        if self.is_request(ack_packet):
+            self.resend_first_window(client_addr, current_time)
+            return
+        
+        cum_ack, sack_blocks, dsack, rwnd, ce_count = self.parse_ack(ack_packet)
+        
+        if cum_ack is None:
+            return
+        
+        # Window updates from stale (reordered) ACKs are out of date
+        if rwnd is not None and cum_ack >= self.base_seq:
+            self.rwnd = rwnd
+        
+        # The CE count only grows; a reordered ACK shows up as a huge wrapped delta
+        if ce_count is not None:
+            marked = (ce_count - (self.ce_echo or 0)) & 0xFF
+            if marked < 0x80:
+                self.ce_echo = ce_count
+                if marked:
+                    self.on_ce(marked, ack_time)
+        
+        delivered = False
+        advanced = cum_ack > self.base_seq
+        # One RTO sample per ACK: the quickest of the segments it delivers that
+        # were sent only once (Karn). Not just the base, which under reordering
+        # RACK has nearly always resent already.
+        sample_rtt = None
+        
+        # Process cumulative ACK
+        if cum_ack > self.base_seq:
+            # Remove acknowledged packets
+            for seq in range(self.base_seq, cum_ack):
+                rtt = self.rack_update(seq, ack_time)
+                if rtt is not None and (sample_rtt is None or rtt < sample_rtt):
+                    sample_rtt = rtt
+            self.scoreboard.advance(cum_ack)
+            
+            self.base_seq = cum_ack
+            self.last_ack_time = ack_time
+            delivered = True
+            
+            if self.recovery_end is not None and cum_ack >= self.recovery_end:
+                self.end_recovery()
+        
+        # [FIX] Process SACK blocks - mark packets as received; RACK decides what is lost
+        sacked_ranges = []
+        if sack_blocks and self.base_seq < total_packets:
+            for start_offset, length in sack_blocks:
+                if start_offset == 0 or length == 0:
                     continue
                 
-                # Process cumulative ACK
-                if cum_ack > self.base_seq:
-                    # Calculate RTT sample for base packet
-                    if self.base_seq in self.window:
-                        _, send_time = self.window[self.base_seq]
-                        sample_rtt = ack_time - send_time
-                        self.estimate_rto(sample_rtt)
-                    
-                    # Remove acknowledged packets
-                    for seq in range(self.base_seq, cum_ack):
-                        self.window.pop(seq, None)
-                        self.duplicate_ack_count.pop(seq, None)
-                        self.sacked_packets.discard(seq)
-                    
-                    self.base_seq = cum_ack
-                    last_ack_time = ack_time
-                
-                elif cum_ack == self.base_seq:
-                    # Duplicate ACK
-                    self.duplicate_ack_count[cum_ack] = self.duplicate_ack_count.get(cum_ack, 0) + 1
-                    
-                    # Fast retransmit after 3 duplicate ACKs
-                    if self.duplicate_ack_count[cum_ack] == 3:
-                        if self.base_seq in self.window:
-                            packet, _ = self.window[self.base_seq]
-                            self.sock.sendto(packet, client_addr)
-                            self.window[self.base_seq] = (packet, current_time)
+                # Offsets are relative to this ACK's cum_ack, which may be behind
+                # base_seq when ACKs arrive reordered
+                start_seq = cum_ack + start_offset
+                end_seq = min(start_seq + length, total_packets)
                 
-                # [FIX] Process SACK blocks - mark packets as received, identify holes
-                if sack_blocks and self.base_seq < total_packets:
-                    # First, mark all SACKed packets
-                    for start_offset, length in sack_blocks:
-                        if start_offset == 0 or length == 0:
-                            continue
-                        
-                        start_seq = self.base_seq + start_offset
-                        end_seq = min(start_seq + length, total_packets)
-                        
-                        # Validate range
-                        if start_seq < self.base_seq or start_seq >= total_packets:
-                            continue
-                        
-                        # Mark as SACKed (but don't remove from window yet)
-                        for seq in range(start_seq, end_seq):
-                            self.sacked_packets.add(seq)
-                    
-                    # Now find ALL holes in the window and retransmit them
-                    # A hole is any packet in window that's NOT in sacked_packets
-                    window_end = min(self.next_seq, total_packets)
-                    for seq in range(self.base_seq, window_end):
-                        if seq in self.window and seq not in self.sacked_packets:
-                            packet, send_time = self.window[seq]
-                            # [FIX] Retransmit more aggressively - don't wait for RTO/2
-                            # In high jitter, we need to fill holes quickly
-                            if current_time - send_time > max(0.1, self.rto / 4):
-                                self.sock.sendto(packet, client_addr)
-                                self.window[seq] = (packet, current_time)
-                    
-                    # [FIX] Clean up: remove SACKed packets that are far behind base
-                    # to free up memory, but keep packets near base_seq
-                    for seq in list(self.sacked_packets):
-                        if seq < self.base_seq:
-                            self.sacked_packets.discard(seq)
-                        elif seq >= self.base_seq and seq in self.window:
-                            # Keep in window for now, will be removed when base advances
-                            pass
+                # Validate range
+                if start_seq < self.base_seq or start_seq >= total_packets:
+                    continue
                 
-            except socket.timeout:
-                pass
-            except Exception as e:
-                pass
+                # Mark as SACKed (but don't remove from window yet); the parts the
+                # previous ACK already reported need no second look
+                for seq in self.scoreboard.unsacked_in(start_seq, end_seq):
+                    if self.scoreboard.sack(seq):
+                        rtt = self.rack_update(seq, ack_time, sacked=True)
+                        if rtt is not None and (sample_rtt is None or rtt < sample_rtt):
+                            sample_rtt = rtt
+                        delivered = True
+                sacked_ranges.append((start_seq, end_seq))
+            self.scoreboard.sacked_ranges = sacked_ranges
+        
+        if sample_rtt is not None:
+            self.estimate_rto(sample_rtt)
+            if not self.frto:
+                self.undo_rto = None  # A fresh estimate supersedes any backoff
+        
+        if delivered:
+            self.last_progress = ack_time
+            self.tlp_pending = False
+            self.autotune_window(ack_time)
+        
+        if dsack is not None:
+            self.on_dsack(dsack[0], dsack[1], ack_time)
         
-        print(f"File transfer complete. Sent {total_packets} packets.")
+        # Stale (reordered) ACKs say nothing about the timeout
+        if self.frto and cum_ack >= self.base_seq:
+            self.frto_ack(advanced, client_addr, ack_time)
+    
+    def on_ce(self, marked, ack_time):
+        """Hook: the client saw this many more CE-marked segments"""
+        self.ce_marked += marked
+    
+    def serve_stripes(self, client_addr, stripe, num_stripes, filename, rwnd=None):
+        """Serve a striped request: one flow (own socket + thread) per stripe.
+        Each flow answers from an ephemeral port, so its ACKs never mix with
+        the other stripes'."""
+        flows = {}  # client_addr -> (thread, flow)
+        
+        def start_flow(addr, stripe, rwnd):
+            flow = self.new_flow()
+            if self.impairment is not None:
+                flow.impair(self.impairment)
+            flow.rwnd = rwnd
+            thread = threading.Thread(target=flow.serve_flow,
+                                      args=(addr, filename, stripe, num_stripes))
+            thread.start()
+            flows[addr] = (thread, flow)
+        
+        start_flow(client_addr, stripe, rwnd)
         
-        # [FIX] Wait longer to ensure client receives final packets
-        # especially important with high jitter
-        time.sleep(0.5)
+        # Accept the remaining stripe requests, and keep listening until every
+        # flow is done: a repeated request is handed to its flow to re-burst
+        self.sock.settimeout(0.1)
+        wait_until = time.time() + STRIPE_WAIT
+        while len(flows) < num_stripes or any(t.is_alive() for t, _ in flows.values()):
+            try:
+                data, addr = self.sock.recvfrom(1024)
+            except socket.timeout:
+                if len(flows) < num_stripes and time.time() > wait_until:
+                    print(f"Timeout waiting for stripes, serving {len(flows)}/{num_stripes}")
+                    break
+                continue
+            if not self.is_request(data):
+                continue
+            if addr in flows:
+                flows[addr][1].repeated_request.set()
+                continue
+            if len(flows) == num_stripes:
+                continue
+            stripe, _, rwnd = self.parse_request(data)
+            print(f"Received request for stripe {stripe + 1}/{num_stripes} from {addr}")
+            start_flow(addr, stripe, rwnd)
+        
+        for thread, _ in flows.values():
+            thread.join()
+    
+    def new_flow(self):
+        """A server like this one on an ephemeral port, for one stripe"""
+        return type(self)(self.server_ip, 0, self.sws_arg, self.file_cache, self.batch_io, self.threaded)
+    
+    def serve_flow(self, client_addr, filename, stripe, num_stripes):
+        """Thread body for one stripe flow"""
+        try:
+            self.send_file(client_addr, filename, stripe, num_stripes)
+        finally:
+            self.close_socket()
+    
+    def impair(self, impairment):
+        """Apply impairment to everything this server sends, striped flows
+        included; they share it, so its fates go out in sending order"""
+        self.impairment = impairment
+        self.io = ImpairedIO(self.io, impairment)
+    
+    def close_socket(self):
+        # Datagrams still on an impairment's delay line were on the wire: send them first
+        if isinstance(self.io, ImpairedIO):
+            self.io.drain()
+        self.sock.close()
     
     def run(self):
         """Main server loop"""
         print(f"Server listening on {self.server_ip}:{self.server_port}")
-        print(f"Sender window size: {self.sws} bytes")
+        if self.autotune:
+            print(f"Sender window size: autotuned from {self.sws} bytes")
+        else:
+            print(f"Sender window size: {self.sws} bytes")
         
         # Wait for client request
         try:
@@ -232,8 +874,13 @@ class ReliableUDPServer:
             data, client_addr = self.sock.recvfrom(1024)
             print(f"Received request from {client_addr}")
             
-            # Send the file
-            self.send_file(client_addr, 'data.txt')
+            # Send the file, striped over several flows if the client asked for it
+            stripe, num_stripes, self.rwnd = self.parse_request(data)
+            if num_stripes > 1:
+                self.load_file('data.txt')
+                self.serve_stripes(client_addr, stripe, num_stripes, 'data.txt', self.rwnd)
+            else:
+                self.send_file(client_addr, 'data.txt')
             
             print("Server finished, exiting")
             
@@ -242,18 +889,27 @@ class ReliableUDPServer:
         except KeyboardInterrupt:
             print("\nServer shutting down")
         finally:
-            self.sock.close()
+            self.close_socket()
 
 def main():
-    if len(sys.argv) != 4:
-        print("Usage: python3 p1_server.py <SERVER_IP> <SERVER_PORT> <SWS>")
-        sys.exit(1)
-    
-    server_ip = sys.argv[1]
-    server_port = int(sys.argv[2])
-    sws = int(sys.argv[3])
+    parser = argparse.ArgumentParser(usage="python3 p1_server.py <SERVER_IP> <SERVER_PORT> [SWS] [--batch-io] [--threaded] [--impair TRACE]")
+    parser.add_argument('server_ip')
+    parser.add_argument('server_port', type=int)
+    parser.add_argument('sws', type=int, nargs='?', default=None,
+                        help="sender window in bytes; autotuned to the measured BDP if omitted")
+    parser.add_argument('--batch-io', action='store_true',
+                        help="send/receive with UDP GSO/GRO batches (Linux), falling back to per-packet I/O")
+    parser.add_argument('--threaded', action='store_true',
+                        help="receive ACKs on a separate thread instead of in the send loop")
+    parser.add_argument('--impair', metavar='TRACE',
+                        help="replay the 'data' direction of a synthetic impairment trace on what the server sends "
+                             "(see impairment.py)")
+    args = parser.parse_args()
     
-    server = ReliableUDPServer(server_ip, server_port, sws)
+    server = ReliableUDPServer(args.server_ip, args.server_port, args.sws, batch_io=args.batch_io,
+                               threaded=args.threaded)
+    if args.impair:
+        server.impair(ImpairmentTrace.load(args.impair).replayer('data'))
     server.run()
 
 if __name__ == "__main__":
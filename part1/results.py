@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+import glob
+import hashlib
+import json
+import math
+import os
+
+# Code under test: the protocol, I/O and controller sources of both parts. The
+# experiment harness (*_exp.py, their network helpers, this store and the
+# offline analysis and simulator tools) is left out so fixing it does not throw
+# away the results it already collected.
+HARNESS_FILES = ('results.py', 'analysis.py', 'simulator.py', 'topology.py')
+
+# Adaptive sampling: every grid point runs at least MIN_ITERATIONS trials, then
+# more until the 90% confidence interval of each tracked metric is within
+# CI_TARGET of its mean (half-width / mean), giving up at MAX_ITERATIONS
+MIN_ITERATIONS = int(os.environ.get('MIN_ITERATIONS', '3'))
+MAX_ITERATIONS = int(os.environ.get('MAX_ITERATIONS', '10'))
+CI_TARGET = float(os.environ.get('CI_TARGET', '0.05'))
+
+# Two-sided 90% Student t critical values by degrees of freedom (1..30); the
+# normal value beyond
+T90 = (None, 6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833, 1.812,
+       1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734, 1.729, 1.725,
+       1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703, 1.701, 1.699, 1.697)
+Z90 = 1.645
+SOURCE_DIRS = [os.path.dirname(os.path.abspath(__file__)),
+               os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'part2')]
+
+def code_revision():
+    """Short hash of the code under test; results from other code never match"""
+    hasher = hashlib.sha1()
+    for path in sorted(p for d in SOURCE_DIRS for p in glob.glob(os.path.join(d, '*.py'))):
+        if path.endswith('_exp.py') or os.path.basename(path) in HARNESS_FILES:
+            continue
+        hasher.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            hasher.update(f.read())
+    return hasher.hexdigest()[:12]
+
+def ci_half_width(values):
+    """Half-width of the 90% confidence interval of the mean of values (at least 2)"""
+    n = len(values)
+    mean = sum(values) / n
+    sd = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+    t = T90[n - 1] if n - 1 < len(T90) else Z90
+    return t * sd / math.sqrt(n)
+
+def converged(values, target=CI_TARGET):
+    """Whether the 90% CI half-width of values is within target of their mean"""
+    if len(values) < 2:
+        return False
+    mean = sum(values) / len(values)
+    return ci_half_width(values) <= target * abs(mean)
+
+class ResultStore:
+    """Append-only JSONL store of trial results, one line per completed trial,
+    keyed by (experiment, parameters, iteration, code revision).
+
+    A trial is recorded only once it has finished, so after a crash the
+    harness reruns exactly the grid points that are missing. A line cut short
+    by the crash is ignored on load.
+    """
+    def __init__(self, path, experiment, revision=None):
+        self.path = path
+        self.experiment = experiment
+        self.revision = revision or code_revision()
+        self.rows = {}   # key -> row, in the order the trials completed
+        self.params = {}   # key -> trial parameters
+        try:
+            with open(path) as f:
+                text = f.read()
+        except FileNotFoundError:
+            text = ''
+        self.torn = text != '' and not text.endswith('\n')   # Ends in a partial line
+        for line in text.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('experiment') == experiment and record.get('revision') == self.revision:
+                key = self.key(record['params'], record['iteration'])
+                self.rows[key] = record['row']
+                self.params[key] = record['params']
+
+    def key(self, params, iteration):
+        return json.dumps([params, iteration], sort_keys=True)
+
+    def done(self, params, iteration):
+        return self.key(params, iteration) in self.rows
+
+    def add(self, params, iteration, row):
+        """Record a completed trial; flushed and synced before returning"""
+        record = {'experiment': self.experiment, 'revision': self.revision,
+                  'params': params, 'iteration': iteration, 'row': row}
+        with open(self.path, 'a') as f:
+            # Never glue a record onto the remains of a crashed write
+            f.write(('\n' if self.torn else '') + json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.torn = False
+        self.rows[self.key(params, iteration)] = row
+        self.params[self.key(params, iteration)] = params
+
+    def samples(self, params, column):
+        """Numeric values of column over the stored trials whose parameters
+        include params"""
+        values = []
+        for key, row in self.rows.items():
+            if all(self.params[key].get(k) == v for k, v in params.items()):
+                value = row.get(column)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values.append(value)
+        return values
+
+    def iterations(self, params, metrics, min_iterations=MIN_ITERATIONS,
+                   max_iterations=MAX_ITERATIONS, target=CI_TARGET):
+        """Iteration numbers to run for the grid point params (any subset of
+        its trial parameters that singles it out): min_iterations, then one
+        more at a time until every metric has converged or max_iterations.
+        Stored trials count, so a resumed sweep only adds what is missing."""
+        for i in range(max_iterations):
+            if i >= min_iterations and all(converged(self.samples(params, m), target) for m in metrics):
+                print(f"--- {params} converged after {i} iterations ---")
+                return
+            yield i
+
+    def export_csv(self, path, columns):
+        """Write every stored trial of this experiment and revision as CSV"""
+        with open(path, 'w') as f:
+            f.write(','.join(columns) + '\n')
+            for row in self.rows.values():
+                f.write(','.join(str(row.get(c)) for c in columns) + '\n')
+        return len(self.rows)
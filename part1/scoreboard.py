@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+from array import array
+
+INITIAL_CAPACITY = 1024  # Segments; doubled whenever the window outgrows it
+
+# Per-segment state bits
+IN_WINDOW = 0x01  # Sent and not yet cumulatively ACKed
+SACKED = 0x02     # Reported received in a SACK block
+LOST = 0x04       # Declared lost (RACK or RTO) and retransmitted, not yet delivered
+
+# Paths a segment can be resent by; index 0 means never resent
+RESEND_PATHS = ('new', 'rack', 'tlp', 'rto', 'request')
+
+NIL = -1
+
+class Scoreboard:
+    """Sender scoreboard: one ring slot per segment of the window, indexed by
+    seq & (capacity - 1), in parallel arrays (packet, send time, resend count
+    and path, state bits). Memory follows the window, not the file.
+
+    Outstanding segments (sent, neither cum-ACKed nor SACKed) are also threaded
+    through a doubly linked list in transmission order, kept in two index
+    arrays, so RACK can walk them oldest first and a delivery or resend moves
+    one entry in O(1).
+    """
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.base = 0         # Lowest seq that may still be in the window
+        self.allocate(capacity)
+        # Absolute SACK ranges of the last ACK: known SACKed, no need to rescan
+        self.sacked_ranges = []
+
+    def allocate(self, capacity):
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.seqs = array('q', [NIL]) * capacity
+        self.packets = [None] * capacity
+        self.send_time = array('d', [0.0]) * capacity
+        self.retx = array('H', [0]) * capacity
+        self.path = bytearray(capacity)
+        self.flags = bytearray(capacity)
+        self.next = array('l', [NIL]) * capacity
+        self.prev = array('l', [NIL]) * capacity
+        self.head = NIL
+        self.tail = NIL
+        self.outstanding = 0  # Entries in the transmission-order list (grow relinks them)
+        self.highest = NIL    # Highest seq in the list
+
+    def grow(self, seq):
+        """Double the ring until seq fits, keeping every slot and the list order"""
+        capacity = self.capacity
+        while seq - self.base >= capacity:
+            capacity *= 2
+        order = [self.seqs[i] for i in self.walk()]
+        seqs, packets, send_time = self.seqs, self.packets, self.send_time
+        retx, path, flags = self.retx, self.path, self.flags
+        self.allocate(capacity)
+        # Only the window moves over; older slots were kept just for D-SACK attribution
+        for i in range(len(seqs)):
+            if flags[i] & IN_WINDOW:
+                j = seqs[i] & self.mask
+                self.seqs[j] = seqs[i]
+                self.packets[j] = packets[i]
+                self.send_time[j] = send_time[i]
+                self.retx[j] = retx[i]
+                self.path[j] = path[i]
+                self.flags[j] = flags[i]
+        for s in order:
+            self.link(s & self.mask)
+
+    def slot(self, seq):
+        """Ring index of seq, or NIL if seq is not (or no longer) recorded"""
+        i = seq & self.mask
+        return i if self.seqs[i] == seq else NIL
+
+    def walk(self):
+        i = self.head
+        while i != NIL:
+            nxt = self.next[i]
+            yield i
+            i = nxt
+
+    def link(self, i):
+        """Append slot i at the tail of the transmission order"""
+        self.prev[i] = self.tail
+        self.next[i] = NIL
+        if self.tail == NIL:
+            self.head = i
+        else:
+            self.next[self.tail] = i
+        self.tail = i
+        self.outstanding += 1
+        self.highest = max(self.highest, self.seqs[i])
+
+    def unlink(self, i):
+        p, n = self.prev[i], self.next[i]
+        if p == NIL:
+            self.head = n
+        else:
+            self.next[p] = n
+        if n == NIL:
+            self.tail = p
+        else:
+            self.prev[n] = p
+        self.prev[i] = self.next[i] = NIL
+        self.outstanding -= 1
+        if self.outstanding == 0:
+            self.highest = NIL
+        elif self.seqs[i] == self.highest:
+            # Step down to the next seq still listed; highest only passes each
+            # seq again after a higher one is sent, so this is O(1) amortized
+            seq = self.highest - 1
+            while self.seqs[seq & self.mask] != seq or not self.linked(seq & self.mask):
+                seq -= 1
+            self.highest = seq
+
+    def linked(self, i):
+        return i == self.head or self.prev[i] != NIL
+
+    # --- Window ---
+
+    def sent(self, seq, packet, now):
+        """Record a (re)transmission of seq and move it to the tail of the order"""
+        if seq - self.base >= self.capacity:
+            self.grow(seq)
+        i = seq & self.mask
+        if self.seqs[i] != seq:
+            self.seqs[i] = seq
+            self.packets[i] = packet
+            self.retx[i] = 0
+            self.path[i] = 0
+            self.flags[i] = IN_WINDOW
+        elif self.linked(i):
+            self.unlink(i)
+        self.send_time[i] = now
+        self.link(i)
+
+    def resent(self, seq, path):
+        """seq was just resent by path; RACK and RTO resends mark it lost"""
+        i = self.slot(seq)
+        self.retx[i] += 1
+        self.path[i] = RESEND_PATHS.index(path)
+        if path in ('rack', 'rto'):
+            self.flags[i] |= LOST
+
+    def advance(self, cum_ack):
+        """Drop everything below cum_ack from the window; the slots keep their
+        seq and resend path so a late D-SACK can still be attributed"""
+        for seq in range(self.base, cum_ack):
+            i = seq & self.mask
+            if self.seqs[i] == seq:
+                if self.linked(i):
+                    self.unlink(i)
+                self.packets[i] = None
+                self.flags[i] = 0
+        self.base = max(self.base, cum_ack)
+
+    def holds(self, seq):
+        """Sent and not yet cumulatively ACKed"""
+        i = self.slot(seq)
+        return i != NIL and self.flags[i] & IN_WINDOW != 0
+
+    def in_flight(self, seq):
+        """In the window and not SACKed"""
+        i = self.slot(seq)
+        return i != NIL and self.flags[i] & (IN_WINDOW | SACKED) == IN_WINDOW
+
+    def packet(self, seq):
+        return self.packets[self.slot(seq)]
+
+    def sent_at(self, seq):
+        return self.send_time[self.slot(seq)]
+
+    def resend_path(self, seq):
+        """Path of the last resend of seq, or None if it was only sent once"""
+        i = self.slot(seq)
+        if i == NIL or not self.path[i]:
+            return None
+        return RESEND_PATHS[self.path[i]]
+
+    # --- Deliveries ---
+
+    def deliver(self, seq):
+        """seq was delivered: take it out of the transmission order. Returns its
+        last send time, or None if it was already accounted for"""
+        i = self.slot(seq)
+        if i == NIL or not self.linked(i):
+            return None
+        self.unlink(i)
+        self.flags[i] &= ~LOST
+        return self.send_time[i]
+
+    def sack(self, seq):
+        """Mark seq SACKed; returns whether this is news"""
+        i = self.slot(seq)
+        if i == NIL or self.flags[i] & (IN_WINDOW | SACKED) != IN_WINDOW:
+            return False
+        self.flags[i] |= SACKED
+        return True
+
+    def unsacked_in(self, start, end):
+        """Seqs of [start, end) outside the ranges the last ACK already SACKed"""
+        for lo, hi in sorted(self.sacked_ranges):
+            if lo >= end:
+                break
+            if hi <= start:
+                continue
+            if lo > start:
+                yield from range(start, lo)
+            start = max(start, hi)
+        if start < end:
+            yield from range(start, end)
+
+    # --- Transmission order ---
+
+    def in_tx_order(self):
+        """(seq, send time) of outstanding segments, oldest transmission first"""
+        for i in self.walk():
+            yield self.seqs[i], self.send_time[i]
+
+    def last_sent(self):
+        """Highest outstanding seq, or None"""
+        return None if self.highest == NIL else self.highest
@@ -0,0 +1,750 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import math
+import heapq
+import random
+import collections
+import hashlib
+import argparse
+import itertools
+import contextlib
+
+from p1_server import ReliableUDPServer, MSS, MAX_PACKET_SIZE
+from p1_client import ReliableUDPClient, MappedOutput, RECV_TIMEOUT, RCVBUF_SIZE
+
+# Part 2's congestion-controlled sender runs on the same protocol
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'part2'))
+
+from p2_server import CongestionControlledServer, CongestionManager, BBR
+from impairment import Impairment, ImpairmentTrace, trace_path
+
+# Deterministic discrete-event simulation of the experiments: the unmodified
+# server and client protocol objects, driven by virtual time instead of
+# sockets and clocks, over simulated Mininet links. Hosts are infinitely
+# fast, so a run measures the protocol and the network, not the CPU; its cost
+# follows the packets sent, not the link rate or the virtual time.
+#
+# Every segment and ACK is its own event. At roughly 10,000 segments per CPU
+# second, the experiments' 5 MB transfers take well under a second, but a
+# link kept saturated for long (60 s at 1 Gbps is over 6 million segments)
+# would take many minutes. Such runs take the fluid fast path instead
+# (simulate_fluid): Part 2's congestion controller, unmodified, sends and is
+# ACKed in batches of one pacing step, through a bottleneck queue that counts
+# segments instead of carrying them. It measures rates, queueing and
+# fairness, not the protocol's loss recovery: lost segments are simply sent
+# again about one RTT later.
+
+# Bytes a datagram occupies on the wire besides its UDP payload: Ethernet (14),
+# IP (20) and UDP (8) headers
+WIRE_OVERHEAD = 42
+# netem's queue limit when the link gets no max_queue_size
+NETEM_LIMIT = 1000
+# The client's receive buffer as getsockopt reports it under Mininet, where it
+# runs as root and forces its request past net.core.rmem_max: doubled
+CLIENT_RCVBUF = 2 * RCVBUF_SIZE
+
+FILENAME = 'data.txt'
+FILE_SIZE = 5 * 1024 * 1024
+SERVER_PORT = 6555
+CLIENT_PORT = 40000
+TIME_LIMIT = 600.0   # Virtual seconds before a stuck run is abandoned
+FLUID_STEP = 0.001   # Seconds of sending per batch on the fluid path
+
+P1_COLUMNS = ['seed', 'loss', 'delay', 'jitter', 'md5_ok', 'ttc', 'retx', 'srtt_ms', 'cpu_s']
+P2_COLUMNS = ['seed', 'bw', 'loss', 'delay_c2_ms', 'buffer_size', 'md5_ok', 'ttc1', 'ttc2',
+              'thr1_mbps', 'thr2_mbps', 'link_util', 'jfi', 'retx1', 'retx2', 'srtt1_ms', 'srtt2_ms',
+              'queue_max_pkts', 'queue_drops', 'cpu_s']
+FLUID_COLUMNS = ['seed', 'bw', 'loss', 'delay_c2_ms', 'buffer_size', 'duration', 'thr1_mbps', 'thr2_mbps',
+                 'link_util', 'jfi', 'retx1', 'retx2', 'srtt1_ms', 'srtt2_ms', 'queue_max_pkts',
+                 'queue_drops', 'cpu_s']
+
+class Simulator:
+    """Discrete-event engine: callbacks run in virtual-time order (ties in the
+    order they were scheduled), and every random decision comes from one
+    seeded generator, so a run is a function of its parameters and seed"""
+    def __init__(self, seed=0):
+        self.now = 0.0
+        self.events = []
+        self.count = 0
+        self.running = True
+        self.random = random.Random(seed)
+
+    def at(self, when, callback, *args):
+        self.count += 1
+        heapq.heappush(self.events, (when, self.count, callback, args))
+
+    def run(self, until=TIME_LIMIT):
+        events = self.events
+        while events and self.running:
+            if events[0][0] > until:
+                break
+            when, _, callback, args = heapq.heappop(events)
+            self.now = when
+            callback(*args)
+        return self.now
+
+    def stop(self):
+        self.running = False
+
+class Link:
+    """One direction of a Mininet TCLink: netem (random loss, delay with
+    uniform jitter, a tail-drop queue of limit packets) under an htb rate
+    limit of bw Mbps. As in Mininet, netem's limit counts the packets in its
+    delay line as well as the backlog waiting on the rate limiter. Loss and
+    delay come from an impairment (see impairment.py): drawn from the
+    simulation's generator unless one is given to record or replay them."""
+    def __init__(self, sim, bw=None, delay=0.0, jitter=0.0, loss=0.0, limit=NETEM_LIMIT, impairment=None):
+        self.sim = sim
+        self.rate = bw * 1e6 / 8 if bw else None   # Bytes per second; None: unlimited
+        self.impairment = impairment or Impairment(loss, delay, jitter, sim.random)
+        self.limit = limit
+        self.free_at = 0.0   # When the rate limiter is done with what it holds
+        self.held = []       # Heap of the times the packets held leave
+
+        # Statistics
+        self.packets = 0
+        self.bytes = 0
+        self.lost = 0        # Random loss
+        self.dropped = 0     # Queue overflow
+        self.max_held = 0
+
+    def transit(self, size):
+        """Admit a datagram of size payload bytes now; returns the time it
+        leaves the link, or None if the link loses it"""
+        now = self.sim.now
+        # Every datagram arriving takes the next fate, so a replay lines up
+        # even when the queue drops a different set
+        delay = self.impairment.fate()
+        if delay is None:
+            self.lost += 1
+            return None
+        held = self.held
+        while held and held[0] <= now:
+            heapq.heappop(held)
+        if len(held) >= self.limit:
+            self.dropped += 1
+            return None
+
+        leave = now + delay
+        if self.rate:
+            leave = max(leave, self.free_at) + (size + WIRE_OVERHEAD) / self.rate
+            self.free_at = leave
+        heapq.heappush(held, leave)
+        self.max_held = max(self.max_held, len(held))
+        self.packets += 1
+        self.bytes += size + WIRE_OVERHEAD
+        return leave
+
+class Network:
+    """Hosts joined by fixed paths of links; a datagram takes one event per
+    link and is handed to the endpoint bound to its destination address"""
+    def __init__(self, sim):
+        self.sim = sim
+        self.routes = {}      # (source IP, destination IP) -> [Link]
+        self.endpoints = {}   # (IP, port) -> Endpoint
+
+    def route(self, src_ip, dst_ip, links):
+        self.routes[(src_ip, dst_ip)] = links
+
+    def send(self, packet, src, dst):
+        self.forward(packet, src, dst, self.routes[(src[0], dst[0])], 0)
+
+    def forward(self, packet, src, dst, path, hop):
+        if hop == len(path):
+            endpoint = self.endpoints.get(dst)
+            if endpoint is not None:
+                endpoint.deliver(packet, src)
+            return
+        leave = path[hop].transit(len(packet))
+        if leave is not None:
+            self.sim.at(leave, self.forward, packet, src, dst, path, hop + 1)
+
+class Endpoint:
+    """A host's UDP socket in the simulation, with the I/O backend interface
+    the protocol objects use (see batch_io.py). Arrivals go to receiver."""
+    def __init__(self, net, addr):
+        self.net = net
+        self.addr = addr
+        self.receiver = None   # callback(packet, source address)
+        net.endpoints[addr] = self
+        self.rcvbuf = CLIENT_RCVBUF
+
+        # Drop-tail links never mark CE, so every datagram reads as not-ECT
+        self.recv_tos = True
+        self.tos = 0
+
+        self.packets_sent = 0
+        self.packets_received = 0
+
+    def send(self, packet, addr):
+        self.packets_sent += 1
+        self.net.send(packet, self.addr, addr)
+
+    def send_run(self, packets, addr):
+        for packet in packets:
+            self.send(packet, addr)
+
+    def deliver(self, packet, src):
+        self.packets_received += 1
+        self.receiver(packet, src)
+
+    def unread(self):
+        return 0   # Hosts are infinitely fast: every datagram is read on arrival
+
+    def stats(self):
+        return f"sent {self.packets_sent} packets, received {self.packets_received} packets (simulated)"
+
+class Timer:
+    """One resettable deadline per host. Moving it later (every ACK or
+    segment does) schedules nothing: the pending event re-arms itself when
+    it finds the deadline moved, so quiet periods cost the events."""
+    def __init__(self, sim, callback):
+        self.sim = sim
+        self.callback = callback
+        self.deadline = None
+        self.pending = None   # Time of the earliest scheduled event
+
+    def set(self, deadline):
+        self.deadline = deadline
+        if self.pending is None or deadline < self.pending:
+            self.pending = deadline
+            self.sim.at(deadline, self.fire, deadline)
+
+    def cancel(self):
+        self.deadline = None
+
+    def fire(self, when):
+        if when != self.pending:
+            return   # Superseded by an earlier event
+        self.pending = None
+        if self.deadline is None:
+            return
+        if self.sim.now < self.deadline:
+            self.set(self.deadline)
+            return
+        self.deadline = None
+        self.callback(self.sim.now)
+
+class ServerHost:
+    """A server's send loop (ReliableUDPServer.send_file) in virtual time:
+    one pass per ACK and per poll timeout, then the close handshake"""
+    def __init__(self, sim, server, filename=FILENAME):
+        self.sim = sim
+        self.server = server
+        self.filename = filename
+        self.client_addr = None
+        self.chunks = None
+        self.state = 'listen'
+        self.timer = Timer(sim, self.on_timer)
+        server.io.receiver = self.receive
+
+    def receive(self, packet, src):
+        server = self.server
+        now = self.sim.now
+        if self.state == 'listen':
+            if not server.is_request(packet):
+                return
+            stripe, num_stripes, server.rwnd = server.parse_request(packet)
+            self.chunks = server.build_chunks(self.filename, stripe, num_stripes, src)
+            if self.chunks is None:
+                return
+            self.client_addr = src
+            server.start_transfer(src, self.chunks, now)
+            self.state = 'sending'
+            self.loop(now)
+        elif self.state == 'sending':
+            server.process_ack(packet, now, now, self.client_addr, server.total_packets)
+            server.recover(self.client_addr, now)
+            self.loop(now)
+        elif self.state == 'closing':
+            if server.on_close_ack(packet, self.client_addr):
+                self.timer.set(now + server.linger_time())
+
+    def loop(self, now):
+        """Top of the send loop: close if everything is ACKed, else send and wait"""
+        server = self.server
+        if server.base_seq >= server.total_packets:
+            server.report()
+            server.send_close(self.client_addr, server.total_packets)
+            self.state = 'closing'
+            self.timer.set(now + server.linger_time())
+            return
+        server.transmit(self.client_addr, self.chunks, server.total_packets, now)
+        self.timer.set(now + server.poll_timeout(now))
+
+    def on_timer(self, now):
+        if self.state == 'sending':
+            self.server.recover(self.client_addr, now)
+            self.loop(now)
+        elif self.state == 'closing':
+            self.state = 'done'
+            self.server.finish_transfer(now)
+
+class ClientHost:
+    """A client's receive loop (ReliableUDPClient.receive_data) in virtual
+    time: the client's own request, receive and close steps, called as the
+    blocking loop calls them, with a timer for the socket timeouts.
+    on_done(host) is called once it is over."""
+    def __init__(self, sim, client, start=0.0, on_done=None):
+        self.sim = sim
+        self.client = client
+        self.on_done = on_done
+        self.state = 'request'
+        self.attempt = 0
+        self.request_sent = None
+        self.start = start
+        self.end = None
+        self.timer = Timer(sim, self.on_timer)
+        client.io.receiver = self.receive
+        client.start_time = start
+        sim.at(start, self.send_request)
+
+    def send_request(self):
+        self.request_sent = self.sim.now
+        self.timer.set(self.sim.now + self.client.request_attempt(self.attempt))
+
+    def receive(self, packet, src):
+        client = self.client
+        now = self.sim.now
+        if self.state == 'done':
+            return
+        handled = client.handle_packet(packet)
+        if self.state == 'request':
+            client.on_response(src, self.attempt, self.request_sent, now)
+            self.state = 'receiving'
+        elif self.state == 'receiving':
+            client.on_segments(handled, now)
+        elif client.close_received:
+            print("Connection closed")
+            self.finish(now)
+            return
+        elif client.fin_repeated():
+            self.close(now)   # The FIN again: our FIN-ACK was lost
+            return
+        else:
+            return
+
+        if client.transfer_complete():
+            print(f"All data received successfully")
+            self.state = 'closing'
+            self.close(now)
+        else:
+            self.timer.set(now + RECV_TIMEOUT)
+
+    def close(self, now):
+        """Send (or resend) the FIN-ACK, or leave once the retries are spent"""
+        if not self.client.send_fin_ack():
+            print("No CLOSE from server, exiting")
+            self.finish(now)
+            return
+        self.timer.set(now + self.client.close_interval())
+
+    def on_timer(self, now):
+        if self.state == 'request':
+            if not self.client.on_request_timeout(self.attempt):
+                self.finish(now)
+                return
+            self.attempt += 1
+            self.send_request()
+        elif self.state == 'receiving':
+            if self.client.on_recv_timeout(now):
+                self.timer.set(now + RECV_TIMEOUT)
+            else:
+                self.finish(now)
+        elif self.state == 'closing':
+            self.close(now)
+
+    def finish(self, now):
+        self.state = 'done'
+        self.timer.cancel()
+        self.end = now
+        self.client.finish_transfer(now)
+        self.client.output.close()
+        if self.on_done:
+            self.on_done(self)
+
+    def ttc(self):
+        return (self.end if self.end is not None else self.sim.now) - self.start
+
+    def verified(self):
+        """Whether the whole file arrived with the digest the server announced"""
+        client = self.client
+        return client.transfer_complete() and client.meta is not None and \
+               client.output.hexdigest() == client.meta[4].hex()
+
+def make_file(size, seed):
+    """Contents and MD5 digest of a file of size pseudo-random bytes"""
+    data = random.Random(seed).randbytes(size)
+    return data, hashlib.md5(data).digest()
+
+def start_flows(sim, net, pairs, file_cache):
+    """Server and client hosts for [(server IP, client IP, server class, kwargs)];
+    the simulation stops once every client is done"""
+    clients = []
+    done = []
+
+    def on_done(host):
+        done.append(host)
+        if len(done) == len(clients):
+            sim.stop()
+
+    servers = []
+    for server_ip, client_ip, server_class, kwargs in pairs:
+        server = server_class(server_ip, SERVER_PORT, file_cache=file_cache,
+                              io=Endpoint(net, (server_ip, SERVER_PORT)), **kwargs)
+        servers.append(ServerHost(sim, server))
+        client = ReliableUDPClient(server_ip, SERVER_PORT, io=Endpoint(net, (client_ip, CLIENT_PORT)))
+        client.output = MappedOutput()
+        clients.append(ClientHost(sim, client, on_done=on_done))
+    return servers, clients
+
+def open_trace(path):
+    """The impairment trace at path to replay, or a new one to record (also
+    when there is no path)"""
+    return ImpairmentTrace.load(path) if path and os.path.exists(path) else ImpairmentTrace()
+
+def close_trace(trace, path):
+    if path and trace.recording:
+        trace.save(path)
+
+def sender_stats(server):
+    """Retransmissions and smoothed RTT (ms) of a server, as p2_exp.py reads them from its log"""
+    retx = sum(n for path, n in server.send_counts.items() if path != 'new')
+    srtt = server.estimated_rtt * 1000 if server.estimated_rtt is not None else None
+    return retx, srtt
+
+def simulate_p1(loss=1.0, delay=20.0, jitter=0.0, size=FILE_SIZE, sws=None, seed=0, file_data=None, trace=None):
+    """One Part 1 trial (p1_exp.py's topology): server h1 and client h2 on one
+    switch, the h1 link given loss (%), delay and jitter (ms) in both
+    directions. If trace names an impairment trace the link replays it, or
+    records one there if there is none yet. Returns a row of P1_COLUMNS."""
+    cpu = time.process_time()
+    sim = Simulator(seed)
+    net = Network(sim)
+    h1, h2 = '10.0.0.1', '10.0.0.2'
+    impairments = open_trace(trace)
+    for name, src, dst in (('data', h1, h2), ('ack', h2, h1)):
+        impairment = impairments.impairment(name, loss, delay / 1000, jitter / 1000, sim.random, seed)
+        net.route(src, dst, [Link(sim, impairment=impairment)])
+
+    file_cache = {FILENAME: file_data or make_file(size, seed)}
+    (server,), (client,) = start_flows(sim, net, [(h1, h2, ReliableUDPServer, {'sws': sws})],
+                                       file_cache)
+    sim.run()
+    close_trace(impairments, trace)
+
+    retx, srtt = sender_stats(server.server)
+    return dict(seed=seed, loss=loss, delay=delay, jitter=jitter, md5_ok=client.verified(),
+                ttc=round(client.ttc(), 6), retx=retx, srtt_ms=srtt and round(srtt, 3),
+                cpu_s=round(time.process_time() - cpu, 3))
+
+def simulate_dumbbell(bw=100.0, loss=0.0, delay_c2_ms=5.0, buffer_size=420, size=FILE_SIZE, seed=0,
+                      file_data=None, trace=None):
+    """One Part 2 trial (p2_exp.py's DumbbellTopo): s1 -> c1 and s2 -> c2 over
+    the sw2 - sw1 bottleneck of bw Mbps, 10 ms, loss (%) and a drop-tail
+    queue of buffer_size packets; 5 ms access links, c2's of delay_c2_ms.
+    Each server runs congestion control with its own manager, as the separate
+    server processes do. The bottleneck's impairments replay or record a
+    trace as in simulate_p1. Returns a row of P2_COLUMNS."""
+    cpu = time.process_time()
+    sim = Simulator(seed)
+    net = Network(sim)
+    c1, c2, s1, s2 = '10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.4'
+
+    def access(delay_ms):
+        return Link(sim, delay=delay_ms / 1000), Link(sim, delay=delay_ms / 1000)
+
+    c1_up, c1_down = access(5)
+    c2_up, c2_down = access(delay_c2_ms)
+    s1_up, s1_down = access(5)
+    s2_up, s2_down = access(5)
+    impairments = open_trace(trace)
+    forward = Link(sim, bw=bw, limit=buffer_size,   # sw2 -> sw1
+                   impairment=impairments.impairment('data', loss, 0.010, 0.0, sim.random, seed))
+    reverse = Link(sim, bw=bw, limit=buffer_size,   # sw1 -> sw2
+                   impairment=impairments.impairment('ack', loss, 0.010, 0.0, sim.random, seed))
+    net.route(s1, c1, [s1_up, forward, c1_down])
+    net.route(c1, s1, [c1_up, reverse, s1_down])
+    net.route(s2, c2, [s2_up, forward, c2_down])
+    net.route(c2, s2, [c2_up, reverse, s2_down])
+
+    file_cache = {FILENAME: file_data or make_file(size, seed)}
+    servers, clients = start_flows(sim, net, [
+        (s1, c1, CongestionControlledServer, {'manager': CongestionManager(rng=sim.random)}),
+        (s2, c2, CongestionControlledServer, {'manager': CongestionManager(rng=sim.random)})], file_cache)
+    sim.run()
+    close_trace(impairments, trace)
+
+    size = len(file_cache[FILENAME][0])
+    ttc1, ttc2 = (max(client.ttc(), 1e-9) for client in clients)
+    thr1, thr2 = size * 8 / (ttc1 * 1e6), size * 8 / (ttc2 * 1e6)
+    # As p2_exp.py: JFI of the two clients' completion rates
+    jfi = (1 / ttc1 + 1 / ttc2) ** 2 / (2 * ((1 / ttc1) ** 2 + (1 / ttc2) ** 2))
+    (retx1, srtt1), (retx2, srtt2) = (sender_stats(server.server) for server in servers)
+    return dict(seed=seed, bw=bw, loss=loss, delay_c2_ms=delay_c2_ms, buffer_size=buffer_size,
+                md5_ok=all(client.verified() for client in clients),
+                ttc1=round(ttc1, 6), ttc2=round(ttc2, 6), thr1_mbps=round(thr1, 6), thr2_mbps=round(thr2, 6),
+                link_util=round((thr1 + thr2) / bw, 6), jfi=round(jfi, 6), retx1=retx1, retx2=retx2,
+                srtt1_ms=srtt1 and round(srtt1, 3), srtt2_ms=srtt2 and round(srtt2, 3),
+                queue_max_pkts=forward.max_held, queue_drops=forward.dropped,
+                cpu_s=round(time.process_time() - cpu, 3))
+
+def binomial(rng, n, p):
+    """How many of n segments a loss rate p takes: geometric gaps between
+    losses, so the cost follows the losses rather than n"""
+    if p <= 0:
+        return 0
+    if p >= 1:
+        return n
+    lost = 0
+    position = 0
+    log_keep = math.log(1 - p)
+    while True:
+        position += int(math.log(1 - rng.random()) / log_keep) + 1
+        if position > n:
+            return lost
+        lost += 1
+
+class FluidBottleneck:
+    """The dumbbell's sw2 -> sw1 link for batches: random loss, then a
+    tail-drop limit on the segments held (netem counts its delay line too,
+    as Link does), then the rate limiter. Batches arriving at one instant
+    share the room in proportion, as their segments would interleave."""
+    def __init__(self, sim, bw, loss, delay, limit):
+        self.sim = sim
+        self.tx_time = (MAX_PACKET_SIZE + WIRE_OVERHEAD) / (bw * 1e6 / 8)
+        self.loss = loss / 100
+        self.delay = delay
+        self.limit = limit
+        self.free_at = 0.0
+        self.held = collections.deque()   # (first leave, last leave, segments), in leave order
+        self.offers = []                  # This instant's (segments, callback, args)
+        self.lost = 0
+        self.dropped = 0
+        self.max_held = 0
+
+    def offer(self, count, callback, *args):
+        """A batch of count segments arrives now; callback(admitted, last
+        leave time or None, *args) once the instant's arrivals are sorted out"""
+        if not self.offers:
+            self.sim.at(self.sim.now, self.admit)
+        self.offers.append((count, callback, args))
+
+    def holding(self, now):
+        """Segments still held, counting a batch's segments as they leave"""
+        held = self.held
+        while held and held[0][1] <= now:
+            held.popleft()
+        total = 0
+        for first, last, count in held:
+            if now < first:
+                total += count
+            else:
+                total += math.ceil(count * (last - now) / (last - first + self.tx_time))
+        return total
+
+    def admit(self):
+        now = self.sim.now
+        offers, self.offers = self.offers, []
+        arriving = []
+        for count, _, _ in offers:
+            lost = binomial(self.sim.random, count, self.loss)
+            self.lost += lost
+            arriving.append(count - lost)
+        total = sum(arriving)
+        room = max(self.limit - self.holding(now), 0)
+        if total > room:
+            # Shares of the room, the remainder to the largest fractions
+            shares = [n * room / total for n in arriving]
+            admitted = [int(share) for share in shares]
+            by_fraction = sorted(range(len(shares)), key=lambda i: admitted[i] - shares[i])
+            for i in by_fraction[:room - sum(admitted)]:
+                admitted[i] += 1
+        else:
+            admitted = arriving
+        self.dropped += total - sum(admitted)
+
+        leave = None
+        if sum(admitted):
+            first = max(now + self.delay, self.free_at) + self.tx_time
+            leave = first + (sum(admitted) - 1) * self.tx_time
+            self.free_at = leave
+            self.held.append((first, leave, sum(admitted)))
+            self.max_held = max(self.max_held, self.holding(now))
+        for (_, callback, args), n in zip(offers, admitted):
+            callback(n, leave if n else None, *args)
+
+class FluidFlow:
+    """One saturated sender on the fluid path: every step it sends what its
+    BBR's pacing rate and window allow as one batch, which BBR sees sent and
+    delivered as a unit. Losses leave flight when the batch is ACKed, and are
+    sent again first."""
+    def __init__(self, sim, bottleneck, access, ack_path, step=FLUID_STEP):
+        self.sim = sim
+        self.bottleneck = bottleneck
+        self.access = access        # Server to bottleneck, one way
+        self.ack_path = ack_path    # Bottleneck exit to client and back to the server
+        self.step = step
+        self.cc = BBR(sim.random)
+        self.credit = 0.0
+        self.inflight = 0
+        self.to_resend = 0
+        self.batches = 0
+        self.delivered = 0
+        self.retx = 0
+        self.srtt = None
+        sim.at(0.0, self.tick)
+
+    def tick(self):
+        now = self.sim.now
+        cc = self.cc
+        # Pacing credit for one step, never hoarded beyond it while the window is full
+        self.credit = min(self.credit + cc.pacing_rate * self.step, max(cc.pacing_rate * self.step, 1))
+        count = min(int(self.credit), int(cc.cwnd) - self.inflight)
+        if count > 0:
+            self.credit -= count
+            self.batches += 1
+            batch = self.batches
+            cc.on_send(batch, now, self.inflight, False)
+            self.inflight += count
+            resent = min(count, self.to_resend)
+            self.to_resend -= resent
+            self.retx += resent
+            self.sim.at(now + self.access, self.arrive, batch, count, now)
+        self.sim.at(now + self.step, self.tick)
+
+    def arrive(self, batch, count, sent):
+        self.bottleneck.offer(count, self.leave, batch, count, sent)
+
+    def leave(self, admitted, leave, batch, count, sent):
+        if leave is None:
+            leave = self.sim.now   # All lost: the next ACKs show it about an RTT after sending
+        self.sim.at(leave + self.ack_path, self.acked, batch, count, admitted, sent)
+
+    def acked(self, batch, count, admitted, sent):
+        now = self.sim.now
+        rtt = now - sent
+        self.srtt = rtt if self.srtt is None else self.srtt + (rtt - self.srtt) / 8
+        self.inflight -= count
+        self.to_resend += count - admitted
+        self.delivered += admitted
+        if admitted:
+            self.cc.on_delivered(batch, now, rtt, admitted)
+        else:
+            self.cc.tx.pop(batch, None)
+        self.cc.on_ack(now, self.inflight)
+
+def simulate_fluid(bw=1000.0, loss=0.0, delay_c2_ms=5.0, buffer_size=420, duration=60.0, seed=0,
+                   step=FLUID_STEP):
+    """The dumbbell of simulate_dumbbell on the fluid path: both flows
+    saturate the bottleneck for duration seconds. Goodput, queue and
+    fairness come out as in a Part 2 trial. Returns a row of FLUID_COLUMNS."""
+    cpu = time.process_time()
+    sim = Simulator(seed)
+    bottleneck = FluidBottleneck(sim, bw, loss, 0.010, buffer_size)
+    # Server access (5 ms) up to the bottleneck; after it the client's access
+    # link down, and the ACK back over the client's, the reverse bottleneck's
+    # 10 ms and the server's access link
+    flows = [FluidFlow(sim, bottleneck, 0.005, 2 * client_ms / 1000 + 0.010 + 0.005, step)
+             for client_ms in (5.0, delay_c2_ms)]
+    sim.run(until=duration)
+
+    thr1, thr2 = (flow.delivered * MSS * 8 / (duration * 1e6) for flow in flows)
+    jfi = (thr1 + thr2) ** 2 / (2 * (thr1 ** 2 + thr2 ** 2)) if thr1 + thr2 else 1.0
+    flow1, flow2 = flows
+    return dict(seed=seed, bw=bw, loss=loss, delay_c2_ms=delay_c2_ms, buffer_size=buffer_size,
+                duration=duration, thr1_mbps=round(thr1, 6), thr2_mbps=round(thr2, 6),
+                link_util=round((thr1 + thr2) / bw, 6), jfi=round(jfi, 6),
+                retx1=flow1.retx, retx2=flow2.retx,
+                srtt1_ms=round(flow1.srtt * 1000, 3), srtt2_ms=round(flow2.srtt * 1000, 3),
+                queue_max_pkts=bottleneck.max_held, queue_drops=bottleneck.dropped,
+                cpu_s=round(time.process_time() - cpu, 3))
+
+def number_list(text):
+    """'1,2,3' -> [1.0, 2.0, 3.0]"""
+    return [float(value) for value in text.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the experiments' transfers in a deterministic discrete-event simulation. "
+                    "Every numeric option takes a comma-separated list; the sweep covers all combinations.")
+    parser.add_argument('topology', choices=('p1', 'dumbbell', 'fluid'),
+                        help="p1: Part 1's single impaired link; dumbbell: Part 2's two flows over a bottleneck; "
+                             "fluid: the dumbbell's flows kept saturated, on the fluid fast path")
+    parser.add_argument('--loss', type=number_list, help="loss rate in %% (default 1 for p1, 0 for dumbbell)")
+    parser.add_argument('--delay', type=number_list, default=[20.0], help="p1: link delay in ms (default 20)")
+    parser.add_argument('--jitter', type=number_list, default=[0.0], help="p1: link jitter in ms (default 0)")
+    parser.add_argument('--bw', type=number_list, default=[100.0], help="dumbbell: bottleneck Mbps (default 100)")
+    parser.add_argument('--delay-c2', type=number_list, default=[5.0],
+                        help="dumbbell: client 2's access delay in ms (default 5)")
+    parser.add_argument('--buffer', type=number_list, default=[420.0],
+                        help="dumbbell: bottleneck queue in packets (default 420)")
+    parser.add_argument('--duration', type=number_list, default=[60.0],
+                        help="fluid: seconds to run (default 60)")
+    parser.add_argument('--size', type=int, default=FILE_SIZE, help=f"file size in bytes (default {FILE_SIZE})")
+    parser.add_argument('--file', help="transfer this file instead of pseudo-random bytes")
+    parser.add_argument('--seeds', type=int, default=1, help="seeds 0..N-1 per grid point (default 1)")
+    parser.add_argument('--seed', type=int, default=0, help="first seed (default 0)")
+    parser.add_argument('--traces',
+                        help="directory of impairment traces, one per trial: replay a trial's trace if it "
+                             "is there, otherwise record it (see impairment.py)")
+    parser.add_argument('--out', help="also write the rows to this CSV")
+    parser.add_argument('--verbose', action='store_true', help="show the protocol's own output")
+    args = parser.parse_args()
+
+    file_data = None
+    if args.file:
+        with open(args.file, 'rb') as f:
+            data = f.read()
+        file_data = (data, hashlib.md5(data).digest())
+
+    seeds = range(args.seed, args.seed + args.seeds)
+    if args.topology == 'p1':
+        columns = P1_COLUMNS
+        grid = [dict(loss=loss, delay=delay, jitter=jitter, seed=seed) for loss, delay, jitter, seed in
+                itertools.product(args.loss or [1.0], args.delay, args.jitter, seeds)]
+        trial = simulate_p1
+    elif args.topology == 'fluid':
+        columns = FLUID_COLUMNS
+        grid = [dict(bw=bw, loss=loss, delay_c2_ms=delay, buffer_size=int(buffer), duration=duration, seed=seed)
+                for bw, loss, delay, buffer, duration, seed in
+                itertools.product(args.bw, args.loss or [0.0], args.delay_c2, args.buffer, args.duration, seeds)]
+        trial = simulate_fluid
+    else:
+        columns = P2_COLUMNS
+        grid = [dict(bw=bw, loss=loss, delay_c2_ms=delay, buffer_size=int(buffer), seed=seed)
+                for bw, loss, delay, buffer, seed in
+                itertools.product(args.bw, args.loss or [0.0], args.delay_c2, args.buffer, seeds)]
+        trial = simulate_dumbbell
+
+    if args.traces:
+        if args.topology == 'fluid':
+            parser.error("the fluid path has no per-segment fates to trace")
+        os.makedirs(args.traces, exist_ok=True)
+
+    out = open(args.out, 'w') if args.out else None
+    lines = [','.join(columns)]
+    print(lines[0], flush=True)
+    for params in grid:
+        kwargs = dict(params)
+        if args.topology != 'fluid':
+            trace = None
+            if args.traces:
+                trace = trace_path(args.traces, params['seed'],
+                                   **{k: v for k, v in params.items() if k != 'seed'})
+            kwargs.update(size=args.size, file_data=file_data, trace=trace)
+        if args.verbose:
+            row = trial(**kwargs)
+        else:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                row = trial(**kwargs)
+        lines.append(','.join(str(row[c]) for c in columns))
+        print(lines[-1], flush=True)
+    if out:
+        out.write('\n'.join(lines) + '\n')
+        out.close()
+
+if __name__ == '__main__':
+    main()
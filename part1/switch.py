@@ -13,14 +13,95 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import os
+import re
+import struct
+import time
+
 from ryu.base import app_manager
 from ryu.controller import ofp_event
-from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet
-from ryu.lib.packet import ethernet
+from ryu.lib import addrconv
+from ryu.lib import hub
 from ryu.lib.packet import ether_types
+# Ryu runs on eventlet: its subprocess waits on the child's pipe without
+# blocking the hub, so OpenFlow handling goes on while `tc` runs
+from eventlet.green import subprocess
+
+# Proactive mode: the experiment harness writes {dpid: {host MAC: port}} here
+# before starting the network, and every switch that connects gets its whole
+# forwarding table at once, so data packets never reach the controller.
+# Switches missing from the file fall back to reactive learning.
+TOPOLOGY_FILE = os.environ.get('SWITCH_TOPOLOGY', '/tmp/switch_topology.json')
+
+# Set SWITCH_LOG_PACKETS=1 to log every packet-in at INFO (slow; off by default)
+LOG_PACKETS = os.environ.get('SWITCH_LOG_PACKETS') == '1'
+
+PROACTIVE_PRIORITY = 2
+LEARNED_PRIORITY = 1
+LEARNED_IDLE_TIMEOUT = 60   # Seconds; stale MACs from an earlier network age out
+BROADCAST = 'ff:ff:ff:ff:ff:ff'
+
+# Statistics (off by default): every SWITCH_STATS_INTERVAL seconds sample each
+# switch and write the counters to a CSV timeseries for the harness, started
+# afresh each time the controller starts:
+#   time,dpid,kind,key,bytes,packets,dropped,backlog_bytes,backlog_packets
+#   port   key port number: OpenFlow tx counters (what left through the port)
+#   queue  key port:queue id: OpenFlow queue tx counters (dropped = tx_errors)
+#   flow   key destination MAC: byte/packet count of that forwarding flow
+#   qdisc  key port number: the port's root tc qdisc, i.e. the egress queue
+#          Mininet shapes links with; the only source of queue occupancy, as
+#          OpenFlow queue stats carry none
+STATS_FILE = os.environ.get('SWITCH_STATS', '/tmp/switch_stats.csv')
+STATS_INTERVAL = float(os.environ.get('SWITCH_STATS_INTERVAL', '0'))
+QDISC_TIMEOUT = 1.0   # Seconds a `tc` sample may take before it is abandoned
+STATS_HEADER = "time,dpid,kind,key,bytes,packets,dropped,backlog_bytes,backlog_packets\n"
+
+QDISC_ROOT = re.compile(r"qdisc \S+ \S+ dev (\S+) root")
+QDISC_SENT = re.compile(r"Sent (\d+) bytes (\d+) pkt \(dropped (\d+)")
+QDISC_BACKLOG = re.compile(r"backlog (\d+)([KMG]?)b (\d+)p")
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def load_topology(path=TOPOLOGY_FILE):
+    """dpid -> {mac: port} from the harness' topology file, or {} if there is none"""
+    try:
+        with open(path) as f:
+            raw = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {int(dpid): {mac: int(port) for mac, port in hosts.items()}
+            for dpid, hosts in raw.items()}
+
+
+def read_qdiscs():
+    """{interface: (sent bytes, sent packets, drops, backlog bytes, backlog
+    packets)} of every root qdisc, from `tc -s qdisc show`"""
+    try:
+        proc = subprocess.Popen(['tc', '-s', 'qdisc', 'show'], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return {}
+    try:
+        out, _ = proc.communicate(timeout=QDISC_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        return {}
+    qdiscs = {}
+    # One block per qdisc: header line, then indented statistics lines
+    for block in re.split(r"\n(?=qdisc )", out):
+        root = QDISC_ROOT.match(block)
+        sent = QDISC_SENT.search(block)
+        backlog = QDISC_BACKLOG.search(block)
+        if root and sent and backlog:
+            qdiscs[root.group(1)] = (int(sent.group(1)), int(sent.group(2)), int(sent.group(3)),
+                                     int(backlog.group(1)) * SIZE_UNITS[backlog.group(2)],
+                                     int(backlog.group(3)))
+    return qdiscs
 
 
 class SimpleSwitch13(app_manager.RyuApp):
@@ -29,6 +110,95 @@ class SimpleSwitch13(app_manager.RyuApp):
     def __init__(self, *args, **kwargs):
         super(SimpleSwitch13, self).__init__(*args, **kwargs)
         self.mac_to_port = {}
+        # Statistics polling state: connected switches and their port names
+        self.datapaths = {}
+        self.port_names = {}   # interface name -> (dpid, port number)
+        if STATS_INTERVAL > 0:
+            # A new controller is a new run: drop an earlier run's samples
+            with open(STATS_FILE, 'w') as f:
+                f.write(STATS_HEADER)
+            self.monitor_thread = hub.spawn(self._monitor)
+            self.qdisc_thread = hub.spawn(self._sample_qdiscs)
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER, DEAD_DISPATCHER])
+    def _state_change_handler(self, ev):
+        datapath = ev.datapath
+        if ev.state == MAIN_DISPATCHER:
+            self.datapaths[datapath.id] = datapath
+            datapath.send_msg(datapath.ofproto_parser.OFPPortDescStatsRequest(datapath, 0))
+        elif ev.state == DEAD_DISPATCHER and datapath.id in self.datapaths:
+            del self.datapaths[datapath.id]
+            self.port_names = {name: where for name, where in self.port_names.items()
+                               if where[0] != datapath.id}
+
+    @set_ev_cls(ofp_event.EventOFPPortDescStatsReply, MAIN_DISPATCHER)
+    def _port_desc_reply_handler(self, ev):
+        dpid = ev.msg.datapath.id
+        for port in ev.msg.body:
+            if port.port_no <= ev.msg.datapath.ofproto.OFPP_MAX:
+                name = port.name.decode() if isinstance(port.name, bytes) else port.name
+                self.port_names[name] = (dpid, port.port_no)
+
+    def _monitor(self):
+        while True:
+            for datapath in list(self.datapaths.values()):
+                self.request_stats(datapath)
+            hub.sleep(STATS_INTERVAL)
+
+    def _sample_qdiscs(self):
+        # Separate from _monitor, so a slow `tc` never delays the OpenFlow requests
+        while True:
+            if self.port_names:
+                self.record_qdiscs()
+            hub.sleep(STATS_INTERVAL)
+
+    def request_stats(self, datapath):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        datapath.send_msg(parser.OFPPortStatsRequest(datapath, 0, ofproto.OFPP_ANY))
+        datapath.send_msg(parser.OFPQueueStatsRequest(datapath, 0, ofproto.OFPP_ANY,
+                                                      ofproto.OFPQ_ALL))
+        datapath.send_msg(parser.OFPFlowStatsRequest(datapath))
+
+    def record_stats(self, rows):
+        # Append-only, so the harness may truncate the file between trials
+        with open(STATS_FILE, 'a') as f:
+            f.writelines(rows)
+
+    def record_qdiscs(self):
+        now = time.time()
+        self.record_stats(
+            f"{now:.6f},{self.port_names[dev][0]},qdisc,{self.port_names[dev][1]},"
+            f"{sent},{pkts},{drops},{backlog},{backlog_pkts}\n"
+            for dev, (sent, pkts, drops, backlog, backlog_pkts) in read_qdiscs().items()
+            if dev in self.port_names)
+
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    def _port_stats_reply_handler(self, ev):
+        now = time.time()
+        datapath = ev.msg.datapath
+        self.record_stats(
+            f"{now:.6f},{datapath.id},port,{stat.port_no},{stat.tx_bytes},{stat.tx_packets},"
+            f"{stat.tx_dropped},0,0\n"
+            for stat in ev.msg.body if stat.port_no <= datapath.ofproto.OFPP_MAX)
+
+    @set_ev_cls(ofp_event.EventOFPQueueStatsReply, MAIN_DISPATCHER)
+    def _queue_stats_reply_handler(self, ev):
+        now = time.time()
+        dpid = ev.msg.datapath.id
+        self.record_stats(
+            f"{now:.6f},{dpid},queue,{stat.port_no}:{stat.queue_id},{stat.tx_bytes},"
+            f"{stat.tx_packets},{stat.tx_errors},0,0\n"
+            for stat in ev.msg.body)
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def _flow_stats_reply_handler(self, ev):
+        now = time.time()
+        dpid = ev.msg.datapath.id
+        self.record_stats(
+            f"{now:.6f},{dpid},flow,{stat.match['eth_dst']},{stat.byte_count},"
+            f"{stat.packet_count},0,0,0\n"
+            for stat in ev.msg.body if 'eth_dst' in stat.match)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
@@ -48,20 +218,52 @@ class SimpleSwitch13(app_manager.RyuApp):
                                           ofproto.OFPCML_NO_BUFFER)]
         self.add_flow(datapath, 0, match, actions)
 
-    def add_flow(self, datapath, priority, match, actions, buffer_id=None):
+        # The topology file is re-read per switch: the harness rewrites it for
+        # every network it builds
+        hosts = load_topology().get(datapath.id)
+        if hosts:
+            self.install_proactive(datapath, hosts)
+
+    def install_proactive(self, datapath, hosts):
+        """Install forwarding to every known host, plus broadcast flooding (the
+        topologies are trees), as one batch closed by a barrier"""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        dpid = format(datapath.id, "d").zfill(16)
+        self.mac_to_port[dpid] = dict(hosts)
+
+        mods = [self.flow_mod(datapath, PROACTIVE_PRIORITY,
+                              parser.OFPMatch(eth_dst=mac),
+                              [parser.OFPActionOutput(port)])
+                for mac, port in hosts.items()]
+        mods.append(self.flow_mod(datapath, PROACTIVE_PRIORITY,
+                                  parser.OFPMatch(eth_dst=BROADCAST),
+                                  [parser.OFPActionOutput(ofproto.OFPP_FLOOD)]))
+        for mod in mods:
+            datapath.send_msg(mod)
+        datapath.send_msg(parser.OFPBarrierRequest(datapath))
+        self.logger.info("switch %s: installed %d proactive flows", dpid, len(mods))
+
+    def flow_mod(self, datapath, priority, match, actions, buffer_id=None,
+                 idle_timeout=0):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
         inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
                                              actions)]
         if buffer_id:
-            mod = parser.OFPFlowMod(datapath=datapath, buffer_id=buffer_id,
-                                    priority=priority, match=match,
-                                    instructions=inst)
-        else:
-            mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
-                                    match=match, instructions=inst)
-        datapath.send_msg(mod)
+            return parser.OFPFlowMod(datapath=datapath, buffer_id=buffer_id,
+                                     priority=priority, match=match,
+                                     instructions=inst,
+                                     idle_timeout=idle_timeout)
+        return parser.OFPFlowMod(datapath=datapath, priority=priority,
+                                 match=match, instructions=inst,
+                                 idle_timeout=idle_timeout)
+
+    def add_flow(self, datapath, priority, match, actions, buffer_id=None,
+                 idle_timeout=0):
+        datapath.send_msg(self.flow_mod(datapath, priority, match, actions,
+                                        buffer_id, idle_timeout))
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
@@ -76,19 +278,22 @@ class SimpleSwitch13(app_manager.RyuApp):
         parser = datapath.ofproto_parser
         in_port = msg.match['in_port']
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
-
-        if eth.ethertype == ether_types.ETH_TYPE_LLDP:
+        # Only the Ethernet header matters here; read it directly rather than
+        # parsing the whole packet
+        if len(msg.data) < 14:
+            return
+        ethertype, = struct.unpack_from('!H', msg.data, 12)
+        if ethertype == ether_types.ETH_TYPE_LLDP:
             # ignore lldp packet
             return
-        dst = eth.dst
-        src = eth.src
+        dst = addrconv.mac.bin_to_text(msg.data[0:6])
+        src = addrconv.mac.bin_to_text(msg.data[6:12])
 
         dpid = format(datapath.id, "d").zfill(16)
         self.mac_to_port.setdefault(dpid, {})
 
-        self.logger.info("packet in %s %s %s %s", dpid, src, dst, in_port)
+        if LOG_PACKETS:
+            self.logger.info("packet in %s %s %s %s", dpid, src, dst, in_port)
 
         # learn a mac address to avoid FLOOD next time.
         self.mac_to_port[dpid][src] = in_port
@@ -106,10 +311,12 @@ class SimpleSwitch13(app_manager.RyuApp):
             # verify if we have a valid buffer_id, if yes avoid to send both
             # flow_mod & packet_out
             if msg.buffer_id != ofproto.OFP_NO_BUFFER:
-                self.add_flow(datapath, 1, match, actions, msg.buffer_id)
+                self.add_flow(datapath, LEARNED_PRIORITY, match, actions, msg.buffer_id,
+                              idle_timeout=LEARNED_IDLE_TIMEOUT)
                 return
             else:
-                self.add_flow(datapath, 1, match, actions)
+                self.add_flow(datapath, LEARNED_PRIORITY, match, actions,
+                              idle_timeout=LEARNED_IDLE_TIMEOUT)
         data = None
         if msg.buffer_id == ofproto.OFP_NO_BUFFER:
             data = msg.data
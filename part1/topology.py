@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+import os
+import json
+
+# Network plumbing shared by both experiment harnesses (p1_exp.py, p2_exp.py).
+# Nothing here imports Mininet: it works on the Mininet objects it is handed.
+
+# Host locations for the controller's proactive mode (see switch.py)
+SWITCH_TOPOLOGY = os.environ.get('SWITCH_TOPOLOGY', '/tmp/switch_topology.json')
+
+def write_switch_topology(net, path=SWITCH_TOPOLOGY):
+    """Tell the controller (switch.py) where every host is before the switches
+    connect, so it can install all forwarding flows up front:
+    {dpid: {host MAC: output port}}, following the (tree) topology"""
+    topo = net.topo
+    neighbors = {}
+    for a, b in topo.links():
+        neighbors.setdefault(a, []).append(b)
+        neighbors.setdefault(b, []).append(a)
+
+    table = {}
+    for sw in net.switches:
+        # BFS from the switch, remembering the first hop each node is reached through
+        first_hop = {n: n for n in neighbors.get(sw.name, [])}
+        queue = list(first_hop)
+        while queue:
+            node = queue.pop(0)
+            for nxt in neighbors.get(node, []):
+                if nxt != sw.name and nxt not in first_hop:
+                    first_hop[nxt] = first_hop[node]
+                    queue.append(nxt)
+        ports = {}
+        for host in net.hosts:
+            if host.name in first_hop:
+                port, _ = topo.port(sw.name, first_hop[host.name])
+                ports[host.MAC()] = port
+        table[str(int(sw.dpid, 16))] = ports
+
+    with open(path, 'w') as f:
+        json.dump(table, f)
+
+def reshape_network(net, topo):
+    """Give the running net topo's link parameters (same nodes and links),
+    reconfiguring only the links that changed: TCIntf.config rewrites their
+    tc qdiscs in place, far cheaper than a new network per trial"""
+    for link in net.links:
+        a, b = link.intf1.node.name, link.intf2.node.name
+        params = topo.linkInfo(a, b)
+        if params != net.topo.linkInfo(a, b):
+            tc_params = {k: v for k, v in params.items() if k not in ('node1', 'node2', 'port1', 'port2')}
+            link.intf1.config(**tc_params)
+            link.intf2.config(**tc_params)
+    net.topo = topo
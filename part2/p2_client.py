@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+import sys
+import os
+import argparse
+
+# Part 2 builds on the Part 1 reliable transfer protocol
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'part1'))
+
+from p1_client import ReliableUDPClient, receive_striped
+
+def main():
+    parser = argparse.ArgumentParser(usage="python3 p2_client.py <SERVER_IP> <SERVER_PORT> <PREF_FILENAME> [NUM_FLOWS] [--batch-io]")
+    parser.add_argument('server_ip')
+    parser.add_argument('server_port', type=int)
+    parser.add_argument('pref_filename')
+    parser.add_argument('num_flows', nargs='?', type=int, default=1)
+    parser.add_argument('--batch-io', action='store_true',
+                        help="receive with UDP GRO batches (Linux), falling back to per-packet I/O")
+    args = parser.parse_args()
+    
+    output_file = f"{args.pref_filename}received_data.txt"
+    
+    if args.num_flows > 1:
+        if not receive_striped(args.server_ip, args.server_port, output_file, args.num_flows, args.batch_io):
+            print("File transfer failed")
+            sys.exit(1)
+        return
+    
+    client = ReliableUDPClient(args.server_ip, args.server_port, batch_io=args.batch_io)
+    client.output_file = output_file
+    client.run()
+
+if __name__ == "__main__":
+    main()
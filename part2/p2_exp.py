@@ -11,12 +11,64 @@ import hashlib
 import shutil
 import tempfile
 
+# The result store and the network helpers are shared with part 1
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'part1'))
+
+from results import ResultStore
+from topology import write_switch_topology, reshape_network
+
 
 RTT_MS = 40         
 MSS_BYTES = 1200        
 
+# The controller's port/queue/flow statistics timeseries (see switch.py); only
+# recorded if the controller runs with SWITCH_STATS_INTERVAL set, e.g. 0.1
+SWITCH_STATS = os.environ.get('SWITCH_STATS', '/tmp/switch_stats.csv')
+SWITCH_STATS_HEADER = "time,dpid,kind,key,bytes,packets,dropped,backlog_bytes,backlog_packets\n"
+
+# Completed trials of every experiment (see results.py); the per-experiment
+# CSVs are exported from it
+RESULTS_FILE = os.environ.get('RESULTS_FILE', 'p2_results.jsonl')
+RESULT_COLUMNS = ['bw', 'loss', 'delay_c2_ms', 'udp_off_mean', 'iter', 'md5_hash_1', 'md5_hash_2',
+                  'ttc1', 'ttc2', 'size1_bytes', 'size2_bytes', 'thr1_mbps', 'thr2_mbps', 'link_util',
+                  'jfi', 'streams', 'stream_jfi', 'aqm', 'retx1', 'retx2', 'srtt1_ms', 'srtt2_ms',
+                  'ce1', 'ce2', 'sw_util', 'queue_avg_pkts', 'queue_max_pkts', 'queue_drops',
+                  'sw_bytes1', 'sw_bytes2', 'udp_mbps', 'udp_rx_mbps', 'udp_loss', 'udp_jitter_ms']
+# Metrics each grid point is sampled until their confidence intervals converge
+RESULT_METRICS = ('link_util', 'jfi')
+
+CONTROLLER_IP = '127.0.0.1'
+CONTROLLER_PORT = 6653
+
+# Running networks, one per topology class, reused across trials (see get_network)
+NETWORKS = {}
+# The background UDP source's per-ON-period log of the load it actually offered
+UDP_LOAD_LOG = '/tmp/s3_udp_load.csv'
+# ...and its receiver's timeseries of what got through (see udp_client.py)
+UDP_SINK_LOG = '/tmp/c3_udp_sink.csv'
+
+# Everything a trial may start on the hosts; killed before the next one
+TRIAL_PROCESSES = ('p2_server.py', 'p2_client.py', 'udp_server.py', 'udp_client.py')
+
+# Bottleneck queue disciplines: plain tail drop, RED dropping early, or RED
+# marking ECN-capable packets CE instead of dropping them
+AQM_MODES = ('droptail', 'red', 'ecn')
+
+
+def server_opts(aqm):
+    """Server options for the bottleneck queue: senders are ECN-capable only
+    behind the marking queue, so every other trial runs without ECN"""
+    return ' --ecn' if aqm == 'ecn' else ''
+
+
+def bottleneck_opts(aqm):
+    """TCLink options for the bottleneck queue discipline"""
+    if aqm not in AQM_MODES:
+        raise ValueError(f"unknown AQM mode {aqm}, expected one of {AQM_MODES}")
+    return {'enable_red': aqm == 'red', 'enable_ecn': aqm == 'ecn'}
+
 class DumbbellTopo(Topo):
-    def build(self, delay_c2_sw1='5ms', bw=100, loss=0, buffer_size=420):
+    def build(self, delay_c2_sw1='5ms', bw=100, loss=0, buffer_size=420, aqm='droptail'):
         # Create hosts: two TCP clients/servers 
         c1 = self.addHost('c1')
         c2 = self.addHost('c2')
@@ -39,13 +91,14 @@ class DumbbellTopo(Topo):
         self.addLink(s2, sw2, delay='5ms')
 
         # Link between sw1 and sw2 (bottleneck link): set bw, loss, queue size, and one-way delay
-        self.addLink(sw1, sw2, bw=bw, delay='10ms', loss=loss, max_queue_size=buffer_size)
+        self.addLink(sw1, sw2, bw=bw, delay='10ms', loss=loss, max_queue_size=buffer_size,
+                     **bottleneck_opts(aqm))
 
-        print(f"[topo] bottleneck bw={bw} Mbps, loss={loss}%, buffer={buffer_size} pkts, bot_delay=10ms")
+        print(f"[topo] bottleneck bw={bw} Mbps, loss={loss}%, buffer={buffer_size} pkts, aqm={aqm}, bot_delay=10ms")
 
 
 class DumbbellTopoWithUDP(Topo):
-    def build(self, delay_c2_sw1='5ms', bw=100, loss=0, buffer_size=420):
+    def build(self, delay_c2_sw1='5ms', bw=100, loss=0, buffer_size=420, aqm='droptail'):
         # Create hosts: two TCP clients/servers plus an extra client/server pair for UDP background
         c1 = self.addHost('c1')
         c2 = self.addHost('c2')
@@ -75,11 +128,108 @@ class DumbbellTopoWithUDP(Topo):
         self.addLink(s3, sw2, delay='5ms')
 
         # Link between sw1 and sw2 (bottleneck link): set bw, loss, queue size, and one-way delay
-        self.addLink(sw1, sw2, bw=bw, delay='10ms', loss=loss, max_queue_size=buffer_size)
+        self.addLink(sw1, sw2, bw=bw, delay='10ms', loss=loss, max_queue_size=buffer_size,
+                     **bottleneck_opts(aqm))
+
+        print(f"[topo] (with UDP) bottleneck bw={bw} Mbps, loss={loss}%, buffer={buffer_size} pkts, aqm={aqm}, bot_delay=10ms")
+
 
-        print(f"[topo] (with UDP) bottleneck bw={bw} Mbps, loss={loss}%, buffer={buffer_size} pkts, bot_delay=10ms")
 
 
+def get_network(topo):
+    """A started network shaped like topo. The first trial of each topology
+    class builds and starts it; later trials reuse it, with every link whose
+    parameters differ reconfigured in place (TCIntf.config rewrites the tc
+    qdiscs), instead of paying for a new OVS/controller setup per trial."""
+    net = NETWORKS.get(type(topo))
+    if net is None:
+        net = Mininet(topo=topo, link=TCLink, controller=None)
+        write_switch_topology(net)
+        net.addController(RemoteController('c0', ip=CONTROLLER_IP, port=CONTROLLER_PORT))
+        net.start()
+        NETWORKS[type(topo)] = net
+    else:
+        reshape_network(net, topo)
+    return net
+
+
+def stop_networks():
+    for net in NETWORKS.values():
+        net.stop()
+    NETWORKS.clear()
+
+
+def cleanup_trial(net, files):
+    """Kill what an earlier trial may have left running (the hosts share one
+    process table) and remove its output files, so nothing leaks into this trial"""
+    for proc in TRIAL_PROCESSES:
+        net.hosts[0].cmd(f"pkill -f {proc} || true")
+    for path in files:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def trial_files(*prefs):
+    """Output files of one trial: the clients' received data and sidecars, server logs"""
+    files = ["/tmp/s1_server.out", "/tmp/s2_server.out", "/tmp/s3_udp_server.out", "/tmp/c3_udp_client.out",
+             UDP_LOAD_LOG, UDP_SINK_LOG]
+    for pref in prefs:
+        files += [f"{pref}received_data.txt", f"{pref}received_data.txt.md5",
+                  f"{pref}received_data.txt.flows", f"/tmp/{pref}.out"]
+    return files
+
+
+def reset_switch_stats(path=SWITCH_STATS):
+    """Start a trial with an empty statistics timeseries; the controller only
+    ever appends to it"""
+    with open(path, 'w') as f:
+        f.write(SWITCH_STATS_HEADER)
+
+
+def bottleneck_stats(net, t0, t1, bw, hosts=('c1', 'c2'), path=SWITCH_STATS):
+    """Measured at the switches over [t0, t1] from the controller's timeseries:
+    utilization of the bottleneck (sw2 -> sw1, the direction data flows), mean
+    and peak occupancy (packets) and drops of its egress queue, and the bytes
+    sw1 forwarded to each of hosts. None for what was not sampled."""
+    sw1, sw2 = net.get('sw1'), net.get('sw2')
+    dpid1, dpid2 = int(sw1.dpid, 16), int(sw2.dpid, 16)
+    port, _ = net.topo.port('sw2', 'sw1')
+    macs = {net.get(h).MAC(): h for h in hosts}
+
+    port_samples, qdisc_samples, flow_samples = [], [], {h: [] for h in hosts}
+    try:
+        with open(path) as f:
+            next(f)
+            for line in f:
+                fields = line.strip().split(',')
+                # The controller may be mid-write on the last line
+                if len(fields) != 9:
+                    continue
+                t, dpid, kind, key = float(fields[0]), int(fields[1]), fields[2], fields[3]
+                if not t0 <= t <= t1:
+                    continue
+                if dpid == dpid2 and key == str(port) and kind == 'port':
+                    port_samples.append((t, int(fields[4])))
+                elif dpid == dpid2 and key == str(port) and kind == 'qdisc':
+                    qdisc_samples.append((int(fields[6]), int(fields[8])))
+                elif dpid == dpid1 and kind == 'flow' and key in macs:
+                    flow_samples[macs[key]].append(int(fields[4]))
+    except (FileNotFoundError, StopIteration, ValueError):
+        pass
+
+    util = None
+    if len(port_samples) > 1 and port_samples[-1][0] > port_samples[0][0]:
+        (ta, bytes_a), (tb, bytes_b) = port_samples[0], port_samples[-1]
+        util = (bytes_b - bytes_a) * 8 / ((tb - ta) * bw * 1e6)
+    queue_avg = queue_max = queue_drops = None
+    if qdisc_samples:
+        backlogs = [backlog for _, backlog in qdisc_samples]
+        queue_avg = sum(backlogs) / len(backlogs)
+        queue_max = max(backlogs)
+        queue_drops = qdisc_samples[-1][0] - qdisc_samples[0][0]
+    flow_bytes = [samples[-1] - samples[0] if samples else None
+                  for samples in flow_samples.values()]
+    return util, queue_avg, queue_max, queue_drops, flow_bytes
 
 
 def jain_fairness_index(allocations):
@@ -111,18 +261,107 @@ def compute_md5(file_path):
         return None
 
 
+def read_md5(file_path):
+    """Read the digest the client streamed into <file>.md5 while receiving.
+    Falls back to hashing the file when the sidecar is missing (incomplete transfer)."""
+    try:
+        with open(file_path + '.md5') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return compute_md5(file_path)
+
+
 def get_file_size_bytes(file_path):
     try:
         return os.path.getsize(file_path)
     except Exception:
         return None
 
-def run_trial(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mean=None, iteration=0, buffer_size=420):
+
+def stream_fairness(flows_path):
+    """JFI across the flows of one striped download, from the client's
+    <output>.flows stats (flow,bytes,duration). Returns 1.0 for a single flow."""
+    try:
+        with open(flows_path) as f:
+            next(f)
+            allocs = []
+            for line in f:
+                _, nbytes, duration = line.strip().split(',')
+                allocs.append(int(nbytes) * 8 / max(float(duration), 1e-9))
+    except (FileNotFoundError, StopIteration, ValueError):
+        return 1.0
+    return jain_fairness_index(allocs)
+
+
+def udp_offered_load(t0, t1, log_path=UDP_LOAD_LOG):
+    """Mean load (Mbps) the background UDP source really offered over [t0, t1],
+    from its per-ON-period log (see udp_server.py); None without a log"""
+    total = 0
+    try:
+        with open(log_path) as f:
+            next(f)
+            for line in f:
+                fields = line.strip().split(',')
+                if len(fields) == 7 and t0 <= float(fields[1]) <= t1:
+                    total += int(fields[4])
+    except (FileNotFoundError, StopIteration, ValueError):
+        return None
+    return total * 8 / (max(t1 - t0, 1e-9) * 1e6)
+
+
+def udp_delivery(t0, t1, log_path=UDP_SINK_LOG):
+    """Background UDP traffic delivered over [t0, t1] from the receiver's
+    timeseries: (Mbps, loss fraction, mean RFC 3550 jitter in ms), None each
+    without a log"""
+    nbytes = packets = lost = 0
+    jitters = []
+    try:
+        with open(log_path) as f:
+            next(f)
+            for line in f:
+                fields = line.strip().split(',')
+                if len(fields) == 8 and t0 <= float(fields[0]) <= t1:
+                    packets += int(fields[1])
+                    nbytes += int(fields[2])
+                    lost += int(fields[4])
+                    jitters.append(float(fields[5]))
+    except (FileNotFoundError, StopIteration, ValueError):
+        return None, None, None
+    if not jitters:
+        return 0.0, None, None
+    return (nbytes * 8 / (max(t1 - t0, 1e-9) * 1e6), max(lost, 0) / max(packets + lost, 1),
+            sum(jitters) / len(jitters))
+
+
+def server_stats(log_path):
+    """Retransmissions, mean smoothed RTT (ms) and CE marks echoed, summed (or
+    averaged) over the flows in a server log. None for what the log lacks."""
+    retx, srtts, ce = None, [], None
+    try:
+        with open(log_path) as f:
+            for line in f:
+                if line.startswith("Sends by path:"):
+                    counts = dict(re.findall(r"(\w+) (\d+)", line.split(':', 1)[1]))
+                    retx = (retx or 0) + sum(int(n) for path, n in counts.items() if path != 'new')
+                elif line.startswith("RTT: smoothed"):
+                    srtts.append(float(line.split()[2]))
+                elif line.startswith("CE-marked segments echoed:"):
+                    ce = (ce or 0) + int(line.split(':')[1])
+    except FileNotFoundError:
+        pass
+    srtt = sum(srtts) / len(srtts) if srtts else None
+    return retx, srtt, ce
+
+
+def run_trial(store, bw=100, loss=0, delay_c2_ms=5, udp_off_mean=None, iteration=0, buffer_size=420, streams=1, aqm='droptail'):
     setLogLevel('info')
     import time
 
-    controller_ip = '127.0.0.1'
-    controller_port = 6653
+    trial_params = dict(bw=bw, loss=loss, delay_c2_ms=delay_c2_ms, udp_off_mean=udp_off_mean,
+                        buffer_size=buffer_size, streams=streams, aqm=aqm)
+    if store.done(trial_params, iteration):
+        print(f"--- Skipping completed trial: {trial_params} iter={iteration} ---")
+        return
 
     # prefixes used by the client (must match client's behavior)
     pref_c1 = "1"
@@ -133,15 +372,13 @@ def run_trial(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mean=None, i
     SERVER_PORT2 = 6556
 
     OUTFILE = 'received_data.txt'  # client's receives are expected as {pref}received_data.txt
-    print(f"--- Running trial: bw={bw}Mbps loss={loss}% delay_c2={delay_c2_ms}ms  udp_off_mean={udp_off_mean} iter={iteration} ---")
+    print(f"--- Running trial: bw={bw}Mbps loss={loss}% delay_c2={delay_c2_ms}ms  udp_off_mean={udp_off_mean} streams={streams} aqm={aqm} iter={iteration} ---")
 
-    # Build topology 
-    topo = DumbbellTopo(delay_c2_sw1=f"{delay_c2_ms}ms", bw=bw, loss=loss, buffer_size=buffer_size)
-    
-    net = Mininet(topo=topo, link=TCLink, controller=None)
-    remote_controller = RemoteController('c0', ip=controller_ip, port=controller_port)
-    net.addController(remote_controller)
-    net.start()
+    # Build (or reshape) the topology
+    topo = DumbbellTopo(delay_c2_sw1=f"{delay_c2_ms}ms", bw=bw, loss=loss, buffer_size=buffer_size, aqm=aqm)
+    net = get_network(topo)
+    cleanup_trial(net, trial_files(pref_c1, pref_c2))
+    reset_switch_stats()
     
 
     # get hosts (c1,c2,c3 and s1,s2,s3 )
@@ -154,8 +391,8 @@ def run_trial(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mean=None, i
     server_py = "p2_server.py"
 
 
-    s1_pid_raw = s1.cmdPrint(f"bash -c 'python3 {server_py} {s1.IP()} {SERVER_PORT1} > /tmp/s1_server.out 2>&1 & echo $!'").strip()
-    s2_pid_raw = s2.cmdPrint(f"bash -c 'python3 {server_py} {s2.IP()} {SERVER_PORT2} > /tmp/s2_server.out 2>&1 & echo $!'").strip()
+    s1_pid_raw = s1.cmdPrint(f"bash -c 'python3 {server_py} {s1.IP()} {SERVER_PORT1}{server_opts(aqm)} > /tmp/s1_server.out 2>&1 & echo $!'").strip()
+    s2_pid_raw = s2.cmdPrint(f"bash -c 'python3 {server_py} {s2.IP()} {SERVER_PORT2}{server_opts(aqm)} > /tmp/s2_server.out 2>&1 & echo $!'").strip()
     s1_pid = s1_pid_raw.split()[0] if s1_pid_raw else None
     s2_pid = s2_pid_raw.split()[0] if s2_pid_raw else None
     print(f"started server s1 pid: {s1_pid}, s2 pid: {s2_pid}")
@@ -167,7 +404,8 @@ def run_trial(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mean=None, i
     client_py = "p2_client.py"
 
 
-    c1_start_cmd = f"python3 {client_py} {s1.IP()} {SERVER_PORT1} {pref_c1}"
+    # client 1 optionally stripes its download over several flows
+    c1_start_cmd = f"python3 {client_py} {s1.IP()} {SERVER_PORT1} {pref_c1} {streams}"
     c2_start_cmd = f"python3 {client_py} {s2.IP()} {SERVER_PORT2} {pref_c2}"
     
     start_time_c1 = time.time()
@@ -219,21 +457,22 @@ def run_trial(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mean=None, i
 
     # --- Kill any remaining server processes if still running ---
     print("stopping  servers (if still active)")
-    s1.cmd("pkill -f {server_py} || true")
-    s2.cmd("pkill -f {server_py} || true")
+    s1.cmd(f"pkill -f {server_py} || true")
+    s2.cmd(f"pkill -f {server_py} || true")
     time.sleep(1)
 
 
-    # Stop the network
-    net.stop()
+    # utilization, queueing and per-flow bytes as the switches saw them
+    sw_util, queue_avg, queue_max, queue_drops, (sw_bytes1, sw_bytes2) = bottleneck_stats(
+        net, min(start_time_c1, start_time_c2), max(end_time_c1, end_time_c2), bw)
 
     # compute durations
     dur_c1 = max(end_time_c1 - start_time_c1, 1e-9)
     dur_c2 = max(end_time_c2 - start_time_c2, 1e-9)
 
     # compute MD5s using controller-local files
-    hash1 = compute_md5(f"{pref_c1}received_data.txt")
-    hash2 = compute_md5(f"{pref_c2}received_data.txt")
+    hash1 = read_md5(f"{pref_c1}received_data.txt")
+    hash2 = read_md5(f"{pref_c2}received_data.txt")
 
     # compute file sizes if available on controller
     size1 = get_file_size_bytes(f"{pref_c1}received_data.txt")
@@ -261,16 +500,25 @@ def run_trial(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mean=None, i
     allocs = [1.0 / dur_c1, 1.0 / dur_c2]
     jfi = jain_fairness_index(allocs)
 
-    # write CSV line - include experiment-relevant columns
-    # Columns: bw,loss,delay_c2,udp_off_mean,iter,md5_1,md5_2,dur1,dur2,size1_bytes,size2_bytes,thr1_mbps,thr2_mbps,link_util,jfi
-    output_handle.write(f"{bw},{loss},{delay_c2_ms},{udp_off_mean},{iteration},{hash1},{hash2},{dur_c1:.6f},{dur_c2:.6f},{size1},{size2},{thr1_mbps:.6f},{thr2_mbps:.6f},{link_util:.6f},{jfi:.6f}\n")
-    output_handle.flush()
+    # fairness between the stripes of client 1's download
+    stream_jfi = stream_fairness(f"{pref_c1}received_data.txt.flows") if streams > 1 else 1.0
+
+    # delay and loss as the senders saw them: retransmissions, smoothed RTT, ECN marks
+    retx1, srtt1, ce1 = server_stats("/tmp/s1_server.out")
+    retx2, srtt2, ce2 = server_stats("/tmp/s2_server.out")
 
-    print(f"dur1={dur_c1:.3f}s dur2={dur_c2:.3f}s size1={size1} size2={size2} thr1={thr1_mbps:.3f} thr2={thr2_mbps:.3f} link_util={link_util:.3f} jfi={jfi:.3f}")
+    # record the trial: one row of the experiment's CSV, in RESULT_COLUMNS order
+    store.add(trial_params, iteration, dict(zip(RESULT_COLUMNS, [
+        bw, loss, delay_c2_ms, udp_off_mean, iteration, hash1, hash2, round(dur_c1, 6), round(dur_c2, 6),
+        size1, size2, round(thr1_mbps, 6), round(thr2_mbps, 6), round(link_util, 6), round(jfi, 6),
+        streams, round(stream_jfi, 6), aqm, retx1, retx2, srtt1, srtt2, ce1, ce2,
+        sw_util, queue_avg, queue_max, queue_drops, sw_bytes1, sw_bytes2, None, None, None, None])))
 
+    print(f"dur1={dur_c1:.3f}s dur2={dur_c2:.3f}s size1={size1} size2={size2} thr1={thr1_mbps:.3f} thr2={thr2_mbps:.3f} link_util={link_util:.3f} jfi={jfi:.3f} stream_jfi={stream_jfi:.3f}")
 
 
-def experiment_fixed_bandwidth(exp_out, num_iterations=1):
+
+def experiment_fixed_bandwidth(store):
 
     bw_list = [100, 200, 300, 400, 500, 600, 700, 800, 900, 1000]
     RTT_seconds = RTT_MS / 1000.0
@@ -280,29 +528,49 @@ def experiment_fixed_bandwidth(exp_out, num_iterations=1):
         bw_bps = bw * 1e6
         buf_packets = max(1, int((RTT_seconds * bw_bps) / (MSS_BYTES * 8)))
         print(f"[fixed_bw] bw={bw}Mbps -> buffer_size={buf_packets} packets (RTT={RTT_MS}ms)")
-        for i in range(num_iterations):
-            run_trial(exp_out, bw=bw,  iteration=i, buffer_size=buf_packets)
+        for i in store.iterations(dict(bw=bw), RESULT_METRICS):
+            run_trial(store, bw=bw,  iteration=i, buffer_size=buf_packets)
 
 
-def experiment_varying_loss(exp_out, num_iterations=1):
+def experiment_varying_loss(store):
     loss_rates = [0.0, 0.5, 1.0, 1.5, 2.0]
     for loss in loss_rates:
-        for i in range(num_iterations):
-            run_trial(exp_out, bw=100, loss=loss, iteration=i,buffer_size=420)
+        for i in store.iterations(dict(loss=loss), RESULT_METRICS):
+            run_trial(store, bw=100, loss=loss, iteration=i,buffer_size=420)
 
 
-def experiment_asymmetric_flows(exp_out, num_iterations=1):
+def experiment_asymmetric_flows(store):
     for delay_c2 in range(5, 26, 5):  
-        for i in range(num_iterations):
-            run_trial(exp_out, bw=100, delay_c2_ms=delay_c2,iteration=i,buffer_size=420)
+        for i in store.iterations(dict(delay_c2_ms=delay_c2), RESULT_METRICS):
+            run_trial(store, bw=100, delay_c2_ms=delay_c2,iteration=i,buffer_size=420)
+
+
+
+def experiment_striped_flows(store):
+    # client 1 downloads over K parallel flows while client 2 uses one
+    for streams in [1, 2, 4, 8]:
+        for i in store.iterations(dict(streams=streams), RESULT_METRICS):
+            run_trial(store, bw=1000, iteration=i, buffer_size=420, streams=streams)
+
 
 
+def experiment_ecn_marking(store):
+    # same load through a tail-drop, a RED and an ECN-marking bottleneck queue;
+    # one flow per client, so only the queue discipline differs between them
+    for aqm in AQM_MODES:
+        for i in store.iterations(dict(aqm=aqm, streams=1), RESULT_METRICS):
+            run_trial(store, bw=100, iteration=i, buffer_size=420, streams=1, aqm=aqm)
 
-def run_trial_with_udp(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mean=1.0, iteration=0, buffer_size=420):
+
+
+def run_trial_with_udp(store, bw=100, loss=0, delay_c2_ms=5, udp_off_mean=1.0, iteration=0, buffer_size=420, streams=1, aqm='droptail'):
     setLogLevel('info')
 
-    controller_ip = '127.0.0.1'
-    controller_port = 6653
+    trial_params = dict(bw=bw, loss=loss, delay_c2_ms=delay_c2_ms, udp_off_mean=udp_off_mean,
+                        buffer_size=buffer_size, streams=streams, aqm=aqm)
+    if store.done(trial_params, iteration):
+        print(f"--- Skipping completed trial with UDP: {trial_params} iter={iteration} ---")
+        return
 
     # prefixes used by the client 
     pref_c1 = "1"
@@ -317,15 +585,13 @@ def run_trial_with_udp(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mea
     UDP_SERVER_PORT = 7777
 
     OUTFILE = 'received_data.txt'  # client's receives are expected as {pref}received_data.txt
-    print(f"--- Running trial with UDP: bw={bw}Mbps loss={loss}% delay_c2={delay_c2_ms}ms udp_off_mean={udp_off_mean}s iter={iteration} ---")
+    print(f"--- Running trial with UDP: bw={bw}Mbps loss={loss}% delay_c2={delay_c2_ms}ms udp_off_mean={udp_off_mean}s streams={streams} aqm={aqm} iter={iteration} ---")
 
-    # Build topology with UDP support
-    topo = DumbbellTopoWithUDP(delay_c2_sw1=f"{delay_c2_ms}ms", bw=bw, loss=loss, buffer_size=buffer_size)
-    
-    net = Mininet(topo=topo, link=TCLink, controller=None)
-    remote_controller = RemoteController('c0', ip=controller_ip, port=controller_port)
-    net.addController(remote_controller)
-    net.start()
+    # Build (or reshape) the topology with UDP support
+    topo = DumbbellTopoWithUDP(delay_c2_sw1=f"{delay_c2_ms}ms", bw=bw, loss=loss, buffer_size=buffer_size, aqm=aqm)
+    net = get_network(topo)
+    cleanup_trial(net, trial_files(pref_c1, pref_c2))
+    reset_switch_stats()
 
     # get hosts (c1,c2,c3 and s1,s2,s3)
     c1 = net.get('c1')
@@ -337,14 +603,14 @@ def run_trial_with_udp(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mea
 
     # Start TCP servers on s1 and s2 and capture their PIDs 
     server_py = 'p2_server.py'
-    s1_pid_raw = s1.cmd(f"bash -c 'python3 {server_py} {s1.IP()} {SERVER_PORT1} > /tmp/s1_server.out 2>&1 & echo $!'").strip()
-    s2_pid_raw = s2.cmd(f"bash -c 'python3 {server_py} {s2.IP()} {SERVER_PORT2} > /tmp/s2_server.out 2>&1 & echo $!'").strip()
+    s1_pid_raw = s1.cmd(f"bash -c 'python3 {server_py} {s1.IP()} {SERVER_PORT1}{server_opts(aqm)} > /tmp/s1_server.out 2>&1 & echo $!'").strip()
+    s2_pid_raw = s2.cmd(f"bash -c 'python3 {server_py} {s2.IP()} {SERVER_PORT2}{server_opts(aqm)} > /tmp/s2_server.out 2>&1 & echo $!'").strip()
     s1_pid = s1_pid_raw.split()[0] if s1_pid_raw else None
     s2_pid = s2_pid_raw.split()[0] if s2_pid_raw else None
     print(f"started TCP servers s1 pid: {s1_pid}, s2 pid: {s2_pid}")
     
     # Start UDP server on s3
-    s3_pid_raw = s3.cmd(f"bash -c 'python3 udp_server.py {s3.IP()} {UDP_SERVER_PORT} {udp_off_mean} > /tmp/s3_udp_server.out 2>&1 & echo $!'").strip()
+    s3_pid_raw = s3.cmd(f"bash -c 'python3 udp_server.py {s3.IP()} {UDP_SERVER_PORT} {udp_off_mean} --log {UDP_LOAD_LOG} > /tmp/s3_udp_server.out 2>&1 & echo $!'").strip()
     s3_pid = s3_pid_raw.split()[0] if s3_pid_raw else None
     print(f"started UDP server s3 pid: {s3_pid}")
     
@@ -352,7 +618,8 @@ def run_trial_with_udp(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mea
 
     # Start TCP clients on c1 and c2 and capture PIDs 
     client_py = 'p2_client.py'
-    c1_start_cmd = f"python3 {client_py} {s1.IP()} {SERVER_PORT1} {pref_c1}"
+    # client 1 optionally stripes its download over several flows
+    c1_start_cmd = f"python3 {client_py} {s1.IP()} {SERVER_PORT1} {pref_c1} {streams}"
     c2_start_cmd = f"python3 {client_py} {s2.IP()} {SERVER_PORT2} {pref_c2}"
     
     start_time_c1 = time.time()
@@ -376,7 +643,7 @@ def run_trial_with_udp(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mea
         c2_pid = None
 
     # Start UDP client on c3
-    c3_start_cmd = f"python3 udp_client.py {s3.IP()} {UDP_SERVER_PORT}"
+    c3_start_cmd = f"python3 udp_client.py {s3.IP()} {UDP_SERVER_PORT} --log {UDP_SINK_LOG}"
     c3_pid_raw = c3.cmd(f"bash -c '{c3_start_cmd} > /tmp/c3_udp_client.out 2>&1 & echo $!'").strip()
     c3_pid = c3_pid_raw.split()[0] if c3_pid_raw else None
     print(f"started UDP client c3 with PID: {c3_pid}")
@@ -414,16 +681,21 @@ def run_trial_with_udp(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mea
     c3.cmd("pkill -f udp_client.py || true")
     time.sleep(1)
 
-    # Stop the network
-    net.stop()
+    # utilization, queueing and per-flow bytes as the switches saw them
+    sw_util, queue_avg, queue_max, queue_drops, (sw_bytes1, sw_bytes2) = bottleneck_stats(
+        net, min(start_time_c1, start_time_c2), max(end_time_c1, end_time_c2), bw)
+    # background load the UDP source actually offered while the transfers ran
+    udp_mbps = udp_offered_load(min(start_time_c1, start_time_c2), max(end_time_c1, end_time_c2))
+    # ...and how much of it got through
+    udp_rx_mbps, udp_loss, udp_jitter = udp_delivery(min(start_time_c1, start_time_c2), max(end_time_c1, end_time_c2))
 
     # compute durations
     dur_c1 = max(end_time_c1 - start_time_c1, 1e-9)
     dur_c2 = max(end_time_c2 - start_time_c2, 1e-9)
 
     # compute MD5s using controller-local files
-    hash1 = compute_md5(f"{pref_c1}received_data.txt")
-    hash2 = compute_md5(f"{pref_c2}received_data.txt")
+    hash1 = read_md5(f"{pref_c1}received_data.txt")
+    hash2 = read_md5(f"{pref_c2}received_data.txt")
 
     # compute file sizes if available on controller
     size1 = get_file_size_bytes(f"{pref_c1}received_data.txt")
@@ -451,48 +723,67 @@ def run_trial_with_udp(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mea
     allocs = [1.0 / dur_c1, 1.0 / dur_c2]
     jfi = jain_fairness_index(allocs)
 
-    output_handle.write(f"{bw},{loss},{delay_c2_ms},{udp_off_mean},{iteration},{hash1},{hash2},{dur_c1:.6f},{dur_c2:.6f},{size1},{size2},{thr1_mbps:.6f},{thr2_mbps:.6f},{link_util:.6f},{jfi:.6f}\n")
-    output_handle.flush()
+    # fairness between the stripes of client 1's download
+    stream_jfi = stream_fairness(f"{pref_c1}received_data.txt.flows") if streams > 1 else 1.0
+
+    # delay and loss as the senders saw them: retransmissions, smoothed RTT, ECN marks
+    retx1, srtt1, ce1 = server_stats("/tmp/s1_server.out")
+    retx2, srtt2, ce2 = server_stats("/tmp/s2_server.out")
+
+    store.add(trial_params, iteration, dict(zip(RESULT_COLUMNS, [
+        bw, loss, delay_c2_ms, udp_off_mean, iteration, hash1, hash2, round(dur_c1, 6), round(dur_c2, 6),
+        size1, size2, round(thr1_mbps, 6), round(thr2_mbps, 6), round(link_util, 6), round(jfi, 6),
+        streams, round(stream_jfi, 6), aqm, retx1, retx2, srtt1, srtt2, ce1, ce2,
+        sw_util, queue_avg, queue_max, queue_drops, sw_bytes1, sw_bytes2, udp_mbps,
+        udp_rx_mbps, udp_loss, udp_jitter])))
 
-    print(f"dur1={dur_c1:.3f}s dur2={dur_c2:.3f}s size1={size1} size2={size2} thr1={thr1_mbps:.3f} thr2={thr2_mbps:.3f} link_util={link_util:.3f} jfi={jfi:.3f}")
+    print(f"dur1={dur_c1:.3f}s dur2={dur_c2:.3f}s size1={size1} size2={size2} thr1={thr1_mbps:.3f} thr2={thr2_mbps:.3f} link_util={link_util:.3f} jfi={jfi:.3f} stream_jfi={stream_jfi:.3f}")
 
 
-def experiment_background_udp(exp_out, num_iterations=1):
+def experiment_background_udp(store):
 
     udp_off_means = [1.5, 0.8, 0.5]
     
     for udp_off_mean in udp_off_means:
         print(f"[background_udp] Testing with UDP OFF mean={udp_off_mean}s")
-        for i in range(num_iterations):
-            run_trial_with_udp(exp_out, bw=100, udp_off_mean=udp_off_mean, iteration=i,buffer_size=420)
+        for i in store.iterations(dict(udp_off_mean=udp_off_mean), RESULT_METRICS):
+            run_trial_with_udp(store, bw=100, udp_off_mean=udp_off_mean, iteration=i,buffer_size=420)
 
 
 def run():
     if len(sys.argv) < 2:
-        print("Usage: sudo python3 p2_exp.py {Exp_Name} Available Exp_Name values: fixed_bandwidth, varying_loss, asymmetric_flows, background_udp")
+        print("Usage: sudo python3 p2_exp.py {Exp_Name} [--export] Available Exp_Name values: fixed_bandwidth, varying_loss, asymmetric_flows, background_udp, striped_flows, ecn_marking")
+        print("Trials already in the result store are skipped; --export only rewrites the CSV from it")
         sys.exit(1)
 
     exp_name = sys.argv[1]
 
     output_file = f'p2_fairness_{exp_name}.csv'
-    header = "bw,loss,delay_c2_ms,udp_off_mean,iter,md5_hash_1,md5_hash_2,ttc1,ttc2,size1_bytes,size2_bytes,thr1_mbps,thr2_mbps,link_util,jfi \n" 
-    f_out = open(output_file, 'w')
-    f_out.write(header)
+    store = ResultStore(RESULTS_FILE, exp_name)
+    print(f"--- {len(store.rows)} completed trials of {exp_name} in {RESULTS_FILE} (revision {store.revision}) ---")
 
     try:
-        if exp_name == 'fixed_bandwidth':
-            experiment_fixed_bandwidth(f_out)
+        if '--export' in sys.argv[2:]:
+            pass
+        elif exp_name == 'fixed_bandwidth':
+            experiment_fixed_bandwidth(store)
         elif exp_name == 'varying_loss':
-            experiment_varying_loss(f_out)
+            experiment_varying_loss(store)
         elif exp_name == 'asymmetric_flows':
-            experiment_asymmetric_flows(f_out)
+            experiment_asymmetric_flows(store)
         elif exp_name == 'background_udp':
-            experiment_background_udp(f_out)
+            experiment_background_udp(store)
+        elif exp_name == 'striped_flows':
+            experiment_striped_flows(store)
+        elif exp_name == 'ecn_marking':
+            experiment_ecn_marking(store)
         else:
             print(f"Unknown experiment name: {exp_name}")
     finally:
-        f_out.close()
-        print("--- Completed experiments ---")
+        stop_networks()
+        # Export whatever completed, also after an interruption
+        rows = store.export_csv(output_file, RESULT_COLUMNS)
+        print(f"--- Completed experiments: {rows} trials written to {output_file} ---")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,585 @@
+#!/usr/bin/env python3
+import sys
+import os
+import math
+import random
+import socket
+import argparse
+import threading
+from collections import deque
+
+# Part 2 builds on the Part 1 reliable transfer protocol
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'part1'))
+
+from p1_server import ReliableUDPServer, MSS, MAX_PACKET_SIZE
+from batch_io import ECN_ECT0
+
+# Congestion control works in segments: cwnd and inflight count segments,
+# rates are segments per second
+INITIAL_CWND = 1  # The assignment asks for an initial window of 1 MSS
+
+# BBR (v1) parameters
+BBR_HIGH_GAIN = 2 / math.log(2)                       # Startup: double the delivery rate every round
+BBR_DRAIN_GAIN = 1 / BBR_HIGH_GAIN                    # Drain the queue startup built
+BBR_CWND_GAIN = 2.0
+PACING_GAIN_CYCLE = [1.25, 0.75, 1, 1, 1, 1, 1, 1]    # ProbeBW: probe up, drain, cruise
+BTLBW_FILTER_ROUNDS = 10                              # Max filter window for bottleneck bandwidth
+MIN_RTT_FILTER_LEN = 10.0                             # Seconds before min RTT must be re-probed
+PROBE_RTT_DURATION = 0.2
+MIN_PIPE_CWND = 4
+FULL_BW_THRESHOLD = 1.25                              # Startup ends when bandwidth grows < 25%...
+FULL_BW_ROUNDS = 3                                    # ... for three rounds in a row
+INITIAL_RTT_GUESS = 0.001                             # Seeds the pacing rate before any RTT sample
+
+# HyStart (Ha & Rhee): leave startup on delay signals, before its doubling
+# overflows a shallow bottleneck queue
+HYSTART_LOW_WINDOW = 16     # Only once cwnd is at least this many segments
+HYSTART_ACK_DELTA = 0.002   # ACKs closer than this belong to one train
+HYSTART_MIN_SAMPLES = 8     # RTT samples per round for the delay test
+HYSTART_DELAY_MIN = 0.004   # RTT increase threshold: min RTT / 8, clamped to [4, 16] ms
+HYSTART_DELAY_MAX = 0.016
+
+# ECN, DCTCP-style: keep a moving average of the fraction of segments marked
+# CE per round, and on a marked round cap inflight at (1 - alpha / 2) of itself,
+# down to the estimated BDP
+ECN_ALPHA_GAIN = 1 / 16      # DCTCP's g
+ECN_STARTUP_THRESH = 0.5     # A round at least this marked ends startup (as BBRv2)
+ECN_INFLIGHT_GROWTH = 1 / 16 # Unmarked rounds raise the cap by this fraction
+
+# Pacing: segments may leave in bursts of about this long, so the send loop
+# does not have to wake up once per segment
+PACING_QUANTUM = 0.001
+MIN_POLL_TIMEOUT = 0.0005
+
+# Congestion manager (after RFC 3124): flows to hosts in the same prefix share
+# one controller, which is kept for a while after the last flow leaves
+CM_PREFIX_LEN = 24
+MACROFLOW_IDLE_TTL = MIN_RTT_FILTER_LEN   # After this the path model is too old to trust
+
+class BBR:
+    """Model-based congestion control after BBR v1 (Cardwell et al.).
+    
+    The sender keeps a model of the path: the bottleneck bandwidth (windowed
+    max of per-ACK delivery-rate samples) and the round-trip propagation time
+    (windowed min RTT). Pacing rate and the inflight cap are set from the
+    model, scaled by the gains of the current phase: Startup, Drain, ProbeBW
+    (gain cycling) and ProbeRTT. Random loss does not change the model, so it
+    does not collapse the sending rate the way it does for loss-based control.
+    ProbeBW's random first phase is drawn from rng (default: the random module).
+    """
+    def __init__(self, rng=None):
+        self.rng = rng or random
+        self.mode = 'startup'
+        self.pacing_gain = BBR_HIGH_GAIN
+        self.cwnd_gain = BBR_HIGH_GAIN
+        self.cwnd = INITIAL_CWND
+        self.pacing_rate = BBR_HIGH_GAIN * INITIAL_CWND / INITIAL_RTT_GUESS
+        
+        # Delivery-rate estimation: connection-wide delivered count and time,
+        # snapshotted into every segment when it is sent
+        self.delivered = 0
+        self.delivered_time = None
+        self.first_sent_time = None
+        self.app_limited_until = 0
+        self.tx = {}           # seq -> (delivered, delivered_time, first_sent_time, app_limited, sent_time)
+        self.sample = None     # Snapshot of the most recently sent segment delivered by this ACK
+        self.acked = 0         # Segments delivered by this ACK
+        self.rtt_sample = None
+        
+        # Round trips, counted by delivery
+        self.round_count = 0
+        self.next_round_delivered = 0
+        self.round_start = False
+        
+        # Path model
+        self.bw_samples = deque()  # (round, rate), max rate per round
+        self.btl_bw = 0.0
+        self.min_rtt = math.inf
+        self.min_rtt_stamp = None
+        
+        # Startup / ProbeBW / ProbeRTT bookkeeping
+        self.filled_pipe = False
+        self.full_bw = 0.0
+        self.full_bw_count = 0
+        self.cycle_index = 0
+        self.cycle_stamp = 0.0
+        self.probe_rtt_done_stamp = None
+        self.probe_rtt_round_done = False
+        self.prior_cwnd = None
+        self.in_recovery = False
+        self.recovery_round = 0
+        
+        # HyStart: per-round ACK train and RTT samples
+        self.hystart_round_start = 0.0
+        self.hystart_last_ack = 0.0
+        self.hystart_curr_rtt = math.inf
+        self.hystart_samples = 0
+        
+        # ECN: marks on this ACK and this round, the marked fraction's moving
+        # average, and the inflight cap it sets (None: no cap)
+        self.ce = 0
+        self.round_ce = 0
+        self.round_acked = 0
+        self.ecn_alpha = 1.0
+        self.inflight_hi = None
+        self.ce_total = 0
+        
+        self.start_time = None
+        self.transitions = []  # (time, mode) history for the stats
+        self.startup_exit = None  # (reason, seconds since start)
+    
+    def bdp(self):
+        """Estimated bandwidth-delay product in segments"""
+        if self.btl_bw == 0 or self.min_rtt == math.inf:
+            return INITIAL_CWND
+        return self.btl_bw * self.min_rtt
+    
+    def enter(self, mode, now):
+        self.mode = mode
+        self.transitions.append((now, mode))
+        if mode == 'drain':
+            self.pacing_gain = BBR_DRAIN_GAIN
+            self.cwnd_gain = BBR_HIGH_GAIN
+        elif mode == 'probe_bw':
+            self.cwnd_gain = BBR_CWND_GAIN
+            # Start at a random phase, but never in the draining one
+            self.cycle_index = self.rng.choice([i for i in range(len(PACING_GAIN_CYCLE)) if i != 1])
+            self.pacing_gain = PACING_GAIN_CYCLE[self.cycle_index]
+            self.cycle_stamp = now
+        elif mode == 'probe_rtt':
+            self.pacing_gain = 1
+            self.probe_rtt_done_stamp = None
+        elif mode == 'startup':
+            self.pacing_gain = BBR_HIGH_GAIN
+            self.cwnd_gain = BBR_HIGH_GAIN
+    
+    def on_send(self, seq, now, inflight, app_limited):
+        """Snapshot the delivery state into segment seq as it is (re)sent"""
+        if self.start_time is None:
+            self.start_time = now
+            self.transitions.append((now, self.mode))
+        if inflight == 0 or self.delivered_time is None:
+            self.first_sent_time = now
+            self.delivered_time = now
+        if app_limited:
+            self.app_limited_until = self.delivered + max(inflight, 1)
+        self.tx[seq] = (self.delivered, self.delivered_time, self.first_sent_time,
+                        self.app_limited_until > 0, now)
+    
+    def on_delivered(self, seq, now, rtt, count=1):
+        """Segment seq delivered (count segments, if it stands for a batch);
+        rtt is None if the sample is ambiguous"""
+        snapshot = self.tx.pop(seq, None)
+        if snapshot is None:
+            return
+        self.delivered += count
+        self.delivered_time = now
+        self.acked += count
+        if self.app_limited_until and self.delivered > self.app_limited_until:
+            self.app_limited_until = 0
+        # The rate sample comes from the most recently sent segment on this ACK
+        if self.sample is None or snapshot[0] >= self.sample[0]:
+            self.sample = snapshot
+            self.first_sent_time = snapshot[4]
+        if rtt is not None and (self.rtt_sample is None or rtt < self.rtt_sample):
+            self.rtt_sample = rtt
+    
+    def on_ce(self, marked):
+        """The receiver reports this many more CE-marked segments"""
+        self.ce += marked
+        self.ce_total += marked
+    
+    def on_ack(self, now, inflight):
+        """Update the model and the control parameters once per ACK"""
+        if self.sample is None:
+            return
+        prior_delivered, prior_time, first_sent, app_limited, sent_time = self.sample
+        acked, rtt = self.acked, self.rtt_sample
+        self.sample, self.acked, self.rtt_sample = None, 0, None
+        self.round_acked += acked
+        self.round_ce += self.ce
+        
+        # Round counting
+        self.round_start = prior_delivered >= self.next_round_delivered
+        if self.round_start:
+            self.next_round_delivered = self.delivered
+            self.round_count += 1
+            self.ecn_round_end(now)
+        
+        # Min RTT: windowed minimum, re-probed once it is MIN_RTT_FILTER_LEN old
+        expired = self.min_rtt_stamp is not None and now - self.min_rtt_stamp > MIN_RTT_FILTER_LEN
+        if rtt is not None and (rtt <= self.min_rtt or expired):
+            self.min_rtt = rtt
+            self.min_rtt_stamp = now
+        
+        # Delivery rate over the longer of the send and ACK intervals
+        interval = max(sent_time - first_sent, now - prior_time)
+        # Intervals shorter than min RTT come from ACK compression; ignore them
+        if interval > 0 and (self.min_rtt == math.inf or interval >= self.min_rtt):
+            rate = (self.delivered - prior_delivered) / interval
+            if rate >= self.btl_bw or not app_limited:
+                if self.bw_samples and self.bw_samples[-1][0] == self.round_count:
+                    if rate > self.bw_samples[-1][1]:
+                        self.bw_samples[-1] = (self.round_count, rate)
+                else:
+                    self.bw_samples.append((self.round_count, rate))
+            while self.bw_samples and self.bw_samples[0][0] <= self.round_count - BTLBW_FILTER_ROUNDS:
+                self.bw_samples.popleft()
+            if self.bw_samples:
+                self.btl_bw = max(r for _, r in self.bw_samples)
+        
+        if self.mode == 'startup':
+            self.hystart_update(now, rtt)
+        self.update_mode(now, inflight, app_limited, expired)
+        
+        # Leave loss recovery after a full round, restoring the window it cut
+        if self.in_recovery and self.round_count > self.recovery_round:
+            self.in_recovery = False
+            if self.prior_cwnd is not None:
+                self.cwnd = max(self.cwnd, self.prior_cwnd)
+                self.prior_cwnd = None
+        
+        self.set_pacing_rate()
+        self.set_cwnd(acked)
+        self.ce = 0
+    
+    def ecn_round_end(self, now):
+        """Once per round: fold the marked fraction into alpha, and cut the
+        inflight cap in proportion to it (or raise it again if nothing was marked)"""
+        if self.round_acked == 0:
+            return
+        marked = min(self.round_ce / self.round_acked, 1.0)
+        self.ecn_alpha += ECN_ALPHA_GAIN * (marked - self.ecn_alpha)
+        if self.round_ce:
+            if self.mode == 'startup' and marked >= ECN_STARTUP_THRESH:
+                self.exit_startup('ecn', now)
+            cap = self.cwnd if self.inflight_hi is None else self.inflight_hi
+            # Never below the estimated BDP: marks are about the queue, not the pipe
+            self.inflight_hi = max(MIN_PIPE_CWND, self.bdp(), cap * (1 - self.ecn_alpha / 2))
+        elif self.inflight_hi is not None:
+            self.inflight_hi += max(1, self.inflight_hi * ECN_INFLIGHT_GROWTH)
+            if self.inflight_hi >= self.cwnd_gain * self.bdp():
+                self.inflight_hi = None
+        self.round_ce = self.round_acked = 0
+    
+    def update_mode(self, now, inflight, app_limited, min_rtt_expired):
+        """Startup -> Drain -> ProbeBW, with ProbeRTT whenever min RTT goes stale"""
+        if self.mode == 'startup' and self.round_start and not app_limited:
+            if self.btl_bw >= self.full_bw * FULL_BW_THRESHOLD:
+                self.full_bw = self.btl_bw
+                self.full_bw_count = 0
+            else:
+                self.full_bw_count += 1
+                if self.full_bw_count >= FULL_BW_ROUNDS:
+                    self.exit_startup('bandwidth_plateau', now)
+        if self.mode == 'drain' and inflight <= self.bdp():
+            self.enter('probe_bw', now)
+        
+        if self.mode == 'probe_bw' and self.next_cycle_phase(now, inflight):
+            self.cycle_index = (self.cycle_index + 1) % len(PACING_GAIN_CYCLE)
+            self.pacing_gain = PACING_GAIN_CYCLE[self.cycle_index]
+            self.cycle_stamp = now
+        
+        if self.mode != 'probe_rtt' and min_rtt_expired:
+            self.prior_cwnd = max(self.cwnd, self.prior_cwnd or 0)
+            self.enter('probe_rtt', now)
+        if self.mode == 'probe_rtt':
+            if self.probe_rtt_done_stamp is None and inflight <= MIN_PIPE_CWND:
+                self.probe_rtt_done_stamp = now + PROBE_RTT_DURATION
+                self.probe_rtt_round_done = False
+                self.next_round_delivered = self.delivered
+            elif self.probe_rtt_done_stamp is not None:
+                if self.round_start:
+                    self.probe_rtt_round_done = True
+                if self.probe_rtt_round_done and now > self.probe_rtt_done_stamp:
+                    self.min_rtt_stamp = now
+                    if self.prior_cwnd is not None:
+                        self.cwnd = max(self.cwnd, self.prior_cwnd)
+                        self.prior_cwnd = None
+                    self.enter('probe_bw' if self.filled_pipe else 'startup', now)
+    
+    def hystart_update(self, now, rtt):
+        """HyStart's two early exits from startup: an ACK train spanning the min
+        RTT (inflight already fills the pipe), or RTT rising over the min RTT
+        (a queue is building)"""
+        if self.round_start:
+            self.hystart_round_start = self.hystart_last_ack = now
+            self.hystart_curr_rtt = math.inf
+            self.hystart_samples = 0
+        if self.cwnd < HYSTART_LOW_WINDOW or self.min_rtt == math.inf:
+            return
+        
+        # With pacing the train spreads over the whole round, hence the full min
+        # RTT rather than the original min RTT / 2 (as Linux does)
+        if now - self.hystart_last_ack <= HYSTART_ACK_DELTA:
+            self.hystart_last_ack = now
+            if now - self.hystart_round_start >= self.min_rtt:
+                self.exit_startup('ack_train', now)
+                return
+        
+        if rtt is not None and self.hystart_samples < HYSTART_MIN_SAMPLES:
+            self.hystart_curr_rtt = min(self.hystart_curr_rtt, rtt)
+            self.hystart_samples += 1
+            if self.hystart_samples == HYSTART_MIN_SAMPLES:
+                eta = max(HYSTART_DELAY_MIN, min(self.min_rtt / 8, HYSTART_DELAY_MAX))
+                if self.hystart_curr_rtt >= self.min_rtt + eta:
+                    self.exit_startup('delay_increase', now)
+    
+    def exit_startup(self, reason, now):
+        """The pipe is full: record why and when, then drain the queue startup built"""
+        self.filled_pipe = True
+        self.full_bw = self.btl_bw
+        if self.startup_exit is None:
+            self.startup_exit = (reason, now - self.start_time)
+        self.enter('drain', now)
+    
+    def next_cycle_phase(self, now, inflight):
+        """ProbeBW phases last a min RTT; the up-phase also waits until inflight
+        actually reached its gain, the down-phase ends early once drained"""
+        full_length = now - self.cycle_stamp > self.min_rtt
+        if self.pacing_gain > 1:
+            # CE marks end the probe like losses do; so does hitting the ECN cap
+            capped = self.inflight_hi is not None and inflight >= self.inflight_hi
+            return full_length and (inflight >= self.pacing_gain * self.bdp() or self.ce > 0 or capped)
+        if self.pacing_gain < 1:
+            return full_length or inflight <= self.bdp()
+        return full_length
+    
+    def set_pacing_rate(self):
+        if self.btl_bw == 0:
+            return
+        rate = self.pacing_gain * self.btl_bw
+        # In startup only ever speed up, so early small samples cannot stall it
+        if self.filled_pipe or rate > self.pacing_rate:
+            self.pacing_rate = rate
+    
+    def set_cwnd(self, acked):
+        target = self.cwnd_gain * self.bdp()
+        if self.filled_pipe:
+            self.cwnd = min(self.cwnd + acked, target)
+        elif self.cwnd < target or self.delivered < INITIAL_CWND:
+            self.cwnd += acked
+        if self.filled_pipe:
+            self.cwnd = max(self.cwnd, MIN_PIPE_CWND)
+        if self.inflight_hi is not None:
+            self.cwnd = min(self.cwnd, self.inflight_hi)
+        if self.mode == 'probe_rtt':
+            self.cwnd = min(self.cwnd, MIN_PIPE_CWND)
+    
+    def on_timeout(self, now):
+        """RTO: remember the window, and restart from one segment"""
+        if not self.in_recovery:
+            self.prior_cwnd = max(self.cwnd, self.prior_cwnd or 0)
+        self.in_recovery = True
+        self.recovery_round = self.round_count
+        self.cwnd = 1
+    
+    def undo(self):
+        """The timeout was spurious: put the window back"""
+        if self.prior_cwnd is not None:
+            self.cwnd = max(self.cwnd, self.prior_cwnd)
+            self.prior_cwnd = None
+        self.in_recovery = False
+    
+    def stats(self):
+        history = " -> ".join(f"{mode}@{t - self.start_time:.2f}s" for t, mode in self.transitions)
+        exit_note = (f"{self.startup_exit[0]} at {self.startup_exit[1]:.2f}s"
+                     if self.startup_exit else "none")
+        return (f"BBR {self.mode}: btl_bw {self.btl_bw * MSS * 8 / 1e6:.1f} Mbps, "
+                f"min_rtt {self.min_rtt * 1000:.1f} ms, cwnd {self.cwnd:.0f} segments, "
+                f"pacing {self.pacing_rate * MSS * 8 / 1e6:.1f} Mbps; {history}; "
+                f"startup exit: {exit_note}; ECN: {self.ce_total} CE marks, alpha {self.ecn_alpha:.3f}")
+
+class Macroflow:
+    """The flows to one destination prefix and the congestion state they share.
+    
+    One BBR instance sees every flow's sends and deliveries, so its bandwidth
+    and min RTT filters are fed by the aggregate, and its window and pacing
+    rate are split between the flows by weight. Flows run in their own threads;
+    every controller update happens under the lock.
+    """
+    def __init__(self, prefix, rng=None):
+        self.prefix = prefix
+        self.cc = BBR(rng)
+        self.lock = threading.RLock()
+        self.flows = {}        # flow -> weight
+        self.idle_since = None
+        self.sent = 0
+        self.lost = 0
+    
+    def share(self, flow):
+        """This flow's fraction of the aggregate window and pacing rate"""
+        total = sum(self.flows.values())
+        return self.flows.get(flow, 0) / total if total else 1.0
+    
+    def inflight(self):
+        return sum(flow.scoreboard.outstanding for flow in self.flows)
+    
+    def app_limited(self):
+        """Only when every flow has run out of new data"""
+        return all(flow.next_seq >= flow.total_packets - 1 for flow in self.flows)
+    
+    def stats(self):
+        loss = self.lost / self.sent if self.sent else 0.0
+        return (f"Macroflow {self.prefix}: {len(self.flows)} flows, {self.sent} sends, "
+                f"{self.lost} lost ({loss:.2%})")
+
+class CongestionManager:
+    """Process-wide table of macroflows, keyed by destination prefix.
+    
+    A flow joining a prefix that already has a live controller takes its share
+    of the current window and pacing rate instead of starting over in Startup.
+    New controllers draw their random choices from rng, if given.
+    """
+    def __init__(self, prefix_len=CM_PREFIX_LEN, rng=None):
+        self.prefix_len = prefix_len
+        self.rng = rng
+        self.lock = threading.Lock()
+        self.macroflows = {}
+    
+    def prefix(self, addr):
+        try:
+            ip = int.from_bytes(socket.inet_aton(addr[0]), 'big')
+        except OSError:
+            return addr[0]
+        mask = (0xFFFFFFFF << (32 - self.prefix_len)) & 0xFFFFFFFF
+        return f"{socket.inet_ntoa((ip & mask).to_bytes(4, 'big'))}/{self.prefix_len}"
+    
+    def join(self, flow, addr, weight, now):
+        prefix = self.prefix(addr)
+        with self.lock:
+            macroflow = self.macroflows.get(prefix)
+            if macroflow is None or (not macroflow.flows and
+                                     now - macroflow.idle_since > MACROFLOW_IDLE_TTL):
+                macroflow = self.macroflows[prefix] = Macroflow(prefix, self.rng)
+            with macroflow.lock:
+                macroflow.flows[flow] = weight
+                macroflow.idle_since = None
+        return macroflow
+    
+    def leave(self, flow, macroflow, now):
+        with self.lock, macroflow.lock:
+            macroflow.flows.pop(flow, None)
+            if not macroflow.flows:
+                macroflow.idle_since = now
+
+# Shared by every server (and every striped flow) in this process
+CONGESTION_MANAGER = CongestionManager()
+
+class CongestionControlledServer(ReliableUDPServer):
+    """Part 1 sender with congestion control: the controller caps segments in
+    flight (cwnd) and paces new segments at its pacing rate. The controller
+    belongs to the flow's macroflow; the flow gets its weighted share of it.
+    Segments are sent ECN-capable only if ecn is on, so unless an experiment
+    asks for it the bottleneck sees the same not-ECT traffic as before ECN."""
+    def __init__(self, server_ip, server_port, sws=None, file_cache=None, batch_io=False,
+                 threaded=False, weight=1.0, manager=None, ecn=False, io=None):
+        super().__init__(server_ip, server_port, sws, file_cache, batch_io, threaded, io)
+        self.ecn = ecn
+        if ecn and self.sock is not None:
+            try:
+                self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, ECN_ECT0)
+            except OSError:
+                self.ecn = False
+        self.weight = weight
+        self.manager = manager or CONGESTION_MANAGER
+        self.macroflow = None
+        self.cc = None
+        self.next_send_time = 0.0
+    
+    def new_flow(self):
+        return type(self)(self.server_ip, 0, self.sws_arg, self.file_cache, self.batch_io,
+                          self.threaded, self.weight, self.manager, self.ecn)
+    
+    def flow_cwnd(self):
+        return max(1, self.macroflow.cc.cwnd * self.macroflow.share(self))
+    
+    def congestion_allows(self, now):
+        if self.scoreboard.outstanding >= self.flow_cwnd():
+            return False
+        return self.next_send_time - now < PACING_QUANTUM
+    
+    def poll_timeout(self, now):
+        # Wake up when pacing lets the next segment out, if the window has room
+        if self.scoreboard.outstanding < self.flow_cwnd() and self.next_seq < self.total_packets:
+            return max(MIN_POLL_TIMEOUT, min(self.next_send_time - now, super().poll_timeout(now)))
+        return super().poll_timeout(now)
+    
+    def mark_sent(self, seq, packet, now):
+        with self.macroflow.lock:
+            self.cc.on_send((id(self), seq), now, self.macroflow.inflight(), self.macroflow.app_limited())
+            self.macroflow.sent += 1
+            rate = self.cc.pacing_rate * self.macroflow.share(self)
+        super().mark_sent(seq, packet, now)
+        gap = len(packet) / MAX_PACKET_SIZE / rate
+        self.next_send_time = max(self.next_send_time, now) + gap
+    
+    def retransmit(self, seqs, client_addr, now, path):
+        if path in ('rack', 'rto'):
+            with self.macroflow.lock:
+                self.macroflow.lost += len(seqs)
+        super().retransmit(seqs, client_addr, now, path)
+    
+    def on_delivered(self, seq, send_time, ack_time):
+        # Karn: no RTT sample from a retransmitted segment
+        rtt = None if self.scoreboard.resend_path(seq) is not None else ack_time - send_time
+        self.cc.on_delivered((id(self), seq), ack_time, rtt)
+    
+    def process_ack(self, ack_packet, ack_time, current_time, client_addr, total_packets):
+        # Hold the lock across the ACK so its deliveries form one rate sample
+        with self.macroflow.lock:
+            super().process_ack(ack_packet, ack_time, current_time, client_addr, total_packets)
+            self.cc.on_ack(ack_time, self.macroflow.inflight())
+    
+    def on_ce(self, marked, ack_time):
+        super().on_ce(marked, ack_time)
+        self.cc.on_ce(marked)
+    
+    def on_timeout(self, client_addr, now, total_packets):
+        with self.macroflow.lock:
+            self.cc.on_timeout(now)
+        super().on_timeout(client_addr, now, total_packets)
+    
+    def undo_timeout(self):
+        if self.frto_seq is not None:
+            with self.macroflow.lock:
+                self.cc.undo()
+        super().undo_timeout()
+    
+    def start_transfer(self, client_addr, chunks, now):
+        self.macroflow = self.manager.join(self, client_addr, self.weight, now)
+        self.cc = self.macroflow.cc
+        if self.cc.start_time is not None:
+            print(f"Joining {self.macroflow.prefix} with the shared controller in {self.cc.mode}, "
+                  f"cwnd {self.cc.cwnd:.0f} segments")
+        super().start_transfer(client_addr, chunks, now)
+    
+    def finish_transfer(self, now):
+        with self.macroflow.lock:
+            # Forget this flow's outstanding send snapshots
+            for key in [key for key in self.cc.tx if key[0] == id(self)]:
+                del self.cc.tx[key]
+            print(self.cc.stats())
+            print(self.macroflow.stats())
+        self.manager.leave(self, self.macroflow, now)
+
+def main():
+    parser = argparse.ArgumentParser(usage="python3 p2_server.py <SERVER_IP> <SERVER_PORT> [--batch-io] [--threaded] [--ecn]")
+    parser.add_argument('server_ip')
+    parser.add_argument('server_port', type=int)
+    parser.add_argument('--batch-io', action='store_true',
+                        help="send/receive with UDP GSO/GRO batches (Linux), falling back to per-packet I/O")
+    parser.add_argument('--threaded', action='store_true',
+                        help="receive ACKs on a separate thread instead of in the send loop")
+    parser.add_argument('--ecn', action='store_true',
+                        help="send segments ECN-capable, so a marking router sets CE instead of dropping")
+    args = parser.parse_args()
+    
+    # No fixed SWS: the window autotunes to the measured BDP, capped by the client's rwnd;
+    # congestion control decides how much of it is used
+    server = CongestionControlledServer(args.server_ip, args.server_port, batch_io=args.batch_io,
+                                        threaded=args.threaded, ecn=args.ecn)
+    server.run()
+
+if __name__ == "__main__":
+    main()
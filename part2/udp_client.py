@@ -1,40 +1,155 @@
 import socket
 import sys
 import time
+import signal
+import argparse
+
+from udp_server import UDP_HEADER
+
+RECV_BUFFER_SIZE = 65535
+INTERVAL = 0.1        # Seconds per timeseries row
+IDLE_FLUSH = 0.5      # Write out the last interval after this long without packets
+
+LOG_HEADER = "time,packets,bytes,mbps,lost,jitter_ms,owd_ms,burst\n"
+
+class UDPSink:
+    """Receive side of the background UDP flow. Every packet carries the
+    generator's sequence number, ON-period number and send time (see
+    udp_server.py), which give loss (expected minus received, as in RTP),
+    RFC 3550 interarrival jitter and one-way delay (Mininet hosts share a
+    clock). Results are kept per interval of INTERVAL seconds, aligned to the
+    wall clock so rows line up with the other traces, and written as CSV."""
+    def __init__(self, sock, interval=INTERVAL, log=None):
+        self.sock = sock
+        self.buffer = bytearray(RECV_BUFFER_SIZE)
+        self.interval = interval
+        self.log = log
+
+        # Whole run
+        self.received = 0
+        self.bytes = 0
+        self.base_seq = None
+        self.max_seq = -1
+        self.jitter = 0.0          # RFC 3550 J, in seconds
+        self.prev_transit = None
+        self.first_time = None
+        self.last_time = None
+
+        # Current interval
+        self.slot = None
+        self.slot_packets = 0
+        self.slot_bytes = 0
+        self.slot_transit = 0.0
+        self.slot_expected = 0     # expected() when the interval began
+        self.slot_burst = None
+
+    def expected(self):
+        return 0 if self.base_seq is None else self.max_seq - self.base_seq + 1
+
+    def receive(self):
+        """Receive one datagram into the reusable buffer and account for it"""
+        nbytes = self.sock.recv_into(self.buffer)
+        now = time.time()
+        if nbytes < UDP_HEADER.size:
+            return
+        seq, burst, sent = UDP_HEADER.unpack_from(self.buffer)
+
+        slot = int(now // self.interval)
+        if slot != self.slot:
+            self.flush()
+            self.slot = slot
+
+        self.received += 1
+        self.bytes += nbytes
+        self.slot_packets += 1
+        self.slot_bytes += nbytes
+        self.slot_burst = burst
+        self.first_time = self.first_time or now
+        self.last_time = now
+
+        if self.base_seq is None:
+            self.base_seq = seq
+        self.max_seq = max(self.max_seq, seq)
+
+        # RFC 3550 6.4.1: J += (|D(i-1, i)| - J) / 16
+        transit = now - sent
+        self.slot_transit += transit
+        if self.prev_transit is not None:
+            self.jitter += (abs(transit - self.prev_transit) - self.jitter) / 16
+        self.prev_transit = transit
+
+    def flush(self):
+        """Close the current interval: write its row and start a new one"""
+        if self.slot_packets == 0:
+            return
+        lost = self.expected() - self.slot_expected - self.slot_packets
+        if self.log:
+            self.log.write(f"{self.slot * self.interval:.3f},{self.slot_packets},{self.slot_bytes},"
+                           f"{self.slot_bytes * 8 / (self.interval * 1e6):.3f},{lost},"
+                           f"{self.jitter * 1e3:.3f},{self.slot_transit / self.slot_packets * 1e3:.3f},"
+                           f"{self.slot_burst}\n")
+            self.log.flush()
+        self.slot_packets = 0
+        self.slot_bytes = 0
+        self.slot_transit = 0.0
+        self.slot_expected = self.expected()
+
+    def stats(self):
+        lost = self.expected() - self.received
+        loss = lost / self.expected() if self.expected() else 0.0
+        span = (self.last_time - self.first_time) if self.received > 1 else 0.0
+        rate = self.bytes * 8 / (span * 1e6) if span > 0 else 0.0
+        return (f"received {self.received} packets ({self.bytes} bytes), lost {lost} ({loss * 100:.2f}%), "
+                f"jitter {self.jitter * 1e3:.3f} ms, {rate:.2f} Mbps over {span:.1f}s")
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python3 udp_client.py <server_ip> <server_port>")
-        sys.exit(1)
-    
-    server_ip = sys.argv[1]
-    server_port = int(sys.argv[2])
-    
+    parser = argparse.ArgumentParser(usage="python3 udp_client.py <server_ip> <server_port> [--log FILE] [--interval S]")
+    parser.add_argument('server_ip')
+    parser.add_argument('server_port', type=int)
+    parser.add_argument('--log',
+                        help="write a CSV timeseries: per interval throughput, loss, jitter and one-way delay")
+    parser.add_argument('--interval', type=float, default=INTERVAL,
+                        help=f"seconds per timeseries row (default {INTERVAL:g})")
+    args = parser.parse_args()
+
     # Create UDP socket
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    
-    # Bind to any available port 
+
+    # Bind to any available port
     client_socket.bind(('', 0))
-    
-    print(f"UDP Client listening for packets from {server_ip}:{server_port}")
-    
+
+    print(f"UDP Client listening for packets from {args.server_ip}:{args.server_port}")
+
+    log = open(args.log, 'w') if args.log else None
+    if log:
+        log.write(LOG_HEADER)
+    sink = UDPSink(client_socket, args.interval, log)
+
+    # pkill sends SIGTERM: leave through the finally block so the last interval is written
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     # Send a dummy packet to establish connection with server
-    client_socket.sendto(b"HELLO", (server_ip, server_port))
-    print("Sent initial packet to server")
-    
-    packet_count = 0
+    client_socket.sendto(b"HELLO", (args.server_ip, args.server_port))
+    print("Sent initial packet to server", flush=True)
+
+    client_socket.settimeout(IDLE_FLUSH)
     try:
         while True:
-            data, addr = client_socket.recvfrom(1500)
-            packet_count += 1
-            if packet_count % 100 == 0:  
-                print(f"Received {packet_count} packets from {addr}")
-            
+            try:
+                sink.receive()
+            except socket.timeout:
+                # OFF period: do not hold the last interval back
+                sink.flush()
+
     except KeyboardInterrupt:
         print("UDP Client shutting down...")
     except Exception as e:
         print(f"UDP Client error: {e}")
     finally:
+        sink.flush()
+        print(f"UDP Client: {sink.stats()}")
+        if log:
+            log.close()
         client_socket.close()
 
 if __name__ == "__main__":
@@ -1,63 +1,201 @@
 import socket
 import sys
+import os
 import time
 import random
+import signal
+import struct
+import argparse
+
+# Batched sends come from part 1's I/O layer
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'part1'))
+
+from batch_io import make_io
+
+# Each packet starts with its sequence number, ON-period number and send time
+# (for loss and jitter at the receiver); the rest is padding, built once
+UDP_HEADER = struct.Struct('!IId')
+
+PACKETS_PER_BURST = 1000   # Mean ON period, in packets
+PACKET_SIZE = 1472         # UDP payload that fills a 1500-byte MTU, so no IP fragments
+ON_RATE_MBPS = 100.0       # Sending rate during ON periods
+SEND_BATCH = 8             # Packets per send call; the token bucket holds two batches
+PARETO_SHAPE = 1.5
+
+LOG_HEADER = "burst,start,on_seconds,packets,bytes,offered_mbps,off_seconds\n"
+
+class OnOffSchedule:
+    """ON/OFF cycles as (packets to send, seconds of silence after them): drawn
+    from fixed, exponential or Pareto distributions, or replayed from a trace
+    file of 'packets,off_seconds' lines"""
+    def __init__(self, on_mean, off_mean, on_dist='fixed', off_dist='exp', shape=PARETO_SHAPE, trace=None):
+        self.on_mean = on_mean
+        self.off_mean = off_mean
+        self.on_dist = on_dist
+        self.off_dist = off_dist
+        self.shape = shape
+        self.trace = self.load_trace(trace) if trace else None
+
+    @staticmethod
+    def load_trace(path):
+        cycles = []
+        with open(path) as f:
+            for line in f:
+                line = line.split('#')[0].strip()
+                if line:
+                    packets, off = line.split(',')
+                    cycles.append((int(packets), float(off)))
+        if not cycles:
+            raise ValueError(f"empty ON/OFF trace {path}")
+        return cycles
+
+    def draw(self, dist, mean):
+        if mean <= 0 or dist == 'fixed':
+            return max(mean, 0)
+        if dist == 'exp':
+            return random.expovariate(1.0 / mean)
+        # Pareto with the given mean: scale x_m = mean * (shape - 1) / shape
+        return mean * (self.shape - 1) / self.shape * random.paretovariate(self.shape)
+
+    def cycles(self):
+        while True:
+            if self.trace:
+                yield from self.trace
+            else:
+                yield (max(1, round(self.draw(self.on_dist, self.on_mean))),
+                       self.draw(self.off_dist, self.off_mean))
+
+class PacedSender:
+    """Sends ON periods at an exact rate: a token bucket two batches deep,
+    refilled at the target rate and drained a batch per send call. Packets come
+    from a ring of prebuilt buffers whose headers are patched in place."""
+    def __init__(self, sock, addr, rate_mbps, size=PACKET_SIZE, batch=SEND_BATCH, batch_io=False):
+        self.io = make_io(sock, batch_io)
+        self.addr = addr
+        self.rate = rate_mbps * 1e6 / 8   # Bytes per second
+        self.size = size
+        self.packets = [bytearray(b'X' * size) for _ in range(batch)]
+        self.seq = 0
+
+    def send_burst(self, count, burst):
+        """Send count packets at the target rate; returns (bytes sent, seconds taken)"""
+        # Two batches deep: a late wakeup's surplus carries over to the next batch
+        depth = 2 * len(self.packets) * self.size
+        # Start empty, so the period lasts count * size / rate, not one batch less
+        tokens = 0.0
+        start = last = time.monotonic()
+        sent = 0
+        while sent < count:
+            n = min(len(self.packets), count - sent)
+            need = n * self.size
+            now = time.monotonic()
+            tokens = min(depth, tokens + (now - last) * self.rate)
+            last = now
+            if tokens < need:
+                time.sleep((need - tokens) / self.rate)
+                continue
+            tokens -= need
+
+            stamp = time.time()
+            for k in range(n):
+                UDP_HEADER.pack_into(self.packets[k], 0, self.seq, burst, stamp)
+                self.seq += 1
+            self.io.send_run(self.packets[:n], self.addr)
+            sent += n
+        return sent * self.size, time.monotonic() - start
 
 def main():
-    if len(sys.argv) != 4:
-        print("Usage: python3 udp_server.py <server_ip> <server_port> <off_mean_seconds>")
-        sys.exit(1)
-    
-    server_ip = sys.argv[1]
-    server_port = int(sys.argv[2])
-    off_mean_seconds = float(sys.argv[3])
-    
+    parser = argparse.ArgumentParser(usage="python3 udp_server.py <server_ip> <server_port> <off_mean_seconds> [options]")
+    parser.add_argument('server_ip')
+    parser.add_argument('server_port', type=int)
+    parser.add_argument('off_mean_seconds', type=float)
+    parser.add_argument('--rate', type=float, default=ON_RATE_MBPS,
+                        help=f"sending rate during ON periods in Mbps (default {ON_RATE_MBPS:g})")
+    parser.add_argument('--burst', type=int, default=PACKETS_PER_BURST,
+                        help=f"mean ON period in packets (default {PACKETS_PER_BURST})")
+    parser.add_argument('--size', type=int, default=PACKET_SIZE,
+                        help=f"UDP payload bytes per packet (default {PACKET_SIZE})")
+    parser.add_argument('--on-dist', choices=('fixed', 'exp', 'pareto'), default='fixed',
+                        help="distribution of ON-period lengths (default fixed)")
+    parser.add_argument('--off-dist', choices=('fixed', 'exp', 'pareto'), default='exp',
+                        help="distribution of OFF-period lengths (default exp)")
+    parser.add_argument('--pareto-shape', type=float, default=PARETO_SHAPE,
+                        help=f"Pareto shape, > 1 for a finite mean (default {PARETO_SHAPE:g})")
+    parser.add_argument('--trace',
+                        help="replay ON/OFF cycles from a file of 'packets,off_seconds' lines, in a loop")
+    parser.add_argument('--batch', type=int, default=SEND_BATCH,
+                        help=f"packets per send call (default {SEND_BATCH})")
+    parser.add_argument('--batch-io', action='store_true',
+                        help="send each batch with UDP GSO (Linux), falling back to per-packet sends")
+    parser.add_argument('--log',
+                        help="write one CSV row per ON period with the offered load actually achieved")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    if args.size < UDP_HEADER.size:
+        parser.error(f"--size must be at least {UDP_HEADER.size} bytes")
+    if args.pareto_shape <= 1 and 'pareto' in (args.on_dist, args.off_dist):
+        parser.error("--pareto-shape must be > 1")
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    schedule = OnOffSchedule(args.burst, args.off_mean_seconds, args.on_dist, args.off_dist,
+                             args.pareto_shape, args.trace)
+
     # Create UDP socket
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    server_socket.bind((server_ip, server_port))
-    
-    print(f"UDP Server started on {server_ip}:{server_port}")
-    print(f"OFF period mean: {off_mean_seconds} seconds")
-    
-    PACKETS_PER_BURST = 1000   
-    PACKET_SIZE = 1500         
-    BURST_RATE = 0.00001       
-    
-    client_addr = None
-    
+    server_socket.bind((args.server_ip, args.server_port))
+
+    print(f"UDP Server started on {args.server_ip}:{args.server_port}")
+    print(f"ON: {args.rate:g} Mbps, {args.on_dist} {args.burst} packets of {args.size} bytes; "
+          f"OFF: {args.off_dist} mean {args.off_mean_seconds} seconds" +
+          (f" (trace {args.trace})" if args.trace else ""))
+
+    log = open(args.log, 'w') if args.log else None
+    if log:
+        log.write(LOG_HEADER)
+
+    # pkill sends SIGTERM: leave through the finally block so the summary is printed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    total_bytes = 0
+    on_time = 0.0
+    first_start = None
     try:
-        while True:
-            # Wait for client to connect (receive first packet)
-            if client_addr is None:
-                data, addr = server_socket.recvfrom(1024)
-                client_addr = addr
-                print(f"UDP client connected from {addr}")
-            
-            # ON period: send burst
-            burst_start = time.time()
-            print(f"UDP ON period: sending {PACKETS_PER_BURST} packets...")
-            for i in range(PACKETS_PER_BURST):
-                packet_data = f"UDP_BURST_{i}_{int(time.time())}".encode()
-                if len(packet_data) < PACKET_SIZE:
-                    packet_data += b'X' * (PACKET_SIZE - len(packet_data))
-                
-                server_socket.sendto(packet_data, client_addr)
-                time.sleep(BURST_RATE) 
-            
-            burst_duration = time.time() - burst_start
-            burst_throughput = (PACKETS_PER_BURST * PACKET_SIZE * 8) / (burst_duration * 1e6)  
-            print(f"UDP burst completed in {burst_duration:.3f}s, throughput: {burst_throughput:.1f} Mbps")
-            
-            # OFF period: wait for random duration (exponential distribution)
-            off_duration = random.expovariate(1.0 / off_mean_seconds)
-            print(f"UDP OFF period: waiting {off_duration:.2f} seconds...")
+        # Wait for client to connect (receive first packet)
+        data, client_addr = server_socket.recvfrom(1024)
+        print(f"UDP client connected from {client_addr}", flush=True)
+        sender = PacedSender(server_socket, client_addr, args.rate, args.size, args.batch, args.batch_io)
+
+        for burst, (packets, off_duration) in enumerate(schedule.cycles()):
+            # ON period: send the burst at the target rate
+            start = time.time()
+            first_start = first_start or start
+            nbytes, duration = sender.send_burst(packets, burst)
+            offered = nbytes * 8 / (max(duration, 1e-9) * 1e6)
+            total_bytes += nbytes
+            on_time += duration
+            print(f"UDP burst {burst}: {packets} packets in {duration:.3f}s, offered {offered:.1f} Mbps "
+                  f"(target {args.rate:g}), OFF {off_duration:.2f}s", flush=True)
+            if log:
+                log.write(f"{burst},{start:.6f},{duration:.6f},{packets},{nbytes},{offered:.3f},{off_duration:.6f}\n")
+                log.flush()
+
+            # OFF period: stay silent
             time.sleep(off_duration)
-            
+
     except KeyboardInterrupt:
         print("UDP Server shutting down...")
     except Exception as e:
         print(f"UDP Server error: {e}")
     finally:
+        if first_start is not None:
+            elapsed = max(time.time() - first_start, 1e-9)
+            print(f"Offered load: {total_bytes} bytes, ON-period rate "
+                  f"{total_bytes * 8 / (max(on_time, 1e-9) * 1e6):.1f} Mbps, long-run "
+                  f"{total_bytes * 8 / (elapsed * 1e6):.2f} Mbps over {elapsed:.1f}s")
+        if log:
+            log.close()
         server_socket.close()
 
 if __name__ == "__main__":
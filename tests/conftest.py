@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The sources are scripts run from their own directories, not a package
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, 'part2'))
+sys.path.insert(0, os.path.join(ROOT, 'part1'))
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from analysis import group_stats, t90, load_csv, switch_utilization, analyze_switch_stats
+from results import T90, Z90, ci_half_width
+
+
+def test_t90_matches_table():
+    df = np.arange(1, 40)
+    expected = [T90[d] if d < len(T90) else Z90 for d in df]
+    assert t90(df) == pytest.approx(expected)
+
+
+def test_group_stats_matches_ci_half_width():
+    rng = np.random.default_rng(0)
+    keys = np.repeat([10.0, 20.0, 30.0], [2, 5, 40])
+    values = rng.normal(5.0, 1.0, len(keys))
+    groups, mean, half, n = group_stats(keys, values)
+    assert list(groups) == [10.0, 20.0, 30.0]
+    assert list(n) == [2, 5, 40]
+    for g, key in enumerate(groups):
+        samples = list(values[keys == key])
+        assert mean[g] == pytest.approx(np.mean(samples))
+        assert half[g] == pytest.approx(ci_half_width(samples))
+
+
+def test_group_stats_leaves_out_nan():
+    keys = np.array([1.0, 1.0, 1.0, 2.0])
+    values = np.array([1.0, np.nan, 3.0, 4.0])
+    groups, mean, half, n = group_stats(keys, values)
+    assert list(n) == [2, 1]
+    assert mean == pytest.approx([2.0, 4.0])
+    assert half[0] == pytest.approx(ci_half_width([1.0, 3.0]))
+    assert np.isnan(half[1])
+
+
+def write_switch_stats(path, rows):
+    with open(path, 'w') as f:
+        f.write("time,dpid,kind,key,bytes,packets,dropped,backlog_bytes,backlog_packets\n")
+        for row in rows:
+            f.write(','.join(map(str, row)) + '\n')
+
+
+@pytest.mark.parametrize('with_flows', [False, True])
+def test_switch_utilization_of_one_port(tmp_path, with_flows):
+    path = str(tmp_path / 'switch_stats.csv')
+    rows = [(0.0, 2, 'port', 1, 0, 0, 0, 0, 0),
+            (1.0, 2, 'port', 1, 6250000, 0, 0, 0, 0),    # 50 Mbps
+            (2.0, 2, 'port', 1, 18750000, 0, 0, 0, 0),   # 100 Mbps
+            (1.0, 2, 'port', 2, 99999999, 0, 0, 0, 0),
+            (1.0, 1, 'port', 1, 99999999, 0, 0, 0, 0)]
+    if with_flows:
+        rows.append((1.0, 1, 'flow', '00:00:00:00:00:01', 1000, 1, 0, 0, 0))
+    write_switch_stats(path, rows)
+    t, util = switch_utilization(load_csv(path), 2, 1, 100)
+    assert list(t) == [1.0, 2.0]
+    assert util == pytest.approx([0.5, 1.0])
+
+
+def test_switch_stats_report(tmp_path):
+    path = str(tmp_path / 'switch_stats.csv')
+    write_switch_stats(path, [(10.0, 2, 'port', 1, 0, 0, 0, 0, 0),
+                              (11.0, 2, 'port', 1, 12500000, 0, 0, 0, 0)])
+    lines = analyze_switch_stats(path, str(tmp_path), 100)
+    assert lines[1:] == ['dpid,port,samples,mean_util,peak_util', '2,1,1,1,1']
+    assert (tmp_path / 'switch_utilization.png').exists()
@@ -0,0 +1,50 @@
+from array import array
+
+import pytest
+
+from impairment import DROPPED, ImpairmentTrace, make_trace
+
+
+def test_trace_round_trip(tmp_path):
+    path = str(tmp_path / 'link.imp')
+    made = make_trace(path, loss=5.0, delay=0.02, jitter=0.005, seed=3, packets=5000)
+    loaded = ImpairmentTrace.load(path)
+    assert set(loaded.directions) == {'data', 'ack'}
+    for name, impairment in loaded.directions.items():
+        recorded = made.directions[name]
+        assert impairment.replay
+        assert impairment.fates == recorded.fates
+        assert len(impairment.fates) == 5000
+        assert (impairment.loss, impairment.delay, impairment.jitter, impairment.seed) == (5.0, 0.02, 0.005, 3)
+    assert loaded.directions['data'].fates != loaded.directions['ack'].fates
+
+
+def test_replay_follows_recording_and_wraps(tmp_path):
+    path = str(tmp_path / 'link.imp')
+    trace = ImpairmentTrace()
+    recorder = trace.impairment('data', loss=20.0, delay=0.01, jitter=0.002, seed=1)
+    drawn = [recorder.fate() for _ in range(100)]
+    trace.save(path, min_packets=100)
+
+    replayer = ImpairmentTrace.load(path).replayer('data')
+    assert [replayer.fate() for _ in range(100)] == drawn
+    assert replayer.fate() == drawn[0] and replayer.wrapped == 1
+    assert replayer.lost == drawn.count(None) + (drawn[0] is None)
+
+
+def test_save_pads_recordings(tmp_path):
+    path = str(tmp_path / 'link.imp')
+    trace = ImpairmentTrace()
+    trace.impairment('ack', loss=100.0).fate()
+    trace.save(path, min_packets=10)
+    fates = ImpairmentTrace.load(path).replayer('ack').fates
+    assert fates == array('I', [DROPPED] * 10)
+
+
+def test_bad_traces_are_rejected(tmp_path):
+    path = tmp_path / 'bogus.imp'
+    path.write_bytes(b'NOPE' + bytes(16))
+    with pytest.raises(ValueError):
+        ImpairmentTrace.load(str(path))
+    with pytest.raises(ValueError):
+        ImpairmentTrace().replayer('data')
@@ -0,0 +1,30 @@
+from p1_client import ReliableUDPClient, RCVBUF_SEGMENT_COST
+
+
+class BacklogIO:
+    """A socket buffer of 100 segments with a given backlog left unread"""
+    rcvbuf = 100 * RCVBUF_SEGMENT_COST
+    recv_tos = False
+
+    def __init__(self, backlog):
+        self.backlog = backlog
+        self.sent = []
+
+    def unread(self):
+        return self.backlog * RCVBUF_SEGMENT_COST
+
+    def send(self, packet, addr):
+        self.sent.append(packet)
+
+
+def test_advertised_window_leaves_room_for_the_unread_backlog():
+    io = BacklogIO(30)
+    client = ReliableUDPClient('127.0.0.1', 6555, io=io)
+    assert client.advertised_window() == 100
+    client.send_ack(0.0)
+    assert client.advertised_window() == 70
+    # Never closed outright: a full buffer still lets a probe through
+    io.backlog = 120
+    client.acks_sent = 0
+    client.send_ack(0.1)
+    assert client.advertised_window() == 1
@@ -0,0 +1,105 @@
+import struct
+
+from p1_server import ReliableUDPServer, DATA_HEADER, FLAG_CLOSE, MIN_REO_RTT, REO_WND_PERSIST, MAX_SWS, MSS
+
+CLIENT = ('10.0.0.2', 40000)
+
+
+class RecordingIO:
+    """Keeps whatever the server sends"""
+    def __init__(self):
+        self.sent = []
+
+    def send(self, packet, addr):
+        self.sent.append(packet)
+
+    def send_run(self, packets, addr):
+        self.sent.extend(packets)
+
+    def stats(self):
+        return ''
+
+
+def rack_resent(server, count, now):
+    """Send count segments at time 0 and have RACK resend them all at now"""
+    for seq in range(count):
+        server.mark_sent(seq, server.create_packet(seq, b'x'), 0.0)
+    server.next_seq = count
+    server.retransmit(list(range(count)), CLIENT, now, 'rack')
+
+
+def test_dsacks_widen_reordering_window_without_srtt():
+    server = ReliableUDPServer('127.0.0.1', 0, io=RecordingIO())
+    # Jitter let the only samples through at almost no delay; no SRTT yet
+    server.min_rtt = server.rack_rtt = 0.0005
+    rack_resent(server, 4, 0.01)
+    narrow = server.reo_wnd()
+
+    server.on_dsack(0, 1, 0.05)
+    assert server.reo_wnd_mult == 2
+    wider = server.reo_wnd()
+    assert wider >= narrow + MIN_REO_RTT / 4
+
+    # At most one step per round trip, however many D-SACKs it brings
+    server.on_dsack(1, 1, 0.06)
+    assert server.reo_wnd() == wider
+    server.on_dsack(2, 1, 0.05 + 2 * MIN_REO_RTT)
+    assert server.reo_wnd() > wider
+    assert server.reo_wnd() <= server.rto
+
+
+def test_widened_window_narrows_after_clean_recoveries():
+    server = ReliableUDPServer('127.0.0.1', 0, io=RecordingIO())
+    server.min_rtt = server.rack_rtt = 0.0005
+    rack_resent(server, 4, 0.01)
+    server.on_dsack(0, 1, 0.05)
+    for _ in range(REO_WND_PERSIST - 1):
+        server.end_recovery()
+    assert server.reo_wnd_mult == 2
+    server.end_recovery()
+    assert server.reo_wnd_mult == 1
+
+
+def test_tail_probe_without_srtt():
+    server = ReliableUDPServer('127.0.0.1', 0, io=RecordingIO())
+    for seq in range(4):
+        server.mark_sent(seq, server.create_packet(seq, b'x'), 0.0)
+    server.next_seq = 4
+    server.rack_rtt = 0.02
+    server.probe_tail(CLIENT, 0.03)
+    assert server.send_counts['tlp'] == 0
+    server.probe_tail(CLIENT, 0.05)
+    assert server.send_counts['tlp'] == 1
+    assert server.scoreboard.resend_path(3) == 'tlp'
+
+
+def ack(cum_ack):
+    return struct.pack('!I', cum_ack) + bytes(16)
+
+
+def test_close_answers_only_a_repeated_fin_ack():
+    io = RecordingIO()
+    server = ReliableUDPServer('127.0.0.1', 0, io=io)
+    server.send_close(CLIENT, 10)
+    assert DATA_HEADER.unpack_from(io.sent[-1])[:2] == (10, FLAG_CLOSE)
+    assert not server.on_close_ack(ack(9), CLIENT)
+    assert len(io.sent) == 1
+    # The FIN-ACK again: the CLOSE was lost
+    assert server.on_close_ack(ack(10), CLIENT)
+    assert io.sent[-1] == io.sent[0]
+
+
+def test_autotuned_window_shrinks_toward_twice_the_delivered_round():
+    server = ReliableUDPServer('127.0.0.1', 0, io=RecordingIO())
+    server.min_rtt = 0.02
+    server.sws = MAX_SWS
+    server.autotune_window(0.0)
+    server.next_seq = 1000
+    server.delivered = 1000
+    server.autotune_window(0.05)  # Round not over: seq 0 is not cum-ACKed yet
+    assert server.sws == MAX_SWS
+    server.base_seq = 1
+    server.autotune_window(0.05)
+    target = 2 * 1000 * MSS
+    assert server.sws == MAX_SWS - (MAX_SWS - target) // 2
+    assert server.sws > target
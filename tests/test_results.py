@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from results import ResultStore, ci_half_width, converged
+
+
+def test_torn_line_is_skipped_and_not_glued(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    store = ResultStore(path, 'exp', revision='r1')
+    store.add({'loss': 1}, 0, {'ttc': 1.0})
+    with open(path, 'a') as f:
+        f.write('{"experiment": "exp", "revis')   # Crashed mid-write
+
+    store = ResultStore(path, 'exp', revision='r1')
+    assert store.torn
+    assert store.done({'loss': 1}, 0)
+    store.add({'loss': 1}, 1, {'ttc': 2.0})
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert json.loads(lines[-1])['iteration'] == 1
+    store = ResultStore(path, 'exp', revision='r1')
+    assert store.samples({'loss': 1}, 'ttc') == [1.0, 2.0]
+
+
+def test_other_revisions_and_experiments_are_ignored(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    ResultStore(path, 'exp', revision='old').add({'loss': 1}, 0, {'ttc': 1.0})
+    ResultStore(path, 'other', revision='r1').add({'loss': 1}, 0, {'ttc': 1.0})
+    assert not ResultStore(path, 'exp', revision='r1').rows
+
+
+def test_iterations_stop_once_converged(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.jsonl'), 'exp', revision='r1')
+    ran = []
+    for i in store.iterations({'bw': 100}, ['ttc'], min_iterations=3, max_iterations=10, target=0.05):
+        ran.append(i)
+        store.add({'bw': 100, 'streams': 1}, i, {'ttc': 10.0 + 0.01 * i})
+    assert ran == [0, 1, 2]
+
+    # Resumed: the same iterations, every one of them already stored
+    resumed = ResultStore(store.path, 'exp', revision='r1')
+    assert all(resumed.done({'bw': 100, 'streams': 1}, i)
+               for i in resumed.iterations({'bw': 100}, ['ttc'], min_iterations=3))
+
+
+def test_iterations_give_up_at_max(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.jsonl'), 'exp', revision='r1')
+    ran = []
+    for i in store.iterations({'bw': 10}, ['ttc'], min_iterations=2, max_iterations=6, target=0.01):
+        ran.append(i)
+        store.add({'bw': 10}, i, {'ttc': (1.0, 5.0)[i % 2]})
+    assert ran == list(range(6))
+
+
+def test_ci_half_width():
+    # mean 2, sd 1, n 3: t(2) = 2.920
+    assert ci_half_width([1.0, 2.0, 3.0]) == pytest.approx(2.920 / 3 ** 0.5)
+    assert not converged([1.0])
+    assert converged([5.0, 5.0])
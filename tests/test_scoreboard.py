@@ -0,0 +1,76 @@
+import random
+
+from scoreboard import Scoreboard, NIL
+
+
+def check_list(board):
+    """The transmission-order list is consistent and outstanding counts it"""
+    order = list(board.walk())
+    assert len(order) == board.outstanding
+    assert board.head == (order[0] if order else NIL)
+    assert board.tail == (order[-1] if order else NIL)
+    for a, b in zip(order, order[1:]):
+        assert board.next[a] == b and board.prev[b] == a
+    return [board.seqs[i] for i in order]
+
+
+def test_grow_keeps_window_and_order():
+    board = Scoreboard(capacity=8)
+    for seq in range(6):
+        board.sent(seq, b'%d' % seq, float(seq))
+    board.sent(2, b'2', 10.0)   # Resent: moves to the tail
+    board.sack(3)
+    board.deliver(3)
+    board.advance(1)
+
+    board.sent(20, b'20', 11.0)   # Outgrows the ring
+    assert board.capacity == 32
+    assert check_list(board) == [1, 4, 5, 2, 20]
+    assert [board.packet(seq) for seq in (1, 2, 4, 5, 20)] == [b'1', b'2', b'4', b'5', b'20']
+    assert board.sent_at(2) == 10.0
+    assert board.holds(3) and not board.in_flight(3)
+    assert not board.holds(0)
+
+
+def test_outstanding_after_repeated_growth():
+    board = Scoreboard(capacity=4)
+    for seq in range(100):
+        board.sent(seq, None, float(seq))
+        if seq % 3 == 0:
+            board.deliver(seq)
+    check_list(board)
+    assert board.outstanding == 100 - 34
+    board.advance(50)
+    assert check_list(board) == [seq for seq in range(50, 100) if seq % 3]
+    assert board.last_sent() == 98
+    board.advance(100)
+    assert board.outstanding == 0 and board.last_sent() is None
+
+
+def test_deliver_is_idempotent():
+    board = Scoreboard()
+    board.sent(0, b'a', 1.0)
+    assert board.deliver(0) == 1.0
+    assert board.deliver(0) is None
+    assert board.outstanding == 0
+
+
+def test_last_sent_is_the_highest_outstanding_seq():
+    rng = random.Random(7)
+    board = Scoreboard(capacity=4)
+    next_seq = 0
+    for step in range(2000):
+        op = rng.random()
+        listed = [board.seqs[i] for i in board.walk()]
+        if op < 0.4 or not listed:
+            board.sent(next_seq, None, float(step))
+            next_seq += 1
+        elif op < 0.6:
+            # A resend moves a low seq to the tail: the tail is not the highest
+            board.sent(rng.choice(listed), None, float(step))
+        elif op < 0.9:
+            board.deliver(rng.choice(listed))
+        else:
+            board.advance(rng.randint(board.base, min(listed) + 1))
+        listed = [board.seqs[i] for i in board.walk()]
+        assert board.last_sent() == (max(listed) if listed else None)
@@ -0,0 +1,72 @@
+import random
+
+from p1_server import MSS
+from simulator import FILE_SIZE, make_file, simulate_dumbbell, simulate_fluid, simulate_p1
+
+SIZE = 200000
+
+
+def deterministic(row):
+    """A trial's row without the CPU time it took"""
+    return {key: value for key, value in row.items() if key != 'cpu_s'}
+
+
+def test_p1_same_seed_same_run():
+    file_data = make_file(SIZE, 0)
+    runs = [simulate_p1(loss=5.0, delay=10.0, jitter=2.0, seed=7, file_data=file_data) for _ in range(2)]
+    assert runs[0]['md5_ok']
+    assert deterministic(runs[0]) == deterministic(runs[1])
+    other = simulate_p1(loss=5.0, delay=10.0, jitter=2.0, seed=8, file_data=file_data)
+    assert deterministic(other) != deterministic(runs[0])
+
+
+def test_dumbbell_same_seed_same_run():
+    runs = [simulate_dumbbell(bw=50.0, loss=0.5, size=SIZE, seed=2) for _ in range(2)]
+    assert runs[0]['md5_ok']
+    assert deterministic(runs[0]) == deterministic(runs[1])
+
+
+def test_dumbbell_leaves_global_random_alone():
+    # BBR draws from the simulation's generator, not the random module's
+    random.seed(1)
+    expected = random.random()
+    random.seed(1)
+    simulate_dumbbell(bw=50.0, size=SIZE, seed=3)
+    assert random.random() == expected
+
+
+def test_fluid_minute_at_1gbps_takes_seconds():
+    row = simulate_fluid(bw=1000.0, buffer_size=8400, duration=60.0, seed=0)
+    assert row['cpu_s'] < 10.0
+    assert row['link_util'] > 0.85
+    assert row['jfi'] > 0.95
+
+
+def test_fluid_same_seed_same_run():
+    runs = [simulate_fluid(bw=100.0, loss=1.0, duration=5.0, seed=seed) for seed in (4, 4, 5)]
+    assert deterministic(runs[0]) == deterministic(runs[1])
+    assert deterministic(runs[0]) != deterministic(runs[2])
+
+
+def test_trace_replay_reproduces_run(tmp_path):
+    trace = str(tmp_path / 'p1.imp')
+    file_data = make_file(SIZE, 0)
+    recorded = simulate_p1(loss=5.0, delay=10.0, seed=1, file_data=file_data, trace=trace)
+    # Another seed, but the link replays the first run's losses and delays
+    replayed = simulate_p1(loss=5.0, delay=10.0, seed=4, file_data=file_data, trace=trace)
+    assert replayed['md5_ok']
+    assert (replayed['ttc'], replayed['retx']) == (recorded['ttc'], recorded['retx'])
+
+
+def test_p1_reordering_alone_costs_few_retransmissions():
+    # Jitter past the delay reorders heavily; with no loss, RACK must learn the
+    # reordering rather than resend most of the file. The window is fixed below
+    # netem's limit, so autotuning overflowing the queue does not count here
+    file_data = make_file(FILE_SIZE, 0)
+    segments = -(-FILE_SIZE // MSS)
+    for jitter in (20.0, 100.0):
+        for seed in (0, 1):
+            row = simulate_p1(loss=0.0, delay=20.0, jitter=jitter, seed=seed, file_data=file_data, sws=400 * MSS)
+            assert row['md5_ok']
+            assert row['retx'] < 0.15 * segments
+            assert row['srtt_ms'] > 20.0  # RTT samples under reordering, not ~0
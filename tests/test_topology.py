@@ -0,0 +1,38 @@
+import json
+
+from topology import write_switch_topology
+
+
+class Topo:
+    """The part of mininet.topo.Topo the helpers read: h1 - s1 - s2 - h2"""
+    def links(self):
+        return [('h1', 's1'), ('s1', 's2'), ('s2', 'h2')]
+
+    def port(self, node, neighbor):
+        ports = {('s1', 'h1'): 1, ('s1', 's2'): 2, ('s2', 's1'): 1, ('s2', 'h2'): 2}
+        return ports[(node, neighbor)], None
+
+
+class Node:
+    def __init__(self, name, dpid=None, mac=None):
+        self.name = name
+        self.dpid = dpid
+        self.mac = mac
+
+    def MAC(self):
+        return self.mac
+
+
+class Net:
+    topo = Topo()
+    switches = [Node('s1', dpid='0000000000000001'), Node('s2', dpid='0000000000000002')]
+    hosts = [Node('h1', mac='00:00:00:00:00:01'), Node('h2', mac='00:00:00:00:00:02')]
+
+
+def test_every_switch_learns_the_port_towards_every_host(tmp_path):
+    path = str(tmp_path / 'topology.json')
+    write_switch_topology(Net(), path)
+    with open(path) as f:
+        table = json.load(f)
+    assert table == {'1': {'00:00:00:00:00:01': 1, '00:00:00:00:00:02': 2},
+                     '2': {'00:00:00:00:00:01': 1, '00:00:00:00:00:02': 2}}